@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Organization, OAuthToken, UserActivity
+from .models import CustomUser, Organization, OAuthToken, UserActivity, UserDashboardCounters
 
 
 @admin.register(CustomUser)
@@ -83,3 +83,13 @@ class UserActivityAdmin(admin.ModelAdmin):
     
     def has_add_permission(self, request):
         return False  # Activities should only be created by the system
+
+
+@admin.register(UserDashboardCounters)
+class UserDashboardCountersAdmin(admin.ModelAdmin):
+    list_display = ('user', 'total_documents', 'qr_shares', 'active_qr_shares', 'unread_notifications', 'reconciled_at')
+    search_fields = ('user__email', 'user__full_name')
+    readonly_fields = [field.name for field in UserDashboardCounters._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False  # Rows are created and maintained by auth_api.counters
@@ -5,3 +5,8 @@ class AuthApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'auth_api'
     verbose_name = 'Authentication API'
+
+    def ready(self):
+        from .counters import connect_signals
+
+        connect_signals()
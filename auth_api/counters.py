@@ -0,0 +1,289 @@
+"""
+Per-user dashboard counters, maintained incrementally from model signals
+"""
+from collections import defaultdict
+from functools import cached_property
+from django.apps import apps
+from django.db.models import Count, F, Max, Min, Q, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+from .models import UserActivity, UserDashboardCounters
+
+
+class Counter:
+    """
+    One column of UserDashboardCounters: the rows of a model that belong to
+    a user (through the `user` lookup path) and match `filters`. Expiring
+    counters also leave out rows whose expires_at has passed.
+    """
+
+    def __init__(self, name, model, user, filters=None, expiring=False):
+        self.name = name
+        self.model_label = model
+        self.user = user
+        self.filters = filters or {}
+        self.expiring = expiring
+
+    @cached_property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def fields(self):
+        return [*self.filters, *(["expires_at"] if self.expiring else [])]
+
+    @property
+    def conditional(self):
+        return bool(self.fields)
+
+    def condition(self, now):
+        condition = Q(**self.filters)
+        if self.expiring:
+            condition &= ~Q(expires_at__lt=now)
+        return condition
+
+    def matches(self, instance, now):
+        if any(getattr(instance, field) != value for field, value in self.filters.items()):
+            return False
+        return not (self.expiring and instance.expires_at and instance.expires_at < now)
+
+    def user_id(self, instance):
+        """
+        The id of the user a row belongs to. A path through a relation is
+        read with one values_list() query on the related row, unless it is
+        already loaded, and remembered on the instance for later saves.
+        """
+        first, _, rest = self.user.partition("__")
+        field = instance._meta.get_field(first)
+        if not rest:
+            return getattr(instance, field.attname)
+        users = instance.__dict__.setdefault("_dashboard_users", {})
+        if self.user not in users:
+            if field.is_cached(instance):
+                related = getattr(instance, first)
+                *path, last = rest.split("__")
+                for name in path:
+                    related = getattr(related, name)
+                users[self.user] = getattr(related, related._meta.get_field(last).attname)
+            else:
+                users[self.user] = (
+                    field.related_model._default_manager.filter(pk=getattr(instance, field.attname))
+                    .values_list(rest, flat=True).first()
+                )
+        return users[self.user]
+
+
+COUNTERS = [
+    Counter("total_documents", "documents.Document", "owner"),
+    Counter("shared_documents", "documents.DocumentShare", "shared_by"),
+    Counter("received_documents", "documents.DocumentShare", "shared_with"),
+    Counter("requests_sent", "documents.DocumentRequest", "requester"),
+    Counter("requests_received", "documents.DocumentRequest", "requestee"),
+    Counter("pending_requests", "documents.DocumentRequest", "requestee", {"status": "pending"}),
+    Counter("qr_shares", "sharing.QRCodeShare", "created_by"),
+    Counter("active_qr_shares", "sharing.QRCodeShare", "created_by", {"status": "active"}, expiring=True),
+    Counter("sessions", "sharing.ShareSession", "qr_share__created_by"),
+    Counter("active_sessions", "sharing.ShareSession", "qr_share__created_by", {"status": "active"}, expiring=True),
+    Counter("notifications", "sharing.ShareNotification", "user"),
+    Counter("unread_notifications", "sharing.ShareNotification", "user", {"is_read": False}),
+]
+ACTIVE_COUNTERS = [counter.name for counter in COUNTERS if counter.expiring]
+
+
+def counters_for(model):
+    return [counter for counter in COUNTERS if counter.model is model]
+
+
+def apply(user_id, deltas, expires_at=None):
+    """
+    Add deltas to a user's counters with a single UPDATE. Users whose row
+    does not exist yet are skipped; the row is counted in full when first read.
+
+    Counters follow save() and delete() through signals; QuerySet.delete()
+    sends post_delete for every row it removes, so it is counted too. Code
+    that writes counted rows with bulk_create() or QuerySet.update() must
+    apply the deltas itself, as share_documents(), create_qr_shares() and
+    ShareSessionManager.open() do, or the counters drift until the next
+    reconciliation.
+    """
+    apply_many([user_id], deltas, expires_at)
+
+
+def apply_many(user_ids, deltas, expires_at=None):
+    """
+    Add the same deltas to the counters of several users with a single
+    UPDATE. Like apply(), this is for bulk_create() and QuerySet.update(),
+    which send no signals.
+    """
+    values = {
+        name: F(name) + delta if delta > 0 else Greatest(F(name) + delta, Value(0))
+        for name, delta in deltas.items()
+        if delta
+    }
+    if not values:
+        return
+    if expires_at is not None:
+        values["active_until"] = Least(Coalesce(F("active_until"), Value(expires_at)), Value(expires_at))
+    UserDashboardCounters.objects.filter(pk__in=user_ids).update(**values)
+
+
+def remember_counted(sender, instance, **kwargs):
+    """post_init: note which conditional counters the row is counted in"""
+    conditional = [counter for counter in counters_for(sender) if counter.conditional]
+    if not conditional:
+        return
+    deferred = instance.get_deferred_fields()
+    now = timezone.now()
+    instance._dashboard_counted = {
+        counter.name: counter.matches(instance, now)
+        for counter in conditional
+        if not deferred.intersection(counter.fields)
+    }
+
+
+def count_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    now = timezone.now()
+    counted = getattr(instance, "_dashboard_counted", {})
+    deltas = defaultdict(lambda: defaultdict(int))
+    expires_at = {}
+    for counter in counters_for(sender):
+        matches = counter.matches(instance, now)
+        if created:
+            delta = int(matches)
+        elif counter.name in counted:
+            delta = int(matches) - int(counted[counter.name])
+        else:
+            delta = 0
+        if delta:
+            user_id = counter.user_id(instance)
+            deltas[user_id][counter.name] += delta
+            if counter.expiring and delta > 0:
+                expires_at[user_id] = instance.expires_at
+        if counter.conditional:
+            counted[counter.name] = matches
+    instance._dashboard_counted = counted
+    for user_id, user_deltas in deltas.items():
+        apply(user_id, user_deltas, expires_at.get(user_id))
+
+
+def count_deleted(sender, instance, **kwargs):
+    now = timezone.now()
+    counted = getattr(instance, "_dashboard_counted", {})
+    deltas = defaultdict(lambda: defaultdict(int))
+    for counter in counters_for(sender):
+        if counted.get(counter.name, counter.matches(instance, now)):
+            deltas[counter.user_id(instance)][counter.name] -= 1
+    for user_id, user_deltas in deltas.items():
+        apply(user_id, user_deltas)
+
+
+def connect_signals():
+    for model in {counter.model for counter in COUNTERS}:
+        label = model._meta.label_lower
+        post_init.connect(remember_counted, sender=model, dispatch_uid=f"dashboard_counters_init_{label}")
+        post_save.connect(count_saved, sender=model, dispatch_uid=f"dashboard_counters_save_{label}")
+        post_delete.connect(count_deleted, sender=model, dispatch_uid=f"dashboard_counters_delete_{label}")
+
+
+def count(user_ids, names=None, now=None):
+    """
+    Count the counters from the source tables, with one grouped query per
+    (model, user path) and one for the latest activity.
+
+    Returns:
+        dict: {user_id: {field: value}} for every given user
+    """
+    now = now or timezone.now()
+    selected = [counter for counter in COUNTERS if names is None or counter.name in names]
+    results = {user_id: {counter.name: 0 for counter in selected} for user_id in user_ids}
+    if any(counter.expiring for counter in selected):
+        for values in results.values():
+            values["active_until"] = None
+
+    groups = defaultdict(list)
+    for counter in selected:
+        groups[(counter.model_label, counter.user)].append(counter)
+    for (_, user), group in groups.items():
+        # Prefixed so the aliases cannot clash with the model's own fields
+        aggregates = {f"n_{counter.name}": Count("pk", filter=counter.condition(now)) for counter in group}
+        for counter in group:
+            if counter.expiring:
+                aggregates[f"until_{counter.name}"] = Min("expires_at", filter=counter.condition(now))
+        rows = (
+            group[0].model.objects.filter(**{f"{user}__in": user_ids})
+            .values(user).annotate(**aggregates).order_by()
+        )
+        for row in rows:
+            values = results[row[user]]
+            for counter in group:
+                values[counter.name] = row[f"n_{counter.name}"]
+                until = row.get(f"until_{counter.name}")
+                if until and (values["active_until"] is None or until < values["active_until"]):
+                    values["active_until"] = until
+
+    if names is None:
+        for values in results.values():
+            values["last_activity_at"] = None
+        latest = (
+            UserActivity.objects.filter(user__in=user_ids)
+            .values("user").annotate(latest=Max("created_at")).order_by()
+        )
+        for row in latest:
+            results[row["user"]]["last_activity_at"] = row["latest"]
+    return results
+
+
+def reconcile(user_ids, names=None):
+    """
+    Recount users' counters from the source tables and store them.
+
+    With names only those counters are recounted, on rows that already
+    exist; otherwise every counter is recounted and missing rows are created.
+
+    Returns:
+        int: number of users whose stored counters were wrong or missing
+    """
+    now = timezone.now()
+    counted = count(user_ids, names, now)
+    stored = {
+        row["user_id"]: row
+        for row in UserDashboardCounters.objects.filter(user__in=user_ids).values()
+    }
+    drifted = [
+        user_id
+        for user_id, values in counted.items()
+        if user_id not in stored
+        or any(stored[user_id][field] != value for field, value in values.items())
+    ]
+    if names is None:
+        fields = [*counted[user_ids[0]], "reconciled_at"] if user_ids else []
+        UserDashboardCounters.objects.bulk_create(
+            [UserDashboardCounters(user_id=user_id, reconciled_at=now, **counted[user_id]) for user_id in drifted],
+            update_conflicts=True,
+            unique_fields=["user"],
+            update_fields=fields,
+        )
+        UserDashboardCounters.objects.filter(user__in=set(user_ids) - set(drifted)).update(reconciled_at=now)
+    else:
+        for user_id in drifted:
+            UserDashboardCounters.objects.filter(pk=user_id).update(**counted[user_id])
+    return len(drifted)
+
+
+def get_dashboard_counters(user):
+    """
+    A user's dashboard counters in one primary-key read. The row is counted
+    in full the first time, and the active counters are recounted once the
+    earliest counted expiry has passed.
+    """
+    counters = UserDashboardCounters.objects.filter(pk=user.pk).first()
+    if counters is None:
+        reconcile([user.pk])
+        counters = UserDashboardCounters.objects.get(pk=user.pk)
+    elif counters.active_until and counters.active_until <= timezone.now():
+        reconcile([user.pk], ACTIVE_COUNTERS)
+        counters.refresh_from_db()
+    return counters
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_api', '0004_audit_event_time'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', '-created_at'], name='auth_api_us_user_id_042c5f_idx'),
+        ),
+    ]
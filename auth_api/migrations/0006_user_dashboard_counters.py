@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_api', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDashboardCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_counters', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_documents', models.PositiveIntegerField(default=0)),
+                ('shared_documents', models.PositiveIntegerField(default=0)),
+                ('received_documents', models.PositiveIntegerField(default=0)),
+                ('requests_sent', models.PositiveIntegerField(default=0)),
+                ('requests_received', models.PositiveIntegerField(default=0)),
+                ('pending_requests', models.PositiveIntegerField(default=0)),
+                ('qr_shares', models.PositiveIntegerField(default=0)),
+                ('active_qr_shares', models.PositiveIntegerField(default=0)),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('active_sessions', models.PositiveIntegerField(default=0)),
+                ('notifications', models.PositiveIntegerField(default=0)),
+                ('unread_notifications', models.PositiveIntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('active_until', models.DateTimeField(blank=True, null=True)),
+                ('reconciled_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'User Dashboard Counters',
+                'verbose_name_plural': 'User Dashboard Counters',
+            },
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
 from django.core.validators import RegexValidator
+from common.audit import AuditLogManager
 from common.fields import ProfileImageField
 import uuid
 
@@ -171,6 +172,25 @@ class OAuthToken(models.Model):
         verbose_name_plural = "OAuth Tokens"
 
 
+class UserActivityManager(AuditLogManager):
+    def write_batch(self, instances):
+        """
+        Insert activity records and move each user's dashboard
+        last_activity_at forward to their newest one
+        """
+        super().write_batch(instances)
+        latest = {}
+        for instance in instances:
+            if instance.created_at > latest.get(instance.user_id, instance.created_at):
+                latest[instance.user_id] = instance.created_at
+            latest.setdefault(instance.user_id, instance.created_at)
+        for user_id, created_at in latest.items():
+            UserDashboardCounters.objects.filter(pk=user_id).filter(
+                models.Q(last_activity_at__isnull=True)
+                | models.Q(last_activity_at__lt=created_at)
+            ).update(last_activity_at=created_at)
+
+
 class UserActivity(models.Model):
     """Track user activities for audit trail"""
 
@@ -180,12 +200,59 @@ class UserActivity(models.Model):
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
     metadata = models.JSONField(default=dict, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the activity happens, not when the audit writer saves it
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = UserActivityManager()
 
     class Meta:
         verbose_name = "User Activity"
         verbose_name_plural = "User Activities"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "-created_at"]),
+        ]
+
+
+class UserDashboardCounters(models.Model):
+    """
+    Per-user totals behind the user and sharing stats endpoints.
+
+    Kept current by signal handlers on the counted models (see
+    auth_api.counters) and reconciled periodically with
+    `manage.py reconcile_dashboard_counters`.
+    """
+
+    user = models.OneToOneField(
+        CustomUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="dashboard_counters",
+    )
+    total_documents = models.PositiveIntegerField(default=0)
+    shared_documents = models.PositiveIntegerField(default=0)
+    received_documents = models.PositiveIntegerField(default=0)
+    requests_sent = models.PositiveIntegerField(default=0)
+    requests_received = models.PositiveIntegerField(default=0)
+    pending_requests = models.PositiveIntegerField(default=0)
+    qr_shares = models.PositiveIntegerField(default=0)
+    active_qr_shares = models.PositiveIntegerField(default=0)
+    sessions = models.PositiveIntegerField(default=0)
+    active_sessions = models.PositiveIntegerField(default=0)
+    notifications = models.PositiveIntegerField(default=0)
+    unread_notifications = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(blank=True, null=True)
+    # Earliest expiry among the QR shares and sessions counted as active;
+    # once it passes the active counters are recounted
+    active_until = models.DateTimeField(blank=True, null=True)
+    reconciled_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Dashboard counters for {self.user_id}"
+
+    class Meta:
+        verbose_name = "User Dashboard Counters"
+        verbose_name_plural = "User Dashboard Counters"
 
 
 class UserSecuritySettings(models.Model):
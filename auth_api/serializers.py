@@ -8,6 +8,7 @@ from .models import (
     UserActivity,
     UserSecuritySettings,
 )
+from common.serializers import PublicURLModelSerializer, PublicURLListSerializer
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -90,9 +91,10 @@ class UserLoginSerializer(serializers.Serializer):
         return attrs
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(PublicURLModelSerializer):
     class Meta:
         model = CustomUser
+        list_serializer_class = PublicURLListSerializer
         fields = [
             "id",
             "full_name",
@@ -1,3 +1,263 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
+from datetime import timedelta
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from common.explain import QueryPlanAssertionsMixin
+from documents.models import Document, DocumentRequest
+from documents.shares import share_documents
+from sharing.models import QRCodeShare, ShareNotification, ShareSession
+from sharing.qr_batch import create_qr_shares
+from .counters import count, get_dashboard_counters
+from .models import CustomUser, UserActivity, UserDashboardCounters
 
-# Create your tests here.
+
+class UserActivityIndexPlanTests(QueryPlanAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        UserActivity.objects.log(user=self.user, activity_type='login', description='Logged in')
+
+    def test_activities_use_user_created_index(self):
+        self.assertEndpointUsesIndex('/api/v1/auth/activities/', 'auth_api_useractivity')
+
+    def test_stats_recount_uses_indexes(self):
+        for table in ('auth_api_useractivity', 'documents_documentshare', 'documents_documentrequest'):
+            with self.subTest(table=table):
+                # Stats are counted from these tables only when the user has no counters yet
+                UserDashboardCounters.objects.filter(pk=self.user.pk).delete()
+                self.assertEndpointUsesIndex('/api/v1/auth/stats/', table)
+
+
+class UserActivityKeysetPaginationTests(QueryPlanAssertionsMixin, APITestCase):
+    url = '/api/v1/auth/activities/'
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        # Pairs of rows share a timestamp so the id tie-break is exercised
+        UserActivity.objects.bulk_create([
+            UserActivity(
+                user=self.user, activity_type='login', description=f'Login {index}',
+                created_at=now - timedelta(seconds=index // 2),
+            )
+            for index in range(45)
+        ])
+        self.expected = list(
+            UserActivity.objects.filter(user=self.user).order_by('-created_at', '-pk').values_list('description', flat=True)
+        )
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pages.append([row['description'] for row in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_cursor_walk_returns_every_row_once_in_order(self):
+        pages = self.walk(f'{self.url}?cursor=', 'next')
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+
+    def test_previous_links_walk_back_to_the_first_page(self):
+        first = self.client.get(f'{self.url}?cursor=')
+        self.assertIsNone(first.data['previous'])
+        last = self.client.get(self.client.get(first.data['next']).data['next'])
+        self.assertIsNone(last.data['next'])
+        pages = self.walk(last.data['previous'], 'previous')
+        self.assertEqual(pages, [self.expected[20:40], self.expected[:20]])
+
+    def test_page_numbers_still_work_without_cursor(self):
+        response = self.client.get(self.url, {'page': 2})
+        self.assertEqual(response.data['count'], 45)
+        # Page numbers order by created_at alone, so ties may come either way
+        self.assertCountEqual([row['description'] for row in response.data['results']], self.expected[20:40])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_deep_page_uses_user_created_index(self):
+        next_url = self.client.get(f'{self.url}?cursor=').data['next']
+        self.assertEndpointUsesIndex(next_url, 'auth_api_useractivity')
+
+
+class DashboardCountersTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.other = CustomUser.objects.create_user(
+            username='other', email='other@example.com', password='secret-pass', full_name='Other'
+        )
+        self.client.force_authenticate(self.user)
+        self.document = Document.objects.bulk_create([
+            Document(title='Passport', owner=self.user, original_filename='passport.pdf', file='blobs/aa/passport.pdf')
+        ])[0]
+        # The first read counts the row in full
+        get_dashboard_counters(self.user)
+
+    def notify(self, count):
+        for index in range(count):
+            ShareNotification.objects.create(
+                user=self.user, notification_type='document_shared', title=f'Shared {index}', message='Shared'
+            )
+
+    def share(self, expires_in):
+        return QRCodeShare.objects.create(
+            document=self.document, created_by=self.user, title='Share', expires_at=timezone.now() + expires_in
+        )
+
+    def stats(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_stats_are_one_primary_key_read(self):
+        self.notify(2)
+        DocumentRequest.objects.create(
+            requester=self.other, requestee=self.user, title='Proof of address', description='Needed'
+        )
+
+        user_stats, user_queries = self.stats('/api/v1/auth/stats/')
+        share_stats, share_queries = self.stats('/api/v1/sharing/stats/')
+
+        self.assertEqual((user_queries, share_queries), (1, 1))
+        self.assertEqual(user_stats['total_documents'], 1)
+        self.assertEqual(user_stats['pending_requests'], 1)
+        self.assertEqual(share_stats['total_requests_received'], 1)
+        self.assertEqual(share_stats['unread_notifications'], 2)
+
+    def test_counters_follow_updates_and_deletes(self):
+        self.notify(3)
+        notification = ShareNotification.objects.filter(user=self.user).first()
+        notification.mark_as_read()
+        request = DocumentRequest.objects.create(
+            requester=self.other, requestee=self.user, title='Proof of address', description='Needed'
+        )
+        request.status = 'approved'
+        request.save()
+        ShareNotification.objects.filter(pk=notification.pk).get().delete()
+
+        activity = UserActivity.objects.log(user=self.user, activity_type='login', description='Logged in')
+
+        counters = UserDashboardCounters.objects.get(pk=self.user.pk)
+        self.assertEqual(counters.last_activity_at, activity.created_at)
+        self.assertEqual((counters.notifications, counters.unread_notifications), (2, 2))
+        self.assertEqual((counters.requests_received, counters.pending_requests), (1, 0))
+
+        self.client.post('/api/v1/sharing/notifications/mark_all_read/')
+        counters.refresh_from_db()
+        self.assertEqual(counters.unread_notifications, 0)
+
+    def test_active_shares_are_recounted_once_expired(self):
+        self.share(timedelta(hours=1))
+        self.share(timedelta(days=3))
+        counters = UserDashboardCounters.objects.get(pk=self.user.pk)
+        self.assertEqual((counters.qr_shares, counters.active_qr_shares), (2, 2))
+
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=tomorrow):
+            share_stats, _ = self.stats('/api/v1/sharing/stats/')
+
+        self.assertEqual((share_stats['total_qr_shares'], share_stats['active_qr_shares']), (2, 1))
+        counters.refresh_from_db()
+        self.assertGreater(counters.active_until, tomorrow)
+
+    def test_reconciliation_fixes_drift(self):
+        # Neither bulk_create() nor update() sends signals
+        ShareNotification.objects.bulk_create([
+            ShareNotification(user=self.user, notification_type='document_shared', title='Shared', message='Shared')
+        ])
+        UserActivity.objects.filter(user=self.user).delete()
+        UserDashboardCounters.objects.filter(pk=self.other.pk).delete()
+
+        out = StringIO()
+        call_command('reconcile_dashboard_counters', stdout=out)
+
+        self.assertIn('2 users, 2 had drifted', out.getvalue())
+        self.assertEqual(UserDashboardCounters.objects.get(pk=self.user.pk).notifications, 1)
+        self.assertEqual(UserDashboardCounters.objects.get(pk=self.other.pk).total_documents, 0)
+
+
+class DashboardCountersBulkWriteTests(APITestCase):
+    """Bulk writes send no signals, so each bulk path adjusts the counters itself"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.other = CustomUser.objects.create_user(
+            username='other', email='other@example.com', password='secret-pass', full_name='Other'
+        )
+        self.documents = Document.objects.bulk_create([
+            Document(title=title, owner=self.user, original_filename=f'{title}.pdf', file=f'blobs/aa/{title}.pdf')
+            for title in ('passport', 'licence')
+        ])
+        for user in (self.user, self.other):
+            get_dashboard_counters(user)
+
+    def assertCountersMatchRecount(self, *users):
+        recount = count([user.pk for user in users])
+        for user in users:
+            stored = UserDashboardCounters.objects.filter(pk=user.pk).values(*recount[user.pk]).get()
+            self.assertEqual(stored, recount[user.pk])
+
+    def test_share_documents(self):
+        share_documents(self.user, [document.pk for document in self.documents], [self.other.pk])
+
+        counters = UserDashboardCounters.objects.get(pk=self.other.pk)
+        self.assertEqual((counters.received_documents, counters.unread_notifications), (2, 1))
+        self.assertCountersMatchRecount(self.user, self.other)
+
+    def test_create_qr_shares(self):
+        create_qr_shares(self.user, self.documents, title='Share', expires_at=timezone.now() + timedelta(days=1))
+
+        counters = UserDashboardCounters.objects.get(pk=self.user.pk)
+        self.assertEqual((counters.qr_shares, counters.active_qr_shares), (2, 2))
+        self.assertCountersMatchRecount(self.user)
+
+    def test_share_session_open(self):
+        share = QRCodeShare.objects.create(
+            document=self.documents[0], created_by=self.user, title='Share',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        ShareSession.objects.open(share.pk, self.user.pk)
+        ShareSession.objects.open(share.pk, self.user.pk, duration=timedelta(hours=2))
+
+        counters = UserDashboardCounters.objects.get(pk=self.user.pk)
+        self.assertEqual((counters.sessions, counters.active_sessions), (2, 2))
+        self.assertCountersMatchRecount(self.user)
+
+    def test_session_save_reads_owner_id_without_loading_share(self):
+        share = QRCodeShare.objects.create(
+            document=self.documents[0], created_by=self.user, title='Share',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        ShareSession.objects.create(qr_share=share, session_token='token', expires_at=timezone.now() + timedelta(hours=1))
+        session = ShareSession.objects.get(session_token='token')
+
+        share_reads = []
+        for status in ('expired', 'active'):
+            session.status = status
+            with CaptureQueriesContext(connection) as queries:
+                session.save()
+            share_reads.append([query['sql'] for query in queries if 'FROM "sharing_qrcodeshare"' in query['sql']])
+
+        # One values_list() of the owner id on the first save, remembered after it
+        self.assertEqual([len(reads) for reads in share_reads], [1, 0])
+        self.assertIn('SELECT "sharing_qrcodeshare"."created_by_id"', share_reads[0][0])
+        self.assertFalse(ShareSession._meta.get_field('qr_share').is_cached(session))
+        self.assertCountersMatchRecount(self.user)
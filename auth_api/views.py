@@ -38,7 +38,8 @@ from .serializers import (
     SecuritySettingsUpdateSerializer,
     PINVerificationSerializer,
 )
-from documents.models import Document, DocumentShare, DocumentRequest
+from common.pagination import KeysetPagination
+from .counters import get_dashboard_counters
 
 
 class UserRegistrationView(APIView):
@@ -61,7 +62,7 @@ class UserRegistrationView(APIView):
             refresh = RefreshToken.for_user(user)
 
             # Log activity
-            UserActivity.objects.create(
+            UserActivity.objects.log(
                 user=user,
                 activity_type="registration",
                 description=f"User registered with email {user.email}",
@@ -116,7 +117,7 @@ class UserLoginView(APIView):
             refresh = RefreshToken.for_user(user)
 
             # Log activity
-            UserActivity.objects.create(
+            UserActivity.objects.log(
                 user=user,
                 activity_type="login",
                 description=f"User logged in from {self.get_client_ip(request)}",
@@ -175,7 +176,7 @@ class UserProfileView(APIView):
             serializer.save()
 
             # Log activity
-            UserActivity.objects.create(
+            UserActivity.objects.log(
                 user=request.user,
                 activity_type="profile_updated",
                 description="User updated profile information",
@@ -235,7 +236,7 @@ class OrganizationView(APIView):
             organization = serializer.save()
 
             # Log activity
-            UserActivity.objects.create(
+            UserActivity.objects.log(
                 user=request.user,
                 activity_type="organization_created",
                 description=f"Created organization profile: {organization.name}",
@@ -269,7 +270,7 @@ class OrganizationView(APIView):
                 serializer.save()
 
                 # Log activity
-                UserActivity.objects.create(
+                UserActivity.objects.log(
                     user=request.user,
                     activity_type="organization_updated",
                     description=f"Updated organization profile: {organization.name}",
@@ -376,7 +377,7 @@ class LogoutView(APIView):
                 refresh.blacklist()
 
                 # Log activity
-                UserActivity.objects.create(
+                UserActivity.objects.log(
                     user=request.user,
                     activity_type="logout",
                     description="User logged out",
@@ -414,7 +415,7 @@ class PasswordChangeView(APIView):
                 user.save()
 
                 # Log activity
-                UserActivity.objects.create(
+                UserActivity.objects.log(
                     user=user,
                     activity_type="password_changed",
                     description="User changed password",
@@ -451,38 +452,15 @@ class UserStatsView(APIView):
     )
     def get(self, request):
         user = request.user
-
-        # Calculate statistics
-        total_documents = Document.objects.filter(owner=user).count()
-        shared_documents = DocumentShare.objects.filter(shared_by=user).count()
-        received_documents = DocumentShare.objects.filter(shared_with=user).count()
-        pending_requests = DocumentRequest.objects.filter(
-            requestee=user, status="pending"
-        ).count()
-
-        # Try to get QR shares count (sharing app might not be available)
-        try:
-            from sharing.models import QRCodeShare
-
-            qr_shares_created = QRCodeShare.objects.filter(created_by=user).count()
-        except ImportError:
-            qr_shares_created = 0
-
-        # Get last activity
-        last_activity = (
-            UserActivity.objects.filter(user=user).order_by("-created_at").first()
-        )
-        last_activity_time = (
-            last_activity.created_at if last_activity else user.last_login
-        )
+        counters = get_dashboard_counters(user)
 
         stats = {
-            "total_documents": total_documents,
-            "shared_documents": shared_documents,
-            "received_documents": received_documents,
-            "pending_requests": pending_requests,
-            "qr_shares_created": qr_shares_created,
-            "last_activity": last_activity_time,
+            "total_documents": counters.total_documents,
+            "shared_documents": counters.shared_documents,
+            "received_documents": counters.received_documents,
+            "pending_requests": counters.pending_requests,
+            "qr_shares_created": counters.qr_shares,
+            "last_activity": counters.last_activity_at or user.last_login,
         }
 
         serializer = UserStatsSerializer(stats)
@@ -554,6 +532,7 @@ class UserActivityListView(generics.ListAPIView):
 
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = UserActivitySerializer
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["activity_type", "created_at"]
 
@@ -631,7 +610,7 @@ class UserSecuritySettingsView(APIView):
             serializer.save()
 
             # Log activity
-            UserActivity.objects.create(
+            UserActivity.objects.log(
                 user=request.user,
                 activity_type="security_settings_updated",
                 description="User updated security settings",
@@ -683,7 +662,7 @@ class PINVerificationView(APIView):
                     security_settings.save()
 
                     # Log activity
-                    UserActivity.objects.create(
+                    UserActivity.objects.log(
                         user=request.user,
                         activity_type="pin_verified",
                         description="User verified PIN successfully",
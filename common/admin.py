@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import StoredBlob
+
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'bucket_name', 'size', 'ref_count', 'orphaned_at', 'created_at')
+    list_filter = ('bucket_name', 'orphaned_at')
+    search_fields = ('name', 'checksum')
+    ordering = ('-created_at',)
+    readonly_fields = ('bucket_name', 'checksum', 'name', 'size', 'content_type', 'ref_count', 'orphaned_at', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False
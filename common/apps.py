@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.core.signals import setting_changed
 
 
 class CommonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'common' 
\ No newline at end of file
+    name = 'common'
+
+    def ready(self):
+        from . import checks  # registers the system checks
+        from .storage import reset_storage
+
+        setting_changed.connect(reset_storage, dispatch_uid='common_storage_reset')
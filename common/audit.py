@@ -0,0 +1,195 @@
+"""
+Batched, asynchronous writer for audit log records
+"""
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import models, transaction, close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AuditLogWriter:
+    """
+    Queue of unsaved audit records written with bulk_create.
+    
+    Records are queued in-process and a background thread writes them in
+    batches of up to AUDIT_BATCH_SIZE, at least every AUDIT_FLUSH_INTERVAL
+    seconds, so logging an event costs the request no database round-trip.
+    When the bounded queue is full AUDIT_OVERFLOW decides what happens:
+    "sync" writes the record inline, "block" waits for room and "drop"
+    discards it. With AUDIT_LOG_MODE = "sync" every record is written
+    immediately (used by the test suite). Pending records are flushed when
+    the process exits.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+    
+    def _reset(self):
+        self._queue = None
+        self._thread = None
+        self.stats = dict.fromkeys(('queued', 'written', 'dropped', 'failed', 'flushes'), 0)
+    
+    @property
+    def is_async(self):
+        return settings.AUDIT_LOG_MODE == 'async'
+    
+    def submit(self, instance):
+        """Queue an unsaved audit record for writing"""
+        if not self.is_async:
+            self.write([instance])
+            return
+        
+        audit_queue = self._ensure_started()
+        try:
+            audit_queue.put_nowait(instance)
+        except queue.Full:
+            policy = settings.AUDIT_OVERFLOW
+            if policy == 'block':
+                audit_queue.put(instance)
+            elif policy == 'drop':
+                self._count('dropped')
+                logger.warning('Audit queue full, dropped %s record', instance._meta.label)
+                return
+            else:
+                self.write([instance])
+                return
+        self._count('queued')
+    
+    def flush(self):
+        """Write every queued record from the calling thread"""
+        if self._queue is None:
+            return
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self.write(batch)
+    
+    def close(self, timeout=5):
+        """Stop the background thread after it has written what is queued"""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+                thread.join(timeout)
+            except queue.Full:
+                pass
+        self.flush()
+    
+    def write(self, instances):
+        """Write records with one bulk insert per model, falling back to one by one"""
+        by_model = defaultdict(list)
+        for instance in instances:
+            by_model[type(instance)].append(instance)
+        
+        for model, batch in by_model.items():
+            try:
+                with transaction.atomic():
+                    model._default_manager.write_batch(batch)
+                self._count('written', len(batch))
+            except Exception:
+                # One bad record (e.g. its document was deleted meanwhile)
+                # must not take the rest of the batch with it
+                for instance in batch:
+                    try:
+                        with transaction.atomic():
+                            model._default_manager.write_batch([instance])
+                        self._count('written')
+                    except Exception:
+                        self._count('failed')
+                        logger.exception('Could not write %s record', model._meta.label)
+        self._count('flushes')
+    
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._queue is None:
+                    self._queue = queue.Queue(maxsize=settings.AUDIT_QUEUE_SIZE)
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+            return self._queue
+    
+    def _run(self):
+        audit_queue = self._queue
+        stopping = False
+        while not stopping:
+            batch, stopping = self._take_batch(audit_queue)
+            if not batch:
+                continue
+            close_old_connections()
+            try:
+                self.write(batch)
+            except Exception:
+                logger.exception('Audit log flush failed')
+        close_old_connections()
+    
+    def _take_batch(self, audit_queue):
+        """Wait for a record, then collect more until the size or time threshold"""
+        item = audit_queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + settings.AUDIT_FLUSH_INTERVAL
+        while len(batch) < settings.AUDIT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = audit_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+    
+    def _count(self, stat, value=1):
+        with self._lock:
+            self.stats[stat] += value
+    
+    def _after_fork(self):
+        # Records queued by the parent are the parent's to write
+        self._lock = threading.Lock()
+        self._reset()
+
+
+audit_writer = AuditLogWriter()
+
+atexit.register(audit_writer.close)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=audit_writer._after_fork)
+
+
+class AuditLogManager(models.Manager):
+    """Manager for audit log models, whose records go through the audit writer"""
+    
+    def log(self, **fields):
+        """
+        Record an audit entry without waiting for the database.
+        
+        Returns:
+            The unsaved instance; it is written by the audit writer
+        """
+        instance = self.model(**fields)
+        audit_writer.submit(instance)
+        return instance
+    
+    def write_batch(self, instances):
+        """Insert a batch of records; called by the audit writer in a transaction"""
+        self.bulk_create(instances)
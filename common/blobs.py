@@ -0,0 +1,217 @@
+"""
+Content-addressed, deduplicated blob storage
+"""
+import os
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import StoredBlob
+from .storage import (
+    upload_file_to_supabase, delete_file_from_supabase, resolve_url, get_content_type,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(file):
+    """
+    SHA-256 and size of a file, read chunk by chunk from the local upload
+    
+    Returns:
+        tuple: (hex digest, size in bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    if hasattr(file, 'chunks'):
+        chunks = file.chunks()
+    else:
+        file.seek(0)
+        chunks = iter(lambda: file.read(1024 * 1024), b'')
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return digest.hexdigest(), size
+
+
+def blob_name(checksum, filename=None):
+    """Storage name of a blob; the extension keeps content types guessable"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    return f"blobs/{checksum[:2]}/{checksum}{ext}"
+
+
+def _result(blob, deduplicated):
+    return {
+        'success': True,
+        'filename': blob.name,
+        'public_url': resolve_url(blob.bucket_name, blob.name),
+        'size': blob.size,
+        'content_type': blob.content_type,
+        'checksum': blob.checksum,
+        'deduplicated': deduplicated,
+    }
+
+
+def _take_reference(bucket_name, checksum):
+    """Add a reference to an existing blob; None if there is no such blob"""
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(
+            bucket_name=bucket_name, checksum=checksum
+        ).first()
+        if blob is None:
+            return None
+        StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1, orphaned_at=None)
+        blob.ref_count += 1
+        return blob
+
+
+def store_blob(file, bucket_name='documents'):
+    """
+    Store a file as a content-addressed blob and take a reference to it.
+    
+    The file is hashed from the local upload first; if a blob with the same
+    content already exists in the bucket only its reference count changes and
+    nothing is sent to storage. Otherwise the file is uploaded under a name
+    derived from its hash.
+    
+    Args:
+        file: File object to store
+        bucket_name: Storage bucket name
+    
+    Returns:
+        dict: Same shape as upload_file_to_supabase(), plus 'deduplicated'
+    """
+    checksum, size = hash_file(file)
+    blob = _take_reference(bucket_name, checksum)
+    if blob is not None:
+        return _result(blob, deduplicated=True)
+    
+    # Concurrent uploads of new content write identical bytes to the same
+    # name, so the object is upserted rather than failing on a conflict
+    name = blob_name(checksum, getattr(file, 'name', None))
+    result = upload_file_to_supabase(file, bucket_name, path=name, upsert=True)
+    if not result['success']:
+        return result
+    
+    with transaction.atomic():
+        blob, created = StoredBlob.objects.select_for_update().get_or_create(
+            bucket_name=bucket_name,
+            checksum=checksum,
+            defaults={
+                'name': name,
+                'size': result['size'],
+                'content_type': result['content_type'] or get_content_type(file),
+                'ref_count': 1,
+            },
+        )
+        if not created:
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1, orphaned_at=None)
+            blob.ref_count += 1
+    return _result(blob, deduplicated=not created)
+
+
+def release_blob(bucket_name, name):
+    """
+    Drop a reference to a blob. Blobs left without references are marked
+    orphaned and removed by the garbage collector after BLOB_GC_GRACE_SECONDS.
+    
+    Returns:
+        bool: True if name was a blob of the bucket
+    """
+    with transaction.atomic():
+        released = StoredBlob.objects.filter(
+            bucket_name=bucket_name, name=name, ref_count__gt=0
+        ).update(ref_count=F('ref_count') - 1)
+        StoredBlob.objects.filter(
+            bucket_name=bucket_name, name=name, ref_count=0, orphaned_at__isnull=True
+        ).update(orphaned_at=timezone.now())
+    return bool(released)
+
+
+def collect_garbage(grace_seconds=None):
+    """
+    Delete orphaned blobs from storage and the database
+    
+    Args:
+        grace_seconds: Minimum time a blob must have been orphaned
+    
+    Returns:
+        int: Number of blobs removed
+    """
+    if grace_seconds is None:
+        grace_seconds = settings.BLOB_GC_GRACE_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    candidates = StoredBlob.objects.filter(ref_count=0, orphaned_at__lte=cutoff).values_list('pk', flat=True)
+    removed = 0
+    for pk in list(candidates):
+        with transaction.atomic():
+            # Re-check under the row lock: a new reference may have arrived
+            blob = StoredBlob.objects.select_for_update().filter(pk=pk, ref_count=0).first()
+            if blob is None:
+                continue
+            # Remove the object while the row is locked, so a concurrent
+            # store_blob() of the same content waits and then uploads afresh
+            if not delete_file_from_supabase(blob.name, blob.bucket_name):
+                continue
+            blob.delete()
+            removed += 1
+    return removed
+
+
+def recount_references():
+    """
+    Recompute every blob's reference count from the content-addressed file
+    fields that point at it, repairing counts left by failed saves
+    
+    Returns:
+        int: Number of blobs whose count changed
+    """
+    counts = {}
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if not getattr(field, 'content_addressed', False):
+                continue
+            names = model._default_manager.filter(**{f'{field.name}__startswith': 'blobs/'}).values_list(field.attname, flat=True)
+            for name in names.iterator():
+                key = (field.bucket_name, name)
+                counts[key] = counts.get(key, 0) + 1
+    
+    changed = 0
+    now = timezone.now()
+    for blob in StoredBlob.objects.iterator():
+        ref_count = counts.get((blob.bucket_name, blob.name), 0)
+        if ref_count == blob.ref_count:
+            continue
+        StoredBlob.objects.filter(pk=blob.pk).update(
+            ref_count=ref_count,
+            orphaned_at=(blob.orphaned_at or now) if ref_count == 0 else None,
+        )
+        changed += 1
+    return changed
+
+
+_collector_lock = threading.Lock()
+
+
+def schedule_garbage_collection():
+    """Run collect_garbage() in a background thread unless one is already running"""
+    if not _collector_lock.acquire(blocking=False):
+        return
+    
+    def run():
+        try:
+            collect_garbage()
+        except Exception:
+            logger.exception('Blob garbage collection failed')
+        finally:
+            connection.close()
+            _collector_lock.release()
+    
+    threading.Thread(target=run, name='blob-gc', daemon=True).start()
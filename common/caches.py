@@ -0,0 +1,34 @@
+"""
+Cache aliases that must be held in memory
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+
+# Backends that answer from memory; a database or file cache would cost a
+# lookup the very queries the caches in front of storage and the database
+# are there to save
+IN_MEMORY_BACKENDS = (RedisCache, BaseMemcachedCache, LocMemCache)
+
+
+def in_memory_cache(alias, setting):
+    """
+    The cache of an alias, which must be held in memory: Redis or Memcached
+    shared by the workers, or local memory for a single worker.
+    
+    Raises:
+        ImproperlyConfigured: the alias (named by the setting) is missing
+        or stores its entries in the database or on disk
+    """
+    if alias not in settings.CACHES:
+        raise ImproperlyConfigured(f"{setting} '{alias}' is not in CACHES")
+    cache = caches[alias]
+    if not isinstance(cache, IN_MEMORY_BACKENDS):
+        raise ImproperlyConfigured(
+            f"{setting} '{alias}' uses {type(cache).__name__}; it needs an in-memory cache "
+            f"(Redis, Memcached, or local memory for a single worker)"
+        )
+    return cache
@@ -0,0 +1,42 @@
+"""
+System checks of the cache aliases in front of storage
+"""
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, Warning, register
+from django.core.exceptions import ImproperlyConfigured
+from .caches import in_memory_cache
+
+# Settings naming the cache aliases that must be held in memory
+IN_MEMORY_ALIAS_SETTINGS = ['STORAGE_METADATA_CACHE_ALIAS', 'DOCUMENT_SIGNED_URL_CACHE_ALIAS']
+
+
+@register(Tags.caches)
+def check_in_memory_caches(app_configs, **kwargs):
+    """The storage metadata and signed URL caches must be in-memory caches"""
+    errors = []
+    for setting in IN_MEMORY_ALIAS_SETTINGS:
+        try:
+            in_memory_cache(getattr(settings, setting), setting)
+        except ImproperlyConfigured as exc:
+            errors.append(Error(str(exc), id='common.E001'))
+    return errors
+
+
+@register(Tags.caches, deploy=True)
+def check_in_memory_caches_shared(app_configs, **kwargs):
+    """Local memory is not shared, so each worker would fill its own copy"""
+    warnings = []
+    for setting in IN_MEMORY_ALIAS_SETTINGS:
+        alias = getattr(settings, setting)
+        try:
+            cache = in_memory_cache(alias, setting)
+        except ImproperlyConfigured:
+            continue
+        if isinstance(cache, LocMemCache):
+            warnings.append(Warning(
+                f"{setting} '{alias}' is local memory, which the workers do not share",
+                hint='Point STORAGE_CACHE_BACKEND and STORAGE_CACHE_LOCATION at Redis or Memcached.',
+                id='common.W001',
+            ))
+    return warnings
@@ -0,0 +1,456 @@
+"""
+Read-through local disk cache for stored file bytes
+"""
+import os
+import mmap
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+STATS_KEY_PREFIX = 'content-cache-stats:'
+STAT_NAMES = ('hits', 'misses', 'fills', 'evictions', 'evicted_bytes')
+
+
+class DiskContentCache:
+    """
+    Bounded on-disk cache of file bytes in front of any storage backend.
+
+    Entries are keyed by bucket, storage name and content hash, so a
+    replaced file never serves stale bytes. On a miss, stream() sends the
+    file to the client as it arrives from storage while writing it to the
+    cache, and fetch() fills the entry before returning its path. Only one
+    request at a time fills an entry, in this process or another worker, so
+    concurrent misses of a hot file make a single fetch from storage: other
+    requests read the bytes from the fill as they are written (stream()) or
+    wait for it to finish (fetch()).
+
+    The cache size is a running total over an in-process index of entries,
+    built by one scan of the root on first use; entries filled by other
+    workers join the index when they are hit. Entries are evicted least
+    recently used first once the total grows past CONTENT_CACHE_MAX_SIZE.
+    Each entry has its own lock file next to it, removed with the entry by
+    whoever holds the lock; a process that locked a removed lock file sees
+    it was replaced and locks the new one.
+    """
+
+    stats_key_prefix = STATS_KEY_PREFIX
+    # Seconds between checks of a fill that has no new bytes yet
+    follow_interval = 0.02
+
+    def __init__(self, root=None, max_size=None):
+        self._root = root
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # path -> size, least recently used first
+        self._index = None
+        self._size = 0
+        self._stats = dict.fromkeys(STAT_NAMES, 0)
+        self._pending = dict.fromkeys(STAT_NAMES, 0)
+        self._flushed_at = time.monotonic()
+
+    @property
+    def root(self):
+        return str(self._root or settings.CONTENT_CACHE_ROOT)
+
+    @property
+    def max_size(self):
+        return self._max_size if self._max_size is not None else settings.CONTENT_CACHE_MAX_SIZE
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def cacheable(self, size):
+        """Whether a file of this size may be cached; one file never takes over a quarter of the cache"""
+        return self.enabled and size <= self.max_size // 4
+
+    def path_for(self, bucket_name, name, content_hash):
+        digest = hashlib.sha256(f"{bucket_name}/{name}:{content_hash}".encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def lock_path_for(self, path):
+        return path + '.lock'
+
+    def part_path_for(self, path):
+        """Where an entry is written while it is filled"""
+        return path + '.part'
+
+    def get(self, bucket_name, name, content_hash):
+        """Path of a cached entry, refreshing its recency, or None on a miss"""
+        path = self.path_for(bucket_name, name, content_hash)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        return path
+
+    def lookup(self, bucket_name, name, content_hash, size):
+        """
+        Path of a cached entry, counting the hit or miss, or None on a miss
+        or if the file is not cacheable. Follow a miss with stream().
+        """
+        if not self.cacheable(size):
+            return None
+        path = self.get(bucket_name, name, content_hash)
+        self._count('hits' if path else 'misses')
+        return path
+
+    def stream(self, bucket_name, name, content_hash, size, chunks):
+        """
+        Iterate over a file's bytes from storage, writing them to the cache
+        as they are sent.
+
+        The entry only appears once every byte has been written; if the
+        client goes away first, nothing is cached. If another request is
+        already filling the entry, the bytes are read from its fill instead
+        of from storage. Files that are not cacheable are passed through.
+
+        Args:
+            chunks: Iterable of the file's bytes, e.g. Storage.stream(name)
+        """
+        if not self.cacheable(size):
+            yield from chunks
+            return
+        path = self.path_for(bucket_name, name, content_hash)
+        with self._entry_lock(path, blocking=False) as acquired:
+            if acquired and not os.path.exists(path):
+                yield from self._write_through(path, chunks)
+                return
+        # Filled since the lookup, or being filled by another request
+        yield from self._follow(path, chunks)
+
+    def fetch(self, bucket_name, name, content_hash, size, opener):
+        """
+        Path of the cached file, fetching it through opener() on a miss.
+
+        Args:
+            bucket_name: Storage bucket of the file
+            name: Storage name of the file
+            content_hash: Hash of the file's content (part of the key)
+            size: File size in bytes, used to keep oversized files out
+            opener: Callable returning an iterable of the file's bytes
+
+        Returns:
+            str: Path of the cached file, or None if it is not cacheable
+        """
+        if not self.cacheable(size):
+            return None
+        path = self.get(bucket_name, name, content_hash)
+        if path:
+            self._count('hits')
+            return path
+
+        path = self.path_for(bucket_name, name, content_hash)
+        with self._entry_lock(path):
+            # Another request may have filled the entry while we waited
+            if os.path.exists(path):
+                self._count('hits')
+                self._touch(path)
+                return path
+            self._count('misses')
+            for _ in self._write_through(path, opener()):
+                pass
+        return path
+
+    def stats(self):
+        """Counters for this process, with the hit ratio and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['size'] = self.current_size()
+        stats['max_size'] = self.max_size
+        return stats
+
+    def aggregate_stats(self):
+        """Counters summed over every worker that shares the Django cache"""
+        self.flush_stats()
+        values = cache.get_many([self.stats_key_prefix + stat for stat in STAT_NAMES])
+        stats = {stat: values.get(self.stats_key_prefix + stat, 0) for stat in STAT_NAMES}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['size'] = self.current_size(rescan=True)
+        stats['max_size'] = self.max_size
+        return stats
+
+    def flush_stats(self):
+        """Add this process's pending counters to the shared totals"""
+        with self._lock:
+            pending, self._pending = self._pending, dict.fromkeys(STAT_NAMES, 0)
+            self._flushed_at = time.monotonic()
+        for stat, value in pending.items():
+            if not value:
+                continue
+            key = self.stats_key_prefix + stat
+            if not cache.add(key, value, None):
+                try:
+                    cache.incr(key, value)
+                except ValueError:
+                    cache.set(key, value, None)
+
+    def current_size(self, rescan=False):
+        """Total size of the cached entries, rebuilding the index from disk with rescan"""
+        if rescan:
+            with self._lock:
+                self._index = None
+        self._load_index()
+        with self._lock:
+            return self._size
+
+    def evict(self, target=None):
+        """Remove least recently used entries until the cache fits in target bytes"""
+        target = self.max_size * 9 // 10 if target is None else target
+        self._load_index()
+        evicted = 0
+        while True:
+            with self._lock:
+                if self._size <= target or not self._index:
+                    break
+                path, size = self._index.popitem(last=False)
+                self._size -= size
+            with self._entry_lock(path, blocking=False) as acquired:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Already evicted by another worker
+                    continue
+                if acquired:
+                    self._remove_lock_file(path)
+            evicted += size
+            self._count('evictions')
+            self._count('evicted_bytes', size)
+        return evicted
+
+    def clear(self):
+        self.current_size(rescan=True)
+        self.evict(target=0)
+
+    def _write_through(self, path, chunks):
+        """
+        Yield chunks while writing them to the entry's .part file, which
+        becomes the entry once complete. The caller holds the entry's lock.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = self.part_path_for(path)
+        written = 0
+        try:
+            # A .part left by a crashed fill is an older copy; start a new file
+            try:
+                os.remove(part_path)
+            except FileNotFoundError:
+                pass
+            with open(part_path, 'xb') as part:
+                for chunk in chunks:
+                    part.write(chunk)
+                    # Readers of the fill see each chunk as it is sent
+                    part.flush()
+                    written += len(chunk)
+                    yield chunk
+            os.chmod(part_path, 0o644)
+            os.replace(part_path, path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            self._remove_lock_file(path)
+            raise
+        self._count('fills')
+        self._add(path, written)
+
+    def _follow(self, path, chunks, chunk_size=256 * 1024):
+        """
+        Yield an entry's bytes from the cache while another request fills it,
+        then from the finished entry. If the fill is abandoned, or writes
+        nothing for CONTENT_CACHE_FILL_WAIT seconds, the rest of the file
+        comes from chunks after all.
+        """
+        sent = 0
+        file = None
+        progress_at = time.monotonic()
+        try:
+            while True:
+                if file is not None:
+                    data = file.read(chunk_size)
+                    if data:
+                        sent += len(data)
+                        progress_at = time.monotonic()
+                        yield data
+                        continue
+                entry = _inode(path)
+                if entry is not None:
+                    if file is None or os.fstat(file.fileno()).st_ino != entry:
+                        # Reading an older .part, or nothing yet: continue from the entry
+                        if file is not None:
+                            file.close()
+                        file = open(path, 'rb')
+                        file.seek(sent)
+                    # Complete: nothing is written to the file once it is the entry
+                    while data := file.read(chunk_size):
+                        yield data
+                    self._touch(path)
+                    return
+                if file is None:
+                    try:
+                        file = open(self.part_path_for(path), 'rb')
+                        continue
+                    except FileNotFoundError:
+                        pass
+                if not self._filling(path):
+                    if os.path.exists(path):
+                        continue
+                    break
+                if time.monotonic() - progress_at > settings.CONTENT_CACHE_FILL_WAIT:
+                    break
+                time.sleep(self.follow_interval)
+        finally:
+            if file is not None:
+                file.close()
+        # The fill went away: the rest comes from storage
+        for chunk in chunks:
+            if sent >= len(chunk):
+                sent -= len(chunk)
+                continue
+            yield chunk[sent:]
+            sent = 0
+
+    def _filling(self, path):
+        """Whether another request holds the fill lock of an entry"""
+        with self._entry_lock(path, blocking=False) as acquired:
+            return not acquired
+
+    def _load_index(self):
+        with self._lock:
+            if self._index is not None:
+                return
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        index = OrderedDict((path, size) for path, size, _ in entries)
+        with self._lock:
+            if self._index is None:
+                self._index = index
+                self._size = sum(index.values())
+
+    def _add(self, path, size):
+        self._load_index()
+        with self._lock:
+            self._size += size - self._index.pop(path, 0)
+            self._index[path] = size
+            over = self._size > self.max_size
+        if over:
+            self.evict()
+
+    def _touch(self, path):
+        self._load_index()
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+                return
+        # Filled by another worker
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        self._add(path, size)
+
+    def _entries(self):
+        """(path, size, mtime) of every cached file"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(('.part', '.lock')):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    @contextmanager
+    def _entry_lock(self, path, blocking=True):
+        """Hold the fill lock of an entry; yields False if not blocking and it is taken"""
+        with self._lock:
+            lock = self._key_locks.setdefault(path, threading.Lock())
+        if not lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            lock_file = self._lock_file(path, blocking)
+            if lock_file is None:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+        finally:
+            lock.release()
+            with self._lock:
+                if self._key_locks.get(path) is lock and not lock.locked():
+                    del self._key_locks[path]
+
+    def _lock_file(self, path, blocking):
+        """The entry's lock file, flocked, or None if not blocking and it is taken"""
+        lock_path = self.lock_path_for(path)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        while True:
+            lock_file = open(lock_path, 'ab')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                lock_file.close()
+                return None
+            if _inode(lock_path) == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+            # Removed with its entry while we waited for it
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _remove_lock_file(self, path):
+        """Remove an entry's lock file; only while holding it"""
+        if fcntl is None:
+            return
+        try:
+            os.remove(self.lock_path_for(path))
+        except FileNotFoundError:
+            pass
+
+    def _count(self, stat, value=1):
+        with self._lock:
+            self._stats[stat] += value
+            self._pending[stat] += value
+            due = time.monotonic() - self._flushed_at > settings.CONTENT_CACHE_STATS_INTERVAL
+        if due:
+            self.flush_stats()
+
+
+content_cache = DiskContentCache()
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def iter_file_range(path, start, end, chunk_size=256 * 1024):
+    """Yield bytes start..end (inclusive) of a file from a memory map"""
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset in range(start, end + 1, chunk_size):
+                yield data[offset:min(offset + chunk_size, end + 1)]
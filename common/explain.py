@@ -0,0 +1,90 @@
+"""
+EXPLAIN helpers for checking that queries are answered from indexes
+"""
+import re
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+def explain(sql):
+    """
+    Query plan of a SQL statement as a list of lines.
+
+    On PostgreSQL sequential scans are disabled for the EXPLAIN, so the plan
+    shows whether an index *can* serve the query even on the small tables
+    of a test database, where the planner would rightly prefer a seq scan.
+    The EXPLAIN runs in its own transaction (a savepoint inside a test's
+    transaction) that is rolled back, which also undoes the SET LOCAL.
+    """
+    if connection.vendor == 'postgresql':
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            plan = [row[0] for row in cursor.fetchall()]
+            transaction.set_rollback(True)
+        return plan
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+    raise NotImplementedError(f'EXPLAIN is not supported on {connection.vendor}')
+
+
+def table_access(plan, table):
+    """
+    How a plan reads a table.
+
+    Returns:
+        list: ('index', index name) for each index lookup, ('scan', name or
+        None) for each full scan of the table or of one of its indexes
+    """
+    accesses = []
+    bitmap_pending = False
+    for line in plan:
+        if connection.vendor == 'postgresql':
+            match = re.search(rf'Index (?:Only )?Scan(?: Backward)? using (\w+) on {table}\b', line)
+            if match:
+                accesses.append(('index', match.group(1)))
+            elif re.search(rf'Bitmap Heap Scan on {table}\b', line):
+                bitmap_pending = True
+            elif bitmap_pending and (match := re.search(r'Bitmap Index Scan on (\w+)', line)):
+                accesses.append(('index', match.group(1)))
+            elif re.search(rf'Seq Scan on {table}\b', line):
+                accesses.append(('scan', None))
+        else:
+            match = re.search(rf'\b(SEARCH|SCAN) {table}\b(?: AS \w+)?(?: USING (?:COVERING )?INDEX (\w+))?', line)
+            if match:
+                kind = 'index' if match.group(1) == 'SEARCH' else 'scan'
+                accesses.append((kind, match.group(2)))
+    return accesses
+
+
+class QueryPlanAssertionsMixin:
+    """Assertions on the plans of the queries an endpoint runs"""
+
+    def endpoint_plans(self, url, table, method='get', **kwargs):
+        """Call an endpoint and return the plans of its SELECTs that read table"""
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, getattr(response, 'data', response))
+        return [
+            explain(query['sql'])
+            for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and re.search(rf'\b(?:FROM|JOIN) "?{table}"?', query['sql'])
+        ]
+
+    def assertEndpointUsesIndex(self, url, table, index=None, method='get', **kwargs):
+        """
+        Every query of the endpoint that reads table must read it through an
+        index (the given one, if named) and never with a full table scan
+        """
+        plans = self.endpoint_plans(url, table, method, **kwargs)
+        self.assertTrue(plans, f'{url} ran no query on {table}')
+        used = set()
+        for plan in plans:
+            accesses = table_access(plan, table)
+            scans = [access for access in accesses if access[0] == 'scan']
+            self.assertFalse(scans, f'{url} scans {table}:\n' + '\n'.join(plan))
+            used.update(name for kind, name in accesses if kind == 'index')
+        if index:
+            self.assertIn(index, used, f'{url} does not use {index}:\n' + '\n\n'.join('\n'.join(plan) for plan in plans))
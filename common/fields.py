@@ -3,22 +3,177 @@ Common file fields for Supabase storage
 """
 import os
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models.fields.files import FieldFile, ImageFieldFile
+from django.db.models.signals import post_delete, post_save
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.conf import settings
-from .storage import upload_file_to_supabase, delete_file_from_supabase
+from .storage import upload_file_to_supabase, delete_file_from_supabase, get_storage
 
 
-class SupabaseFileField(models.FileField):
+class SupabaseFieldFileMixin:
+    """
+    FieldFile behaviour shared by Supabase file and image fields.
+    
+    Saving goes through the field's single upload pipeline, and the size,
+    content type and checksum recorded during the upload are served locally
+    instead of asking storage about a file we just wrote.
+    """
+    
+    upload_info = None
+    
+    def save(self, name, content, save=True):
+        self.field.upload(self, content, name)
+        if save:
+            self.instance.save()
+    
+    save.alters_data = True
+    
+    @property
+    def size(self):
+        if self.upload_info:
+            return self.upload_info['size']
+        return super().size
+    
+    @property
+    def content_type(self):
+        if self.upload_info:
+            return self.upload_info['content_type']
+        return None
+    
+    @property
+    def checksum(self):
+        if self.upload_info:
+            return self.upload_info['checksum']
+        return None
+
+
+class SupabaseFieldFile(SupabaseFieldFileMixin, FieldFile):
+    pass
+
+
+class SupabaseImageFieldFile(SupabaseFieldFileMixin, ImageFieldFile):
+    pass
+
+
+class SupabaseUploadMixin:
+    """
+    Upload pipeline shared by Supabase file and image fields.
+    
+    A newly assigned file is uploaded exactly once, in pre_save; afterwards
+    the FieldFile is marked committed so repeated saves do not re-upload.
+    
+    Content-addressed fields store each unique content once as a shared,
+    reference-counted blob (see common.blobs); replacing a row's file or
+    deleting the row releases its previous reference, and unreferenced blobs
+    are garbage collected in the background.
+    """
+    
+    upload_label = 'file'
+    content_addressed = False
+    
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if self.content_addressed and not cls._meta.abstract:
+            post_save.connect(self._release_on_replace, sender=cls, weak=False)
+            post_delete.connect(self._release_on_delete, sender=cls, weak=False)
+    
+    def _release_on_replace(self, sender, instance, **kwargs):
+        replaced = instance.__dict__.get('_replaced_blobs', {}).pop(self.attname, [])
+        for name in replaced:
+            self._release_after_commit(name)
+    
+    def _release_on_delete(self, sender, instance, **kwargs):
+        name = getattr(instance, self.attname)
+        if name:
+            self._release_after_commit(str(name))
+    
+    def _release_after_commit(self, name):
+        bucket_name = self.bucket_name
+        
+        def release():
+            from .blobs import release_blob, schedule_garbage_collection
+            if release_blob(bucket_name, name):
+                schedule_garbage_collection()
+        
+        transaction.on_commit(release)
+    
+    def _held_blob(self, instance):
+        """Name of the blob reference instance currently holds for this field"""
+        held = instance.__dict__.setdefault('_held_blobs', {})
+        if self.attname not in held:
+            held[self.attname] = None
+            if not instance._state.adding and instance.pk is not None:
+                held[self.attname] = (
+                    type(instance)._base_manager.using(instance._state.db or 'default')
+                    .filter(pk=instance.pk).values_list(self.attname, flat=True).first()
+                )
+        return held[self.attname]
+    
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        # Storage follows from the bucket's configured backend
+        kwargs.pop('storage', None)
+        return name, path, args, kwargs
+    
+    def pre_save(self, model_instance, add):
+        """Upload a newly assigned file before saving to database"""
+        file = getattr(model_instance, self.attname)
+        if file and not file._committed:
+            self.upload(file, file.file, file.name)
+        return file
+    
+    def upload(self, field_file, content, name):
+        """Upload content to Supabase and record what was written on field_file"""
+        if name and not getattr(content, 'name', None):
+            content.name = name
+        if self.content_addressed:
+            from .blobs import store_blob
+            previous = self._held_blob(field_file.instance)
+            result = store_blob(content, self.bucket_name)
+        else:
+            result = upload_file_to_supabase(content, self.bucket_name)
+        if not result['success']:
+            raise ValidationError(
+                f"Failed to upload {self.upload_label}: {result.get('error', 'Unknown error')}"
+            )
+        field_file.name = result['filename']
+        field_file.upload_info = {
+            'size': result['size'],
+            'content_type': result['content_type'],
+            'checksum': result['checksum'],
+        }
+        field_file._committed = True
+        instance = field_file.instance
+        setattr(instance, self.attname, field_file)
+        if self.content_addressed:
+            # store_blob took a new reference; the one held until now is
+            # released once the row pointing at the new blob is saved
+            if previous:
+                instance.__dict__.setdefault('_replaced_blobs', {}).setdefault(self.attname, []).append(previous)
+            instance.__dict__['_held_blobs'][self.attname] = result['filename']
+        return result
+    
+    def delete_file(self, instance):
+        """Delete file from Supabase when model is deleted"""
+        filename = getattr(instance, self.name)
+        if filename:
+            delete_file_from_supabase(filename, self.bucket_name)
+
+
+class SupabaseFileField(SupabaseUploadMixin, models.FileField):
     """
     Custom file field for Supabase storage with validation
     """
     
+    attr_class = SupabaseFieldFile
+    
     def __init__(self, bucket_name='documents', allowed_types=None, max_size=None, *args, **kwargs):
         self.bucket_name = bucket_name
         self.allowed_types = allowed_types or getattr(settings, 'ALLOWED_FILE_TYPES', [])
         self.max_size = max_size or getattr(settings, 'MAX_FILE_SIZE', 10 * 1024 * 1024)  # 10MB
+        kwargs.setdefault('storage', get_storage(bucket_name))
         super().__init__(*args, **kwargs)
     
     def clean(self, value, model_instance):
@@ -34,49 +189,21 @@ class SupabaseFileField(models.FileField):
                 raise ValidationError(f'File type {file_ext} is not allowed. Allowed types: {", ".join(self.allowed_types)}')
         
         return super().clean(value, model_instance)
-    
-    def save_form_data(self, instance, data):
-        """Handle file upload to Supabase"""
-        if data and hasattr(data, 'read'):
-            # Upload to Supabase
-            result = upload_file_to_supabase(data, self.bucket_name)
-            if result['success']:
-                # Save the filename to the database
-                setattr(instance, self.name, result['filename'])
-            else:
-                raise ValidationError(f"Failed to upload file: {result.get('error', 'Unknown error')}")
-        else:
-            super().save_form_data(instance, data)
-    
-    def pre_save(self, model_instance, add):
-        """Handle file before saving to database"""
-        file = getattr(model_instance, self.attname)
-        if file and hasattr(file, 'read'):
-            # Upload to Supabase
-            result = upload_file_to_supabase(file, self.bucket_name)
-            if result['success']:
-                # Return the filename for database storage
-                return result['filename']
-            else:
-                raise ValidationError(f"Failed to upload file: {result.get('error', 'Unknown error')}")
-        return file
-    
-    def delete_file(self, instance):
-        """Delete file from Supabase when model is deleted"""
-        filename = getattr(instance, self.name)
-        if filename:
-            delete_file_from_supabase(filename, self.bucket_name)
 
 
-class SupabaseImageField(models.ImageField):
+class SupabaseImageField(SupabaseUploadMixin, models.ImageField):
     """
     Custom image field for Supabase storage with validation
     """
     
+    attr_class = SupabaseImageFieldFile
+    upload_label = 'image'
+    
     def __init__(self, bucket_name='images', allowed_types=None, max_size=None, *args, **kwargs):
         self.bucket_name = bucket_name
         self.allowed_types = allowed_types or getattr(settings, 'ALLOWED_IMAGE_TYPES', [])
         self.max_size = max_size or getattr(settings, 'MAX_FILE_SIZE', 5 * 1024 * 1024)  # 5MB
+        kwargs.setdefault('storage', get_storage(bucket_name))
         super().__init__(*args, **kwargs)
     
     def clean(self, value, model_instance):
@@ -92,38 +219,6 @@ class SupabaseImageField(models.ImageField):
                 raise ValidationError(f'Image type {file_ext} is not allowed. Allowed types: {", ".join(self.allowed_types)}')
         
         return super().clean(value, model_instance)
-    
-    def save_form_data(self, instance, data):
-        """Handle image upload to Supabase"""
-        if data and hasattr(data, 'read'):
-            # Upload to Supabase
-            result = upload_file_to_supabase(data, self.bucket_name)
-            if result['success']:
-                # Save the filename to the database
-                setattr(instance, self.name, result['filename'])
-            else:
-                raise ValidationError(f"Failed to upload image: {result.get('error', 'Unknown error')}")
-        else:
-            super().save_form_data(instance, data)
-    
-    def pre_save(self, model_instance, add):
-        """Handle image before saving to database"""
-        image = getattr(model_instance, self.attname)
-        if image and hasattr(image, 'read'):
-            # Upload to Supabase
-            result = upload_file_to_supabase(image, self.bucket_name)
-            if result['success']:
-                # Return the filename for database storage
-                return result['filename']
-            else:
-                raise ValidationError(f"Failed to upload image: {result.get('error', 'Unknown error')}")
-        return image
-    
-    def delete_file(self, instance):
-        """Delete image from Supabase when model is deleted"""
-        filename = getattr(instance, self.name)
-        if filename:
-            delete_file_from_supabase(filename, self.bucket_name)
 
 
 class DocumentFileField(SupabaseFileField):
@@ -131,6 +226,8 @@ class DocumentFileField(SupabaseFileField):
     Specialized file field for documents
     """
     
+    content_addressed = True
+    
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('bucket_name', 'documents')
         kwargs.setdefault('allowed_types', ['pdf', 'doc', 'docx', 'txt', 'rtf'])
@@ -159,4 +256,4 @@ class QRCodeImageField(SupabaseImageField):
         kwargs.setdefault('bucket_name', 'qr-codes')
         kwargs.setdefault('allowed_types', ['png', 'jpg', 'jpeg'])
         kwargs.setdefault('max_size', 1 * 1024 * 1024)  # 1MB for QR codes
-        super().__init__(*args, **kwargs) 
\ No newline at end of file
+        super().__init__(*args, **kwargs)
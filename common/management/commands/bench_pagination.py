@@ -0,0 +1,108 @@
+"""
+Benchmark shallow and deep pages of a high-volume list endpoint.
+
+A throwaway test database is seeded with one user's activity log (plus
+noise from other users), then GET /api/v1/auth/activities/ is timed for the
+first page and for a deep page, once by page number and once by keyset
+cursor. Page-number pagination pays for the OFFSET and the COUNT on every
+request; the cursor page is a range read on (user, -created_at).
+"""
+import os
+import time
+import random
+import tempfile
+import statistics
+from datetime import timedelta
+from django.db import connection
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from auth_api.models import CustomUser, UserActivity
+from common.pagination import KeysetPagination
+
+BATCH_SIZE = 10000
+URL = '/api/v1/auth/activities/'
+
+
+class Command(BaseCommand):
+    help = 'Compare latency of page 1 and a deep page with page-number and cursor pagination'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=10_000, help='Deep page number')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--noise', type=int, default=200_000, help='Activity rows of other users')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'bench_pagination.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            page_size = options['page_size']
+            rows = options['page'] * page_size
+            started = time.perf_counter()
+            user = self.seed(random.Random(options['seed']), rows, options['noise'])
+            self.stdout.write(f'Seeded {rows} rows in {time.perf_counter() - started:.0f}s')
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            paginator = KeysetPagination()
+            paginator.field = 'created_at'
+            # The cursor a client would hold after walking to the page before
+            last = (
+                UserActivity.objects.filter(user=user).order_by('-created_at', '-pk')
+                .values_list('created_at', 'pk')[rows - page_size - 1]
+            )
+            cases = (
+                ('page 1', {'page': 1}),
+                (f"page {options['page']}", {'page': options['page']}),
+                ('cursor 1', {'cursor': ''}),
+                (f"cursor {options['page']}", {'cursor': paginator.encode_cursor(last)}),
+            )
+
+            client = APIClient()
+            client.force_authenticate(user)
+            self.stdout.write(f"{'request':>14} {'p50':>9} {'p95':>9}")
+            with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False):
+                for label, params in cases:
+                    self.report(client, label, params, options['repeat'], page_size)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, rng, rows, noise):
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f'bench{index}', email=f'bench{index}@example.com',
+                vault_id=f'bench{index}@vault', full_name=f'Bench {index}', password='!',
+            )
+            for index in range(10)
+        ])
+        now = timezone.now()
+        owners = [users[0]] * rows + [rng.choice(users[1:]) for _ in range(noise)]
+        rng.shuffle(owners)
+        for offset in range(0, len(owners), BATCH_SIZE):
+            UserActivity.objects.bulk_create([
+                UserActivity(
+                    user=owner, activity_type='login', description='Logged in',
+                    created_at=now - timedelta(seconds=offset + index),
+                )
+                for index, owner in enumerate(owners[offset:offset + BATCH_SIZE])
+            ])
+        return users[0]
+
+    def report(self, client, label, params, repeat, page_size):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(URL, params)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200 and len(response.data['results']) == page_size, response.data
+        self.stdout.write(f'{label:>14} {statistics.median(timings):>7.1f}ms {percentile(timings, 95):>7.1f}ms')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
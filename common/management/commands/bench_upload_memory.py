@@ -0,0 +1,107 @@
+"""
+Benchmark peak memory of document uploads.
+
+Each upload runs in a forked child process against a local sink server that
+speaks the Supabase storage upload endpoint, so the numbers reflect only the
+app's own memory use and not object-store latency.
+"""
+import os
+import json
+import resource
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from common.storage import upload_file_to_supabase, get_storage_bucket
+
+MB = 1024 * 1024
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    """Accepts uploads and discards the body in small reads"""
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 64 * 1024)))
+        body = json.dumps({'Key': self.path}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def buffered_upload(file, bucket_name='documents'):
+    """The previous upload path: read the whole file, then send it"""
+    data = file.read()
+    get_storage_bucket(bucket_name).upload_stream(file.name, [data], file.content_type, len(data))
+
+
+class Command(BaseCommand):
+    help = 'Measure peak RSS for streamed vs buffered uploads of 1, 10 and 50 MB documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1, 10, 50], help='Upload sizes in MB')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Upload chunk size in bytes')
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), SinkHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        sink_url = f'http://127.0.0.1:{server.server_port}'
+
+        overrides = {'SUPABASE_URL': sink_url}
+        if options['chunk_size']:
+            overrides['SUPABASE_UPLOAD_CHUNK_SIZE'] = options['chunk_size']
+
+        self.stdout.write(f"{'size':>8} {'mode':>10} {'peak RSS delta':>16}")
+        try:
+            with override_settings(**overrides):
+                for size_mb in options['sizes']:
+                    for mode in ('streamed', 'buffered'):
+                        delta = self.measure(size_mb * MB, mode)
+                        self.stdout.write(f"{size_mb:>6}MB {mode:>10} {delta / 1024:>13.1f} MB")
+        finally:
+            server.shutdown()
+
+    def measure(self, size, mode):
+        """Run one upload in a child process and return its peak RSS growth in KB"""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            delta = -1
+            try:
+                upload = TemporaryUploadedFile('bench.pdf', 'application/pdf', size, None)
+                block = os.urandom(MB)
+                for _ in range(size // MB):
+                    upload.write(block)
+                upload.write(block[:size % MB])
+                upload.seek(0)
+                del block
+
+                baseline = peak_rss_kb()
+                if mode == 'streamed':
+                    result = upload_file_to_supabase(upload, 'documents')
+                    if not result['success']:
+                        raise RuntimeError(result['error'])
+                else:
+                    buffered_upload(upload)
+                delta = peak_rss_kb() - baseline
+                upload.close()
+            finally:
+                os.write(write_fd, str(delta).encode())
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            delta = int(pipe.read() or -1)
+        os.waitpid(pid, 0)
+        return delta
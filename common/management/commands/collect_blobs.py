@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from common.blobs import collect_garbage, recount_references
+
+
+class Command(BaseCommand):
+    help = 'Remove content-addressed blobs that have had no references for BLOB_GC_GRACE_SECONDS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true', help='Recompute reference counts from the file fields first'
+        )
+        parser.add_argument('--grace', type=int, help='Override BLOB_GC_GRACE_SECONDS')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            changed = recount_references()
+            self.stdout.write(f'Corrected reference counts of {changed} blobs')
+        removed = collect_garbage(options['grace'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} unreferenced blobs'))
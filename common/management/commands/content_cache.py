@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from common.content_cache import content_cache
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = 'Show hit ratio, eviction and size metrics of the download content cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evict', action='store_true', help='Evict entries down to 90%% of the size limit')
+        parser.add_argument('--clear', action='store_true', help='Remove every cached entry')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            content_cache.clear()
+        elif options['evict']:
+            content_cache.evict()
+
+        stats = content_cache.aggregate_stats()
+        self.stdout.write(f"hits          {stats['hits']}")
+        self.stdout.write(f"misses        {stats['misses']}")
+        self.stdout.write(f"hit ratio     {stats['hit_ratio']:.1%}")
+        self.stdout.write(f"fills         {stats['fills']}")
+        self.stdout.write(f"evictions     {stats['evictions']} ({stats['evicted_bytes'] / MB:.1f} MB)")
+        self.stdout.write(f"size          {stats['size'] / MB:.1f} / {stats['max_size'] / MB:.1f} MB")
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_name', models.CharField(max_length=100)),
+                ('checksum', models.CharField(max_length=64)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('content_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('orphaned_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Stored Blob',
+                'verbose_name_plural': 'Stored Blobs',
+                'indexes': [models.Index(fields=['bucket_name', 'name'], name='common_stor_bucket__ae01ed_idx'), models.Index(fields=['orphaned_at'], name='common_stor_orphane_655fd3_idx')],
+                'unique_together': {('bucket_name', 'checksum')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import models
+
+
+class StoredBlob(models.Model):
+    """
+    A unique file content, stored once and shared by every content-addressed
+    file field that holds it
+    """
+
+    bucket_name = models.CharField(max_length=100)
+    checksum = models.CharField(max_length=64)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True, null=True)
+
+    # Reference counting and garbage collection
+    ref_count = models.PositiveIntegerField(default=0)
+    orphaned_at = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Stored Blob"
+        verbose_name_plural = "Stored Blobs"
+        unique_together = ["bucket_name", "checksum"]
+        indexes = [
+            models.Index(fields=["bucket_name", "name"]),
+            models.Index(fields=["orphaned_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket_name}/{self.name} ({self.ref_count} refs)"
@@ -0,0 +1,121 @@
+"""
+Pagination for high-volume list endpoints
+"""
+import json
+import base64
+import binascii
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination with opt-in keyset (cursor) pagination.
+    
+    Without a ``cursor`` query parameter responses are paginated by page
+    number as before. With one (empty for the first page) the list is
+    ordered newest first by the view's ``cursor_field`` and then the primary
+    key, and each page continues strictly after the last row of the previous
+    one. That is a range read on a (field, id) index, so every page costs the
+    same however deep it is; there is no COUNT and the response carries only
+    ``next``, ``previous`` and ``results``.
+    """
+    
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'Opaque position for keyset pagination; pass it empty for the first page.'
+    invalid_cursor_message = 'Invalid cursor'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field = getattr(view, 'cursor_field', 'created_at')
+        model = queryset.model
+        position, reverse = self.decode_cursor(request.query_params[self.cursor_query_param], model)
+        
+        # Newest first; a 'previous' cursor walks the other way and flips back.
+        # The plain range bound on the field lets the index bound the scan,
+        # the OR only breaks ties between rows with the same value.
+        descending = not reverse
+        if position is not None:
+            value, pk = position
+            bound, after = ('lte', 'lt') if descending else ('gte', 'gt')
+            queryset = queryset.filter(**{f'{self.field}__{bound}': value}).filter(
+                Q(**{f'{self.field}__{after}': value}) | Q(**{f'pk__{after}': pk})
+            )
+        prefix = '-' if descending else ''
+        rows = list(queryset.order_by(f'{prefix}{self.field}', f'{prefix}pk')[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+        
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        self.next_position = self.position_of(rows[-1]) if rows and has_next else None
+        self.previous_position = self.position_of(rows[0]) if rows and has_previous else None
+        return rows
+    
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.cursor_link(self.next_position, reverse=False),
+            'previous': self.cursor_link(self.previous_position, reverse=True),
+            'results': data,
+        })
+    
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        # Keyset pages carry no count
+        response_schema['required'] = ['results']
+        return response_schema
+    
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append({
+            'name': self.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': self.cursor_query_description,
+            'schema': {'type': 'string'},
+        })
+        return parameters
+    
+    def position_of(self, instance):
+        return getattr(instance, self.field), instance.pk
+    
+    def cursor_link(self, position, reverse):
+        if position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+    
+    def encode_cursor(self, position, reverse=False):
+        """Cursor token continuing after (or, reversed, before) a (value, pk) position"""
+        value, pk = position
+        payload = {'v': value.isoformat() if hasattr(value, 'isoformat') else value, 'k': str(pk)}
+        if reverse:
+            payload['r'] = 1
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+    
+    def decode_cursor(self, token, model):
+        """Return ((value, pk) or None, reverse) for a cursor token"""
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            value = model._meta.get_field(self.field).to_python(payload['v'])
+            pk = model._meta.pk.to_python(payload['k'])
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return (value, pk), bool(payload.get('r'))
@@ -0,0 +1,84 @@
+"""
+Common serializer fields for files kept in storage buckets
+"""
+from django.db import models
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+from .storage import resolve_url, resolve_urls
+
+
+class PublicURLFieldMixin:
+    """
+    Serialize a stored file as its public URL.
+    
+    URLs are computed locally by the storage URL resolver. When the field
+    is rendered as part of a PublicURLListSerializer, the URLs of the whole
+    page are resolved in one batch beforehand.
+    """
+    
+    resolved_urls = None
+    
+    def get_url(self, value):
+        if not value:
+            return None
+        if self.resolved_urls and value.name in self.resolved_urls:
+            url = self.resolved_urls[value.name]
+        else:
+            url = resolve_url(value.field.bucket_name, value.name)
+        request = self.context.get('request', None)
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+    
+    def to_representation(self, value):
+        if not getattr(self, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return super().to_representation(value)
+        return self.get_url(value)
+    
+    def resolve_many(self, values):
+        """Resolve the public URLs of many files of this field at once"""
+        files = [value for value in values if value]
+        if files:
+            self.resolved_urls = resolve_urls(
+                files[0].field.bucket_name, [value.name for value in files]
+            )
+
+
+class PublicFileField(PublicURLFieldMixin, serializers.FileField):
+    pass
+
+
+class PublicImageField(PublicURLFieldMixin, serializers.ImageField):
+    pass
+
+
+class PublicURLListSerializer(serializers.ListSerializer):
+    """
+    List serializer that resolves every public file URL of the page in one
+    batch per field before rendering the items.
+    """
+    
+    def to_representation(self, data):
+        items = data.all() if isinstance(data, models.manager.BaseManager) else data
+        items = list(items)
+        for field in self.child.fields.values():
+            if isinstance(field, PublicURLFieldMixin) and not field.write_only:
+                field.resolve_many(
+                    [field.get_attribute(instance) for instance in items]
+                )
+        return super().to_representation(items)
+
+
+class PublicURLModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer that renders file and image fields through the URL
+    resolver. Set Meta.list_serializer_class = PublicURLListSerializer to
+    resolve a page of URLs in one batch.
+    """
+    
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.FileField: PublicFileField,
+        models.ImageField: PublicImageField,
+    }
+
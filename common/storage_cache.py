@@ -0,0 +1,139 @@
+"""
+Metadata cache for storage objects
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from common.caches import in_memory_cache
+from django.utils import timezone
+
+# Cached marker for names known not to exist
+MISSING = {'exists': False}
+
+
+class StorageMetadataCache:
+    """
+    Cache of storage object metadata (size, content type, etag, mtime).
+    
+    A bounded in-process LRU sits in front of the STORAGE_METADATA_CACHE_ALIAS
+    cache, which must be held in memory, so hot names are answered without
+    any I/O and other workers share what one worker has learned. Entries are written when a file is uploaded or listed and expire
+    after STORAGE_METADATA_CACHE_TTL seconds. Deleting a file drops its entry
+    from the shared cache; the in-process copy of every worker is only kept
+    for STORAGE_METADATA_CACHE_LOCAL_TTL seconds, the longest another worker
+    can still see a deleted file.
+    """
+    
+    def __init__(self, alias=None, timeout=None, local_timeout=None, max_entries=None):
+        self.alias = alias
+        self.timeout = timeout
+        self.local_timeout = local_timeout
+        self.max_entries = max_entries
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @property
+    def cache(self):
+        return in_memory_cache(
+            self.alias or getattr(settings, 'STORAGE_METADATA_CACHE_ALIAS', 'storage'), 'STORAGE_METADATA_CACHE_ALIAS'
+        )
+    
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return getattr(settings, 'STORAGE_METADATA_CACHE_TTL', 300)
+    
+    def get_local_timeout(self):
+        if self.local_timeout is not None:
+            return self.local_timeout
+        return getattr(settings, 'STORAGE_METADATA_CACHE_LOCAL_TTL', 5)
+    
+    def get_max_entries(self):
+        if self.max_entries is not None:
+            return self.max_entries
+        return getattr(settings, 'STORAGE_METADATA_CACHE_MAX_ENTRIES', 10000)
+    
+    def make_key(self, bucket_name, name):
+        digest = hashlib.sha1(f"{bucket_name}/{name}".encode()).hexdigest()
+        return f"storage-meta:{digest}"
+    
+    def get(self, bucket_name, name):
+        """Return cached metadata, MISSING for a known-absent name, or None if unknown"""
+        return self.get_many(bucket_name, [name]).get(name)
+    
+    def get_many(self, bucket_name, names):
+        """Return {name: metadata} for the names that are cached"""
+        found = {}
+        remote = {}
+        now = time.monotonic()
+        with self._lock:
+            for name in names:
+                key = self.make_key(bucket_name, name)
+                entry = self._local.get(key)
+                if entry and entry[0] > now:
+                    self._local.move_to_end(key)
+                    found[name] = entry[1]
+                else:
+                    remote[key] = name
+        if remote:
+            for key, meta in self.cache.get_many(list(remote)).items():
+                found[remote[key]] = meta
+                self._remember(key, meta)
+        return found
+    
+    def set(self, bucket_name, name, meta):
+        self.set_many(bucket_name, {name: meta})
+    
+    def set_many(self, bucket_name, mapping):
+        """Cache metadata for several names of one bucket"""
+        entries = {self.make_key(bucket_name, name): meta for name, meta in mapping.items()}
+        if not entries:
+            return
+        for key, meta in entries.items():
+            self._remember(key, meta)
+        self.cache.set_many(entries, self.get_timeout())
+    
+    def delete(self, bucket_name, name):
+        key = self.make_key(bucket_name, name)
+        with self._lock:
+            self._local.pop(key, None)
+        self.cache.delete(key)
+    
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+    
+    def _remember(self, key, meta):
+        with self._lock:
+            self._local[key] = (time.monotonic() + min(self.get_local_timeout(), self.get_timeout()), meta)
+            self._local.move_to_end(key)
+            while len(self._local) > self.get_max_entries():
+                self._local.popitem(last=False)
+
+
+metadata_cache = StorageMetadataCache()
+
+
+def metadata_from_listing(entry):
+    """Build cache metadata from a Supabase storage list() entry"""
+    metadata = entry.get('metadata') or {}
+    return {
+        'exists': True,
+        'size': metadata.get('size', 0),
+        'content_type': metadata.get('mimetype'),
+        'etag': metadata.get('eTag'),
+        'mtime': metadata.get('lastModified') or entry.get('updated_at'),
+    }
+
+
+def metadata_from_upload(result):
+    """Build cache metadata from an upload_file_to_supabase() result"""
+    return {
+        'exists': True,
+        'size': result['size'],
+        'content_type': result['content_type'],
+        'etag': f'"{result["checksum"]}"',
+        'mtime': timezone.now().isoformat(),
+    }
@@ -0,0 +1,804 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import mock
+import httpx
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIRequestFactory
+from auth_api.models import CustomUser
+from auth_api.serializers import UserProfileSerializer
+from .storage import (
+    LocalBucket, LocalFileSystemStorage, PooledBucket, SupabaseClientRegistry, SupabaseStorage,
+    get_storage, get_storage_backend, get_storage_bucket, resolve_url, resolve_urls,
+    upload_file_to_supabase, _url_cache,
+)
+from .audit import AuditLogWriter
+from .caches import in_memory_cache
+from .checks import check_in_memory_caches, check_in_memory_caches_shared
+from .content_cache import DiskContentCache
+from .storage_cache import MISSING, StorageMetadataCache, metadata_cache
+
+
+class SupabaseClientRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = SupabaseClientRegistry()
+        self.addCleanup(self.registry.close)
+
+    def test_reuses_one_client_per_process(self):
+        first = self.registry.get('https://project.test', 'key', 'documents')
+        second = self.registry.get('https://project.test', 'key', 'documents')
+
+        self.assertIsInstance(first, PooledBucket)
+        self.assertIs(first.session, second.session)
+        self.assertEqual(self.registry.stats()['clients'], 1)
+        self.assertEqual((self.registry.hits, self.registry.misses), (1, 1))
+
+    def test_separate_client_per_bucket_and_key(self):
+        documents = self.registry.get('https://project.test', 'key', 'documents')
+        avatars = self.registry.get('https://project.test', 'key', 'avatars')
+        other_key = self.registry.get('https://project.test', 'other-key', 'documents')
+
+        self.assertIsNot(documents.session, avatars.session)
+        self.assertIsNot(documents.session, other_key.session)
+        self.assertEqual(self.registry.stats()['clients'], 3)
+
+    def test_child_process_drops_inherited_clients(self):
+        parent = self.registry.get('https://project.test', 'key', 'documents')
+
+        with mock.patch('common.storage.os.getpid', return_value=self.registry._pid + 1):
+            child = self.registry.get('https://project.test', 'key', 'documents')
+            stats = self.registry.stats()
+
+        self.assertIsNot(parent.session, child.session)
+        self.assertEqual(stats['pid'], self.registry._pid)
+        self.assertEqual((stats['clients'], stats['hits'], stats['misses']), (1, 0, 1))
+        # The parent's connections were abandoned, not closed
+        self.assertFalse(parent.session.is_closed)
+
+    def test_after_fork_resets_registry_and_lock(self):
+        parent = self.registry.get('https://project.test', 'key', 'documents')
+        self.registry._lock.acquire()
+
+        with mock.patch('common.storage.os.getpid', return_value=self.registry._pid + 1):
+            self.registry._after_fork()
+            child = self.registry.get('https://project.test', 'key', 'documents')
+
+        # A lock held by another thread at fork time must not deadlock the child
+        self.assertFalse(self.registry._lock.locked())
+        self.assertIsNot(parent.session, child.session)
+        self.assertEqual(self.registry.stats()['misses'], 1)
+
+    def test_close_closes_pooled_clients(self):
+        bucket = self.registry.get('https://project.test', 'key', 'documents')
+
+        self.registry.close()
+
+        self.assertTrue(bucket.session.is_closed)
+        self.assertEqual(self.registry.stats()['clients'], 0)
+
+
+class PooledBucketStreamingTests(TestCase):
+    def setUp(self):
+        self.requests = []
+        self.bodies = []
+
+        test = self
+
+        class RecordingTransport(httpx.BaseTransport):
+            # Unlike httpx.MockTransport, reads the request body chunk by chunk
+            def handle_request(self, request):
+                test.requests.append(request)
+                test.bodies.append(list(request.stream))
+                return httpx.Response(200, json={'Key': f"documents/{request.url.path}"})
+
+        self.session = httpx.Client(base_url='https://project.test/storage/v1', transport=RecordingTransport())
+        self.addCleanup(self.session.close)
+        self.bucket = PooledBucket('documents', self.session)
+
+    def test_upload_streams_chunks_to_public_object_endpoint(self):
+        chunks = [b'a' * 4, b'b' * 4, b'c' * 2]
+
+        self.bucket.upload_stream('blobs/ab/file.pdf', iter(chunks), 'application/pdf', 10, upsert=True)
+
+        request = self.requests[0]
+        self.assertEqual(request.method, 'POST')
+        self.assertEqual(request.url.path, '/storage/v1/object/documents/blobs/ab/file.pdf')
+        self.assertEqual(request.headers['content-type'], 'application/pdf')
+        self.assertEqual(request.headers['content-length'], '10')
+        self.assertEqual(request.headers['x-upsert'], 'true')
+        # The body went out chunk by chunk, never joined in memory
+        self.assertEqual(self.bodies[0], chunks)
+
+    @override_settings(SUPABASE_UPLOAD_CHUNK_SIZE=4)
+    def test_upload_file_streams_in_configured_chunks(self):
+        content = b'%PDF-1.4 streamed'
+        upload = ContentFile(content, name='report.pdf')
+
+        with mock.patch('common.storage.get_storage_bucket', return_value=self.bucket):
+            result = upload_file_to_supabase(upload, 'documents', path='report.pdf')
+
+        self.assertTrue(result['success'], result)
+        self.assertEqual(result['size'], len(content))
+        self.assertEqual(result['checksum'], hashlib.sha256(content).hexdigest())
+        self.assertEqual([len(chunk) for chunk in self.bodies[0]], [4, 4, 4, 4, 1])
+        self.assertEqual(b''.join(self.bodies[0]), content)
+
+    def test_upload_error_is_raised(self):
+        self.session._transport = httpx.MockTransport(lambda request: httpx.Response(409, json={}))
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            self.bucket.upload_stream('file.pdf', [b'data'], 'application/pdf')
+
+
+class LocalStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.bucket = LocalBucket('documents', root=self.root, base_url='/storage/')
+
+    def test_objects_are_sharded_by_basename_hash(self):
+        self.bucket.upload_stream('blobs/ab/report.pdf', [b'%PDF-1.4'], 'application/pdf')
+
+        digest = hashlib.md5(b'report.pdf').hexdigest()
+        relative = os.path.join('blobs', 'ab', digest[:2], digest[2:4], 'report.pdf')
+        self.assertEqual(self.bucket.relative_path('blobs/ab/report.pdf'), relative)
+        with open(os.path.join(self.root, 'documents', relative), 'rb') as stored:
+            self.assertEqual(stored.read(), b'%PDF-1.4')
+        self.assertEqual(self.bucket.get_public_url('blobs/ab/report.pdf'), f'/storage/documents/{relative}')
+
+    def test_failed_write_leaves_previous_object_and_no_temp_file(self):
+        self.bucket.upload_stream('report.pdf', [b'original'], 'application/pdf')
+
+        def broken_stream():
+            yield b'partial'
+            raise ConnectionError('client went away')
+
+        with self.assertRaises(ConnectionError):
+            self.bucket.upload_stream('report.pdf', broken_stream(), 'application/pdf')
+
+        self.assertEqual(self.bucket.download('report.pdf'), b'original')
+        self.assertEqual(os.listdir(os.path.dirname(self.bucket.path('report.pdf'))), ['report.pdf'])
+
+    def test_object_only_appears_once_fully_written(self):
+        seen = []
+
+        def stream():
+            for chunk in (b'first', b'second'):
+                seen.append(os.path.exists(self.bucket.path('report.pdf')))
+                yield chunk
+
+        self.bucket.upload_stream('report.pdf', stream(), 'application/pdf')
+
+        self.assertEqual(seen, [False, False])
+        self.assertEqual(self.bucket.download('report.pdf'), b'firstsecond')
+
+    def test_list_and_remove(self):
+        self.bucket.upload_stream('docs/a.pdf', [b'aaa'], 'application/pdf')
+        self.bucket.upload_stream('docs/b.txt', [b'bb'], 'text/plain')
+        self.bucket.upload_stream('other/c.pdf', [b'c'], 'application/pdf')
+        # Interrupted writes are never listed
+        open(os.path.join(os.path.dirname(self.bucket.path('docs/a.pdf')), 'x.pdf.tmp'), 'wb').close()
+
+        listing = self.bucket.list('docs')
+
+        self.assertEqual([entry['name'] for entry in listing], ['a.pdf', 'b.txt'])
+        self.assertEqual([entry['metadata']['size'] for entry in listing], [3, 2])
+        self.assertEqual(listing[0]['metadata']['mimetype'], 'application/pdf')
+
+        removed = self.bucket.remove(['docs/a.pdf', 'docs/missing.pdf'])
+
+        self.assertEqual(removed, [{'name': 'docs/a.pdf'}])
+        self.assertEqual([entry['name'] for entry in self.bucket.list('docs')], ['b.txt'])
+
+    def test_storage_streams_ranges_and_stats(self):
+        storage = LocalFileSystemStorage('documents', location=self.root, base_url='/storage/')
+        name = storage.save('report.pdf', ContentFile(b'0123456789', name='report.pdf'))
+
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(b''.join(storage.stream(name, 2, 5)), b'2345')
+        self.assertEqual(storage.stat(name)['size'], 10)
+        self.assertEqual(storage.stat_many([name, 'missing.pdf'])['missing.pdf'], None)
+        storage.delete(name)
+        self.assertFalse(storage.exists(name))
+
+    def test_path_traversal_is_rejected(self):
+        for name in ('../escape.pdf', '../../etc/passwd', '/etc/passwd'):
+            with self.subTest(name=name), self.assertRaises(SuspiciousFileOperation):
+                self.bucket.upload_stream(name, [b'data'], 'application/pdf')
+        with self.assertRaises(SuspiciousFileOperation):
+            self.bucket.download('../../escape.pdf')
+        with self.assertRaises(SuspiciousFileOperation):
+            self.bucket.list('../..')
+        self.assertEqual(os.listdir(self.root), [])
+
+    @override_settings(FILE_STORAGE_BACKEND='supabase', FILE_STORAGE_BUCKET_BACKENDS={'documents': 'local'})
+    def test_backend_is_chosen_per_bucket(self):
+        with override_settings(LOCAL_STORAGE_ROOT=self.root), \
+                mock.patch.dict('common.storage._local_buckets', clear=True), \
+                mock.patch.dict('common.storage._storages', clear=True), \
+                mock.patch('common.storage.client_registry.get') as registry_get:
+            self.assertEqual(get_storage_backend('documents'), 'local')
+            self.assertEqual(get_storage_backend('qr-codes'), 'supabase')
+
+            documents = get_storage_bucket('documents')
+            self.assertIsInstance(documents, LocalBucket)
+            self.assertEqual(documents.location, os.path.join(self.root, 'documents'))
+            self.assertIs(get_storage_bucket('documents'), documents)
+            self.assertIsInstance(get_storage('documents'), LocalFileSystemStorage)
+
+            self.assertIs(get_storage_bucket('qr-codes'), registry_get.return_value)
+            registry_get.assert_called_once_with(mock.ANY, mock.ANY, 'qr-codes')
+
+
+class ListingBucket:
+    """Stand-in for a Supabase bucket API serving list() from a dict of directories"""
+
+    def __init__(self, directories):
+        self.directories = directories
+        self.listed = []
+
+    def remove(self, paths):
+        for path in paths:
+            dirname, name = os.path.split(path)
+            self.directories.get(dirname, {}).pop(name, None)
+        return [{'name': path} for path in paths]
+
+    def list(self, path=None, options=None):
+        self.listed.append((path, options['offset']))
+        entries = [
+            {'id': name, 'name': name, 'updated_at': '2024-01-01T00:00:00Z',
+             'metadata': {'size': size, 'mimetype': 'application/pdf', 'eTag': f'"{name}"'}}
+            for name, size in self.directories.get(path, {}).items()
+        ]
+        # A sub-folder, which has no id
+        entries.append({'id': None, 'name': 'nested', 'metadata': None})
+        return entries[options['offset']:options['offset'] + options['limit']]
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default-tests'},
+        'storage': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'storage-meta-tests'},
+    },
+)
+class StorageMetadataCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(metadata_cache.clear_local)
+        metadata_cache.clear_local()
+        metadata_cache.cache.clear()
+        self.bucket = ListingBucket({
+            'blobs/aa': {'one.pdf': 1, 'two.pdf': 2},
+            'blobs/bb': {'three.pdf': 3},
+        })
+        registry_patch = mock.patch('common.storage.client_registry.get', return_value=self.bucket)
+        registry_patch.start()
+        self.addCleanup(registry_patch.stop)
+        self.storage = SupabaseStorage('documents')
+
+    def test_stat_many_lists_each_directory_once(self):
+        names = ['blobs/aa/one.pdf', 'blobs/aa/two.pdf', 'blobs/bb/three.pdf', 'blobs/bb/gone.pdf']
+
+        stats = self.storage.stat_many(names)
+
+        self.assertEqual(sorted(path for path, _ in self.bucket.listed), ['blobs/aa', 'blobs/bb'])
+        self.assertEqual([stats[name]['size'] if stats[name] else None for name in names], [1, 2, 3, None])
+        self.assertEqual(stats['blobs/aa/one.pdf']['etag'], '"one.pdf"')
+
+    def test_stat_many_is_answered_from_cache(self):
+        self.storage.stat_many(['blobs/aa/one.pdf', 'blobs/bb/gone.pdf'])
+        self.bucket.listed.clear()
+
+        # Names seen in a listing are cached too, and so are absent names
+        stats = self.storage.stat_many(['blobs/aa/two.pdf', 'blobs/bb/three.pdf', 'blobs/bb/gone.pdf'])
+
+        self.assertEqual(self.bucket.listed, [])
+        self.assertEqual(stats['blobs/aa/two.pdf']['size'], 2)
+        self.assertIsNone(stats['blobs/bb/gone.pdf'])
+        self.assertEqual(metadata_cache.get('documents', 'blobs/bb/gone.pdf'), MISSING)
+
+    def test_listing_follows_pagination(self):
+        self.bucket.directories['big'] = {f'{index:03d}.pdf': index for index in range(5)}
+
+        list(self.storage._list_all('big', page_size=2))
+
+        # Five files and a folder: three full pages, then an empty one
+        self.assertEqual(self.bucket.listed, [('big', 0), ('big', 2), ('big', 4), ('big', 6)])
+
+    def test_delete_reaches_other_workers(self):
+        other_worker = StorageMetadataCache(local_timeout=5)
+        self.storage.stat('blobs/aa/one.pdf')
+        self.assertEqual(other_worker.get('documents', 'blobs/aa/one.pdf')['size'], 1)
+
+        self.storage.delete('blobs/aa/one.pdf')
+
+        # Gone from the shared cache at once, from other workers' own copies
+        # once STORAGE_METADATA_CACHE_LOCAL_TTL has passed
+        self.assertIsNone(metadata_cache.cache.get(metadata_cache.make_key('documents', 'blobs/aa/one.pdf')))
+        self.assertIsNone(metadata_cache.get('documents', 'blobs/aa/one.pdf'))
+        with mock.patch('common.storage_cache.time.monotonic', return_value=time.monotonic() + 6):
+            self.assertIsNone(other_worker.get('documents', 'blobs/aa/one.pdf'))
+
+    def test_local_copy_never_outlives_shared_entry(self):
+        cache = StorageMetadataCache(timeout=1, local_timeout=60)
+        before = time.monotonic()
+
+        cache.set('documents', 'a.pdf', {'exists': True, 'size': 1})
+
+        expires, _ = cache._local[cache.make_key('documents', 'a.pdf')]
+        self.assertLessEqual(expires, time.monotonic() + 1)
+        self.assertGreater(expires, before)
+
+
+class InMemoryCacheTests(SimpleTestCase):
+    def test_database_cache_is_refused(self):
+        with override_settings(STORAGE_METADATA_CACHE_ALIAS='default'):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'DatabaseCache'):
+                metadata_cache.cache
+            self.assertEqual([error.id for error in check_in_memory_caches(None)], ['common.E001'])
+
+    def test_missing_alias_is_refused(self):
+        with override_settings(DOCUMENT_SIGNED_URL_CACHE_ALIAS='missing'):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'not in CACHES'):
+                in_memory_cache('missing', 'DOCUMENT_SIGNED_URL_CACHE_ALIAS')
+            self.assertEqual([error.id for error in check_in_memory_caches(None)], ['common.E001'])
+
+    def test_local_memory_is_accepted_with_a_deploy_warning(self):
+        self.assertEqual(check_in_memory_caches(None), [])
+        self.assertEqual(
+            [warning.id for warning in check_in_memory_caches_shared(None)], ['common.W001', 'common.W001']
+        )
+
+    @override_settings(
+        CACHES={'storage': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}},
+    )
+    def test_redis_is_accepted(self):
+        self.assertEqual(check_in_memory_caches(None) + check_in_memory_caches_shared(None), [])
+
+
+@override_settings(
+    SUPABASE_STORAGE_PUBLIC_URL='https://project.test/storage/v1/object/public/',
+    FILE_STORAGE_BACKEND='supabase',
+    FILE_STORAGE_BUCKET_BACKENDS={},
+)
+class ResolveURLTests(SimpleTestCase):
+    def test_supabase_urls_are_built_locally(self):
+        with mock.patch('common.storage.client_registry.get') as registry_get:
+            url = resolve_url('documents', 'blobs/ab/report.pdf')
+
+        self.assertEqual(url, 'https://project.test/storage/v1/object/public/documents/blobs/ab/report.pdf')
+        registry_get.assert_not_called()
+        self.assertIsNone(resolve_url('documents', ''))
+        self.assertIsNone(resolve_url('documents', None))
+
+    def test_local_urls_are_sharded(self):
+        with override_settings(FILE_STORAGE_BUCKET_BACKENDS={'documents': 'local'}, LOCAL_STORAGE_URL='/files/'):
+            url = resolve_url('documents', 'report.pdf')
+
+        digest = hashlib.md5(b'report.pdf').hexdigest()
+        self.assertEqual(url, f'/files/documents/{digest[:2]}/{digest[2:4]}/report.pdf')
+
+    def test_urls_are_memoised(self):
+        resolve_url('documents', 'memo.pdf')
+        hits = _url_cache().cache_info().hits
+
+        resolve_url('documents', 'memo.pdf')
+
+        self.assertEqual(_url_cache().cache_info().hits, hits + 1)
+
+    def test_changed_settings_clear_memoised_urls(self):
+        before = resolve_url('documents', 'report.pdf')
+
+        with override_settings(SUPABASE_STORAGE_PUBLIC_URL='https://cdn.test/'):
+            during = resolve_url('documents', 'report.pdf')
+
+        self.assertEqual(during, 'https://cdn.test/documents/report.pdf')
+        self.assertEqual(resolve_url('documents', 'report.pdf'), before)
+
+    def test_cache_size_is_read_from_settings_on_use(self):
+        with override_settings(STORAGE_URL_CACHE_SIZE=2):
+            for index in range(5):
+                resolve_url('documents', f'{index}.pdf')
+            info = _url_cache().cache_info()
+
+        self.assertEqual((info.maxsize, info.currsize), (2, 2))
+        self.assertEqual(_url_cache().cache_info().maxsize, 4096)
+
+    def test_resolve_urls_skips_empty_names(self):
+        urls = resolve_urls('avatars', ['a.png', '', None, 'b.png'])
+
+        self.assertEqual(urls, {
+            'a.png': 'https://project.test/storage/v1/object/public/avatars/a.png',
+            'b.png': 'https://project.test/storage/v1/object/public/avatars/b.png',
+        })
+
+    def test_list_serializer_resolves_page_in_one_batch(self):
+        users = [
+            CustomUser(username=f'user{index}', email=f'user{index}@example.com', profile_picture=picture)
+            for index, picture in enumerate(['one.png', '', 'two.png'])
+        ]
+        request = APIRequestFactory().get('/api/v1/auth/users/')
+
+        with mock.patch('common.serializers.resolve_urls', wraps=resolve_urls) as batch, \
+                mock.patch('common.serializers.resolve_url', wraps=resolve_url) as single:
+            data = UserProfileSerializer(users, many=True, context={'request': request}).data
+
+        batch.assert_called_once_with('profile-images', ['one.png', 'two.png'])
+        single.assert_not_called()
+        self.assertEqual([item['profile_picture'] for item in data], [
+            'https://project.test/storage/v1/object/public/profile-images/one.png',
+            None,
+            'https://project.test/storage/v1/object/public/profile-images/two.png',
+        ])
+
+    def test_single_item_is_resolved_with_absolute_url(self):
+        user = CustomUser(username='user', email='user@example.com', profile_picture='one.png')
+        request = APIRequestFactory().get('/api/v1/auth/profile/')
+
+        with override_settings(FILE_STORAGE_BUCKET_BACKENDS={'profile-images': 'local'}, LOCAL_STORAGE_URL='/files/'):
+            data = UserProfileSerializer(user, context={'request': request}).data
+
+        self.assertTrue(data['profile_picture'].startswith('http://testserver/files/profile-images/'))
+
+
+@override_settings(CONTENT_CACHE_STATS_INTERVAL=3600)
+class DiskContentCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.cache = DiskContentCache(root=self.root, max_size=400)
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, filename), self.root)
+            for dirpath, _, filenames in os.walk(self.root) for filename in filenames
+        )
+
+    def fill(self, name, content):
+        return b''.join(self.cache.stream('documents', name, 'hash', len(content), [content]))
+
+    def test_miss_is_streamed_while_filling(self):
+        pulled = []
+
+        def storage_stream():
+            for chunk in (b'aaaa', b'bbbb', b'cc'):
+                pulled.append(chunk)
+                yield chunk
+
+        stream = self.cache.stream('documents', 'report.pdf', 'hash', 10, storage_stream())
+
+        self.assertEqual(next(stream), b'aaaa')
+        # The client has the first chunk before the rest was read from storage
+        self.assertEqual(pulled, [b'aaaa'])
+        self.assertIsNone(self.cache.get('documents', 'report.pdf', 'hash'))
+        self.assertEqual(b''.join(stream), b'bbbbcc')
+
+        path = self.cache.get('documents', 'report.pdf', 'hash')
+        with open(path, 'rb') as cached:
+            self.assertEqual(cached.read(), b'aaaabbbbcc')
+        self.assertEqual(self.cache.current_size(), 10)
+
+    def test_abandoned_stream_caches_nothing(self):
+        stream = self.cache.stream('documents', 'report.pdf', 'hash', 10, iter([b'aaaa', b'bbbb', b'cc']))
+        next(stream)
+
+        stream.close()
+
+        self.assertIsNone(self.cache.get('documents', 'report.pdf', 'hash'))
+        self.assertEqual(self.files(), [])
+
+    def storage_stream(self, chunks, released=None):
+        """Storage download that records when it is opened, and waits for released between chunks"""
+        self.downloads.append(chunks)
+        for chunk in chunks:
+            if released:
+                self.assertTrue(released.acquire(timeout=5))
+            yield chunk
+
+    def test_concurrent_misses_read_the_fill_instead_of_storage(self):
+        self.downloads = []
+        released = threading.Semaphore(0)
+        fill = self.cache.stream(
+            'documents', 'report.pdf', 'hash', 6, self.storage_stream([b'aa', b'bb', b'cc'], released)
+        )
+        released.release()
+        self.assertEqual(next(fill), b'aa')
+
+        results = []
+        followers = [
+            threading.Thread(target=lambda: results.append(b''.join(self.cache.stream(
+                'documents', 'report.pdf', 'hash', 6, self.storage_stream([b'from storage'])
+            ))))
+            for _ in range(3)
+        ]
+        for follower in followers:
+            follower.start()
+        released.release()
+        released.release()
+        self.assertEqual(b''.join(fill), b'bbcc')
+        for follower in followers:
+            follower.join(5)
+
+        self.assertEqual(results, [b'aabbcc'] * 3)
+        # Only the fill went to storage
+        self.assertEqual(self.downloads, [[b'aa', b'bb', b'cc']])
+        self.assertEqual(self.cache.current_size(), 6)
+
+    def test_follower_finishes_from_storage_when_fill_is_abandoned(self):
+        self.downloads = []
+        fill = self.cache.stream('documents', 'report.pdf', 'hash', 6, iter([b'aa', b'bb', b'cc']))
+        next(fill)
+        follower = self.cache.stream('documents', 'report.pdf', 'hash', 6, self.storage_stream([b'aab', b'bcc']))
+        self.assertEqual(next(follower), b'aa')
+
+        fill.close()
+
+        self.assertEqual(b''.join(follower), b'bbcc')
+        self.assertEqual(len(self.downloads), 1)
+        self.assertIsNone(self.cache.get('documents', 'report.pdf', 'hash'))
+
+    @override_settings(CONTENT_CACHE_FILL_WAIT=0)
+    def test_follower_of_a_stalled_fill_goes_to_storage(self):
+        fill = self.cache.stream('documents', 'report.pdf', 'hash', 6, iter([b'aa', b'bb', b'cc']))
+        next(fill)
+
+        follower = b''.join(self.cache.stream('documents', 'report.pdf', 'hash', 6, iter([b'aabbcc'])))
+
+        self.assertEqual(follower, b'aabbcc')
+        self.assertEqual(b''.join(fill), b'bbcc')
+
+    def test_entries_have_their_own_locks(self):
+        fill = self.cache.stream('documents', 'a.pdf', 'hash', 2, iter([b'a', b'a']))
+        next(fill)
+
+        # Another entry is filled, not passed through or made to wait
+        self.fill('b.pdf', b'bb')
+
+        self.assertTrue(self.cache.get('documents', 'b.pdf', 'hash'))
+        fill.close()
+
+    def test_oversized_files_pass_through(self):
+        self.assertEqual(self.fill('big.pdf', b'x' * 101), b'x' * 101)
+        self.assertIsNone(self.cache.lookup('documents', 'big.pdf', 'hash', 101))
+        self.assertEqual(self.files(), [])
+
+    def test_size_is_a_running_total(self):
+        self.fill('a.pdf', b'a' * 50)
+
+        with mock.patch.object(DiskContentCache, '_entries', side_effect=AssertionError('rescanned')):
+            self.fill('b.pdf', b'b' * 60)
+            self.cache.lookup('documents', 'a.pdf', 'hash', 50)
+            self.assertEqual(self.cache.current_size(), 110)
+
+        self.assertEqual(self.cache.current_size(rescan=True), 110)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for name in ('a.pdf', 'b.pdf', 'c.pdf', 'd.pdf'):
+            self.fill(name, b'x' * 100)
+        self.cache.lookup('documents', 'a.pdf', 'hash', 100)
+
+        self.fill('e.pdf', b'x' * 100)
+
+        cached = [name for name in 'abcde' if self.cache.get('documents', f'{name}.pdf', 'hash')]
+        self.assertEqual(cached, ['a', 'd', 'e'])
+        self.assertEqual(self.cache.current_size(), 300)
+        self.assertEqual(self.cache.stats()['evictions'], 2)
+
+    def test_eviction_removes_entries_with_their_lock_files(self):
+        self.fill('a.pdf', b'a' * 50)
+        self.fill('b.pdf', b'b' * 50)
+        self.assertEqual(len([name for name in self.files() if name.endswith('.lock')]), 2)
+
+        self.cache.clear()
+
+        self.assertEqual(self.files(), [])
+        self.assertEqual(self.cache.current_size(), 0)
+
+    def test_waiter_on_a_removed_lock_file_locks_the_new_one(self):
+        path = self.cache.path_for('documents', 'a.pdf', 'hash')
+        os.makedirs(os.path.dirname(path))
+        locked = []
+        with self.cache._entry_lock(path):
+            # Another process opens the lock file and waits for it
+            waiter = threading.Thread(target=lambda: locked.append(self.cache._lock_file(path, blocking=True)))
+            waiter.start()
+            waiter.join(0.1)
+            self.assertTrue(waiter.is_alive())
+            # The entry is evicted and its lock file removed
+            self.cache._remove_lock_file(path)
+        waiter.join(5)
+
+        lock_file = locked[0]
+        self.addCleanup(lock_file.close)
+        self.assertEqual(os.fstat(lock_file.fileno()).st_ino, os.stat(self.cache.lock_path_for(path)).st_ino)
+
+    def test_entries_filled_by_another_worker_are_adopted_on_hit(self):
+        other_worker = DiskContentCache(root=self.root, max_size=400)
+        self.cache.current_size()
+        b''.join(other_worker.stream('documents', 'a.pdf', 'hash', 80, [b'a' * 80]))
+
+        self.assertTrue(self.cache.lookup('documents', 'a.pdf', 'hash', 80))
+        self.assertEqual(self.cache.current_size(), 80)
+
+    def test_fetch_fills_before_returning_path(self):
+        path = self.cache.fetch('documents', 'a.pdf', 'hash', 0, lambda: [b'rendered'])
+
+        with open(path, 'rb') as cached:
+            self.assertEqual(cached.read(), b'rendered')
+        self.assertEqual(self.cache.fetch('documents', 'a.pdf', 'hash', 0, lambda: self.fail('refetched')), path)
+        self.assertEqual((self.cache.stats()['misses'], self.cache.stats()['hits']), (1, 1))
+
+
+class FakeRecordManager:
+    """Audit manager whose batch insert fails if any record in it is bad"""
+
+    def __init__(self):
+        self.batches = []
+
+    def write_batch(self, instances):
+        if any(instance.bad for instance in instances):
+            raise ValueError('bad record')
+        self.batches.append([instance.id for instance in instances])
+
+
+class FakeRecord:
+    _meta = SimpleNamespace(label='common.FakeRecord')
+    _default_manager = None
+
+    def __init__(self, id, bad=False):
+        self.id = id
+        self.bad = bad
+
+
+@override_settings(AUDIT_LOG_MODE='async', AUDIT_BATCH_SIZE=3, AUDIT_FLUSH_INTERVAL=60, AUDIT_QUEUE_SIZE=100)
+class AuditLogWriterTests(SimpleTestCase):
+    def setUp(self):
+        self.writer = AuditLogWriter()
+        self.addCleanup(self.writer.close)
+        self.batches = []
+        self.written = threading.Condition()
+        self.release = threading.Event()
+        self.release.set()
+        self.writer.write = self.record_write
+
+    def record_write(self, instances):
+        if threading.current_thread().name == 'audit-writer':
+            self.release.wait(5)
+        with self.written:
+            self.batches.append((threading.current_thread().name, [instance.id for instance in instances]))
+            self.written.notify_all()
+
+    def wait_for(self, count):
+        with self.written:
+            self.assertTrue(self.written.wait_for(lambda: len(self.batches) >= count, timeout=5), self.batches)
+
+    def test_sync_mode_writes_inline(self):
+        with override_settings(AUDIT_LOG_MODE='sync'):
+            self.writer.submit(FakeRecord(1))
+
+        self.assertEqual(self.batches, [('MainThread', [1])])
+        self.assertIsNone(self.writer._thread)
+
+    def test_records_are_written_by_background_thread(self):
+        for index in range(3):
+            self.writer.submit(FakeRecord(index))
+
+        self.wait_for(1)
+        self.assertEqual(self.batches, [('audit-writer', [0, 1, 2])])
+        self.assertEqual(self.writer.stats['queued'], 3)
+
+    def test_batches_are_cut_at_batch_size(self):
+        for index in range(7):
+            self.writer.submit(FakeRecord(index))
+
+        self.wait_for(2)
+        self.assertEqual([ids for _, ids in self.batches], [[0, 1, 2], [3, 4, 5]])
+
+        # The rest waits for the flush interval, or for close()
+        self.writer.close()
+        self.assertEqual([ids for _, ids in self.batches], [[0, 1, 2], [3, 4, 5], [6]])
+
+    @override_settings(AUDIT_BATCH_SIZE=100, AUDIT_FLUSH_INTERVAL=0.05)
+    def test_partial_batch_is_written_after_flush_interval(self):
+        self.writer.submit(FakeRecord(1))
+        self.writer.submit(FakeRecord(2))
+
+        self.wait_for(1)
+        self.assertEqual(self.batches, [('audit-writer', [1, 2])])
+        self.assertTrue(self.writer._thread.is_alive())
+
+    def fill_queue(self):
+        """Hold the writer thread in a write and fill the one-slot queue behind it"""
+        self.release.clear()
+        self.writer.submit(FakeRecord('in flight'))
+        for _ in range(100):
+            if self.writer._queue.empty():
+                break
+            threading.Event().wait(0.01)
+        self.writer.submit(FakeRecord('queued'))
+        self.assertTrue(self.writer._queue.full())
+
+    @override_settings(AUDIT_BATCH_SIZE=1, AUDIT_QUEUE_SIZE=1, AUDIT_OVERFLOW='sync')
+    def test_overflow_sync_writes_inline(self):
+        self.fill_queue()
+
+        self.writer.submit(FakeRecord('overflow'))
+
+        self.assertEqual(self.batches, [('MainThread', ['overflow'])])
+        self.release.set()
+
+    @override_settings(AUDIT_BATCH_SIZE=1, AUDIT_QUEUE_SIZE=1, AUDIT_OVERFLOW='drop')
+    def test_overflow_drop_discards(self):
+        self.fill_queue()
+
+        with self.assertLogs('common.audit', 'WARNING'):
+            self.writer.submit(FakeRecord('overflow'))
+        self.release.set()
+        self.writer.close()
+
+        self.assertEqual([ids for _, ids in self.batches], [['in flight'], ['queued']])
+        self.assertEqual(self.writer.stats['dropped'], 1)
+
+    @override_settings(AUDIT_BATCH_SIZE=1, AUDIT_QUEUE_SIZE=1, AUDIT_OVERFLOW='block')
+    def test_overflow_block_waits_for_room(self):
+        self.fill_queue()
+
+        submitter = threading.Thread(target=self.writer.submit, args=(FakeRecord('overflow'),))
+        submitter.start()
+        submitter.join(0.1)
+        self.assertTrue(submitter.is_alive())
+        self.assertEqual(self.batches, [])
+
+        self.release.set()
+        submitter.join(5)
+        self.assertFalse(submitter.is_alive())
+        self.writer.close()
+        self.assertEqual([ids for _, ids in self.batches], [['in flight'], ['queued'], ['overflow']])
+
+    def test_close_writes_queued_records_and_stops_thread(self):
+        self.writer.submit(FakeRecord(1))
+        thread = self.writer._thread
+
+        self.writer.close()
+
+        self.assertEqual([ids for _, ids in self.batches], [[1]])
+        self.assertFalse(thread.is_alive())
+
+    def test_flush_after_thread_stopped_writes_leftovers(self):
+        self.writer.submit(FakeRecord(1))
+        self.writer.close()
+        # Records queued after the thread stopped are written on the next flush
+        self.writer._queue.put_nowait(FakeRecord(2))
+
+        self.writer.flush()
+
+        self.assertEqual([ids for _, ids in self.batches], [[1], [2]])
+
+
+class AuditLogWriterFallbackTests(TestCase):
+    def test_failed_batch_is_retried_one_by_one(self):
+        writer = AuditLogWriter()
+        manager = FakeRecordManager()
+        records = [FakeRecord(1), FakeRecord(2, bad=True), FakeRecord(3)]
+
+        with mock.patch.object(FakeRecord, '_default_manager', manager), \
+                self.assertLogs('common.audit', 'ERROR'):
+            writer.write(records)
+
+        self.assertEqual(manager.batches, [[1], [3]])
+        self.assertEqual((writer.stats['written'], writer.stats['failed']), (2, 1))
+
+    def test_good_batch_is_written_at_once(self):
+        writer = AuditLogWriter()
+        manager = FakeRecordManager()
+
+        with mock.patch.object(FakeRecord, '_default_manager', manager):
+            writer.write([FakeRecord(1), FakeRecord(2)])
+
+        self.assertEqual(manager.batches, [[1, 2]])
+        self.assertEqual(writer.stats['flushes'], 1)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     DocumentCategory, Document, DocumentAccess, DocumentAccessLog,
-    DocumentShare, DocumentRequest
+    DocumentShare, DocumentRequest, UploadSession
 )
 
 
@@ -27,11 +27,11 @@ class DocumentAdmin(admin.ModelAdmin):
     list_filter = ('trust_level', 'status', 'category', 'is_encrypted', 'created_at')
     search_fields = ('title', 'description', 'owner__email', 'owner__full_name')
     ordering = ('-created_at',)
-    readonly_fields = ('id', 'file_size', 'file_type', 'download_count', 'view_count', 'is_expired', 'created_at', 'updated_at')
+    readonly_fields = ('id', 'file_size', 'file_type', 'file_content_type', 'file_checksum', 'download_count', 'view_count', 'is_expired', 'created_at', 'updated_at')
     
     fieldsets = (
         ('Basic Info', {'fields': ('id', 'title', 'description', 'owner')}),
-        ('File Info', {'fields': ('file', 'file_size', 'file_type', 'original_filename')}),
+        ('File Info', {'fields': ('file', 'file_size', 'file_type', 'file_content_type', 'file_checksum', 'original_filename')}),
         ('Classification', {'fields': ('category', 'trust_level', 'issuer', 'issue_date')}),
         ('Status', {'fields': ('status', 'is_encrypted', 'encryption_key_hash')}),
         ('Metadata', {'fields': ('tags', 'metadata', 'expiry_date', 'version', 'parent_document')}),
@@ -39,14 +39,6 @@ class DocumentAdmin(admin.ModelAdmin):
         ('Timestamps', {'fields': ('created_at', 'updated_at')}),
     )
     
-    def download_count(self, obj):
-        return obj.download_count
-    download_count.short_description = 'Downloads'
-    
-    def view_count(self, obj):
-        return obj.view_count
-    view_count.short_description = 'Views'
-    
     def is_expired(self, obj):
         return obj.is_expired
     is_expired.boolean = True
@@ -119,3 +111,20 @@ class DocumentRequestAdmin(admin.ModelAdmin):
     )
     
     readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'owner', 'total_size', 'status', 'expires_at', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('filename', 'title', 'owner__email')
+    ordering = ('-created_at',)
+    
+    fieldsets = (
+        ('Upload Info', {'fields': ('owner', 'filename', 'content_type', 'total_size', 'part_size')}),
+        ('Document', {'fields': ('title', 'document')}),
+        ('Status', {'fields': ('status', 'expires_at')}),
+        ('Timestamps', {'fields': ('created_at', 'updated_at')}),
+    )
+    
+    readonly_fields = ('created_at', 'updated_at')
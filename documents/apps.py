@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class DocumentsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "documents"
+
+    def ready(self):
+        from .models import Document
+        from .stats import invalidate_owner_stats
+
+        post_save.connect(invalidate_owner_stats, sender=Document, dispatch_uid="document_stats_on_save")
+        post_delete.connect(invalidate_owner_stats, sender=Document, dispatch_uid="document_stats_on_delete")
@@ -0,0 +1,307 @@
+"""
+Document download responses: signed URLs and transfers offloaded to nginx
+"""
+import os
+import sys
+import time
+import hashlib
+import mimetypes
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from common.caches import in_memory_cache
+from common.content_cache import content_cache, iter_file_range
+
+
+def get_download_permission(document, user):
+    """Permission the user holds on the document ('owner' for its owner)"""
+    if document.owner_id == user.id:
+        return 'owner'
+    permission = document.access_permissions.filter(user=user).values_list(
+        'permission', flat=True
+    ).first()
+    return permission or 'view'
+
+
+def signed_url_cache_key(document, permission):
+    # The file name is part of the key so a replaced file never reuses a
+    # URL signed for the old object
+    digest = hashlib.sha1(document.file.name.encode()).hexdigest()[:16]
+    return f"document-signed-url:{document.pk}:{permission}:{digest}"
+
+
+def can_sign_urls(document):
+    """Whether the document's storage can hand its file out as a signed URL"""
+    return getattr(document.file.storage, 'supports_signed_urls', False)
+
+
+def get_signed_download_url(document, permission):
+    """
+    Get a signed, expiring download URL for a document.
+    
+    URLs are cached per (document, permission) in the in-memory
+    DOCUMENT_SIGNED_URL_CACHE_ALIAS cache and reused until they are within
+    DOCUMENT_SIGNED_URL_REFRESH_MARGIN seconds of expiring, so
+    repeated downloads do not each ask the object store to sign a URL.
+    
+    Requires can_sign_urls(document) to be true: only storages that support
+    signed URLs have a signed_url() method.
+    
+    Returns:
+        tuple: (url, expires_at unix timestamp)
+    """
+    cache = in_memory_cache(settings.DOCUMENT_SIGNED_URL_CACHE_ALIAS, 'DOCUMENT_SIGNED_URL_CACHE_ALIAS')
+    key = signed_url_cache_key(document, permission)
+    entry = cache.get(key)
+    if entry:
+        return entry['url'], entry['expires_at']
+    
+    ttl = settings.DOCUMENT_SIGNED_URL_TTL
+    url = document.file.storage.signed_url(
+        document.file.name, ttl, download=document.original_filename or True
+    )
+    expires_at = time.time() + ttl
+    reuse_for = ttl - settings.DOCUMENT_SIGNED_URL_REFRESH_MARGIN
+    if reuse_for > 0:
+        cache.set(key, {'url': url, 'expires_at': expires_at}, reuse_for)
+    return url, expires_at
+
+
+def get_accel_locations():
+    """(filesystem root, internal nginx location) pairs files can be offloaded from"""
+    return [
+        (str(settings.LOCAL_STORAGE_ROOT), settings.DOWNLOAD_ACCEL_STORAGE_URL),
+        (str(settings.CONTENT_CACHE_ROOT), settings.DOWNLOAD_ACCEL_CACHE_URL),
+    ]
+
+
+def get_accel_uri(path):
+    """Internal X-Accel-Redirect URI for a file path, or None if nginx cannot reach it"""
+    path = os.path.realpath(path)
+    for root, location in get_accel_locations():
+        root = os.path.realpath(root)
+        if path.startswith(root + os.sep):
+            return location + quote(os.path.relpath(path, root).replace(os.sep, '/'))
+    return None
+
+
+def get_local_path(document):
+    """Filesystem path of a document's file, or None if it is not stored locally"""
+    try:
+        path = document.file.path
+    except (NotImplementedError, ValueError):
+        return None
+    return path if os.path.exists(path) else None
+
+
+def offloaded_response(path, filename, content_type):
+    """
+    Response that hands the file transfer to the front-end web server.
+    
+    Django only sends headers; nginx (X-Accel-Redirect) or Apache/lighttpd
+    (X-Sendfile) streams the bytes from disk, depending on DOWNLOAD_OFFLOAD.
+    
+    Returns:
+        HttpResponse, or None if the file cannot be offloaded
+    """
+    mode = settings.DOWNLOAD_OFFLOAD
+    if mode == 'x-accel':
+        uri = get_accel_uri(path)
+        if uri is None:
+            return None
+        header = ('X-Accel-Redirect', uri)
+    elif mode == 'x-sendfile':
+        header = ('X-Sendfile', os.path.realpath(path))
+    else:
+        return None
+    
+    response = HttpResponse(content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response[header[0]] = header[1]
+    return response
+
+
+def file_response(file, filename, content_type=None, path=None):
+    """
+    Download response for a file, offloaded to the web server when it is on
+    local disk and DOWNLOAD_OFFLOAD is enabled, streamed by Django otherwise.
+    """
+    content_type = content_type or mimetypes.guess_type(filename or '')[0] or 'application/octet-stream'
+    if path:
+        response = offloaded_response(path, filename, content_type)
+        if response is not None:
+            return response
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=content_type)
+
+
+def get_document_validators(document):
+    """
+    Strong ETag and Last-Modified timestamp of a document's file.
+    
+    The ETag is the content hash recorded at upload time; files stored
+    before hashes were recorded fall back to a hash of their storage name,
+    which is unique per upload.
+    """
+    digest = document.file_checksum or hashlib.sha256(document.file.name.encode()).hexdigest()
+    return f'"{digest}"', int(document.updated_at.timestamp())
+
+
+def set_validator_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified_response(request, document):
+    """
+    Answer a conditional request from the stored validators alone.
+    
+    Returns:
+        HttpResponse: 304 Not Modified or 412 Precondition Failed, or None if
+        the file has to be sent
+    """
+    etag, last_modified = get_document_validators(document)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validator_headers(response, etag, last_modified)
+    return response
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range "bytes=" Range header.
+    
+    Multiple ranges are not supported; like an absent or malformed header
+    they yield None and the whole file is sent.
+    
+    Returns:
+        tuple: (start, end) inclusive, None to send the whole file, or False
+        if the range cannot be satisfied
+    """
+    unit, _, ranges = (header or '').partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+    first, _, last = ranges.strip().partition('-')
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def range_applies(request, etag, last_modified):
+    """Whether a Range header should be honoured, checking If-Range if present"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def is_initial_fetch(request):
+    """
+    Whether the request asks for the file from its first byte, i.e. it has
+    no Range header or one starting at 0, rather than continuing a download.
+    """
+    header = request.headers.get('Range')
+    if not header:
+        return True
+    byte_range = parse_range(header, sys.maxsize)
+    return not byte_range or byte_range[0] == 0
+
+
+def get_cached_path(document, size):
+    """
+    Path of a document's file in the local content cache, or None on a miss,
+    when the cache is disabled or when the file is too large for it
+    """
+    return content_cache.lookup(
+        document.file.field.bucket_name,
+        document.file.name,
+        get_document_validators(document)[0].strip('"'),
+        size,
+    )
+
+
+def cached_stream(document, size):
+    """Stream a document's file from storage, filling the content cache with it on the way"""
+    return content_cache.stream(
+        document.file.field.bucket_name,
+        document.file.name,
+        get_document_validators(document)[0].strip('"'),
+        size,
+        document.file.storage.stream(document.file.name),
+    )
+
+
+def document_file_response(document, request=None):
+    """
+    Download response for a document's file.
+    
+    Files on local disk (local storage, or the read-through content cache in
+    front of remote storage) are handed to the web server when
+    DOWNLOAD_OFFLOAD is enabled, or sent from disk by Django. Anything else
+    is streamed from storage, filling the content cache as it is sent.
+    Single-range Range/If-Range requests are answered with 206 Partial
+    Content.
+    """
+    filename = document.original_filename
+    content_type = document.file_content_type or mimetypes.guess_type(filename or '')[0] or 'application/octet-stream'
+    etag, last_modified = get_document_validators(document)
+    
+    size = document.file_size or document.file.size
+    path = get_local_path(document) or get_cached_path(document, size)
+    if path:
+        response = offloaded_response(path, filename, content_type)
+        if response is not None:
+            return set_validator_headers(response, etag, last_modified)
+    
+    start, end = 0, size - 1
+    status = 200
+    if request is not None and request.headers.get('Range') and size and range_applies(request, etag, last_modified):
+        byte_range = parse_range(request.headers['Range'], size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range:
+            start, end = byte_range
+            status = 206
+    
+    if not size:
+        stream = iter(())
+    elif path and status == 206:
+        stream = iter_file_range(path, start, end)
+    elif path:
+        # Whole files from disk go through FileResponse so the WSGI server
+        # can use sendfile
+        response = FileResponse(
+            open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type
+        )
+        response['Accept-Ranges'] = 'bytes'
+        return set_validator_headers(response, etag, last_modified)
+    elif status == 206:
+        stream = document.file.storage.stream(document.file.name, start, end)
+    else:
+        stream = cached_stream(document, size)
+    response = StreamingHttpResponse(stream, status=status, content_type=content_type)
+    response['Content-Length'] = str(end - start + 1 if size else 0)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return set_validator_headers(response, etag, last_modified)
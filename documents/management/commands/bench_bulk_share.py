@@ -0,0 +1,100 @@
+"""
+Benchmark sharing many documents with many users.
+
+A throwaway test database is seeded with one owner's documents and a set of
+recipients, then every document is shared with every recipient, once with
+the previous per-pair loop (a user lookup and an INSERT per pair) and once
+with documents.shares.share_documents().
+"""
+import os
+import time
+import tempfile
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+from auth_api.models import CustomUser
+from documents.models import Document, DocumentShare
+from documents.shares import share_documents
+from sharing.models import ShareNotification
+
+
+def share_pairwise(owner, document_ids, user_ids):
+    """The previous BulkShareView loop"""
+    shared = 0
+    for document in Document.objects.filter(id__in=document_ids, owner=owner):
+        for user_id in user_ids:
+            try:
+                target_user = CustomUser.objects.get(id=user_id)
+                DocumentShare.objects.create(document=document, shared_by=owner, shared_with=target_user)
+                shared += 1
+            except CustomUser.DoesNotExist:
+                continue
+    return shared
+
+
+def share_in_bulk(owner, document_ids, user_ids):
+    return sum(result['status'] == 'shared' for result in share_documents(owner, document_ids, user_ids))
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput of per-pair and bulk document sharing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=50)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=1)
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # A file, so commits pay for the disk like they would in production
+            test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'bench_bulk_share.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            owner, document_ids, user_ids = self.seed(options['documents'], options['users'])
+            pairs = len(document_ids) * len(user_ids)
+            self.stdout.write(f'{pairs} pairs per run')
+            self.stdout.write(f"{'method':>10} {'best':>9} {'pairs/s':>10} {'queries':>8}")
+            for label, share in (('per-pair', share_pairwise), ('bulk', share_in_bulk)):
+                timings = []
+                for _ in range(options['repeat']):
+                    DocumentShare.objects.all().delete()
+                    ShareNotification.objects.all().delete()
+                    queries = QueryCounter()
+                    with connection.execute_wrapper(queries):
+                        started = time.perf_counter()
+                        # Outside a transaction, like a request: every INSERT of the loop commits
+                        shared = share(owner, document_ids, user_ids)
+                        timings.append(time.perf_counter() - started)
+                    assert shared == pairs, shared
+                best = min(timings)
+                self.stdout.write(f'{label:>10} {best * 1000:>7.0f}ms {pairs / best:>10.0f} {queries.count:>8}')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, documents, users):
+        with transaction.atomic():
+            people = CustomUser.objects.bulk_create([
+                CustomUser(
+                    username=f'bench{index}', email=f'bench{index}@example.com',
+                    vault_id=f'bench{index}@vault', full_name=f'Bench {index}', password='!',
+                )
+                for index in range(users + 1)
+            ])
+            owner, recipients = people[0], people[1:]
+            created = Document.objects.bulk_create([
+                Document(
+                    title=f'Document {index}', owner=owner,
+                    file=f'blobs/bench/{index}.pdf', original_filename=f'{index}.pdf',
+                )
+                for index in range(documents)
+            ])
+        return owner, [document.pk for document in created], [recipient.pk for recipient in recipients]
@@ -0,0 +1,131 @@
+"""
+Benchmark the document visibility query behind DocumentViewSet.list.
+
+A throwaway test database is seeded with documents spread over users and
+random access grants, then a first page and the page count are fetched for
+a sample of users with the previous OR-join + DISTINCT query and with the
+UNION-based Document.objects.visible_to().
+"""
+import os
+import time
+import uuid
+import random
+import tempfile
+import statistics
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Q
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from auth_api.models import CustomUser
+from documents.models import Document, DocumentAccess
+
+BATCH_SIZE = 10000
+
+
+def or_join_queryset(user):
+    """The previous visibility query"""
+    return Document.objects.filter(Q(owner=user) | Q(access_permissions__user=user)).distinct()
+
+
+def union_queryset(user):
+    return Document.objects.visible_to(user)
+
+
+class Command(BaseCommand):
+    help = 'Compare document list latency of the OR-join + DISTINCT and UNION visibility queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=1_000_000)
+        parser.add_argument('--grants', type=int, default=5_000_000)
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--samples', type=int, default=50, help='Users timed per query')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # An in-memory database of this size would not fit comfortably
+            test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'bench_document_visibility.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            rng = random.Random(options['seed'])
+            started = time.perf_counter()
+            users = self.seed(rng, options)
+            self.stdout.write(f'Seeded in {time.perf_counter() - started:.0f}s')
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            sample = rng.sample(users, min(options['samples'], len(users)))
+            self.stdout.write(f"{'query':>10} {'page p50':>10} {'page p95':>10} {'count p50':>10} {'count p95':>10}")
+            for label, build in (('or-join', or_join_queryset), ('union', union_queryset)):
+                self.report(label, build, sample, options['page_size'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, rng, options):
+        for offset in range(0, options['users'], BATCH_SIZE):
+            batch = [
+                CustomUser(
+                    username=f'bench{index}', email=f'bench{index}@example.com',
+                    vault_id=f'bench{index}@vault', full_name=f'Bench {index}', password='!',
+                )
+                for index in range(offset, min(offset + BATCH_SIZE, options['users']))
+            ]
+            CustomUser.objects.bulk_create(batch)
+        user_ids = list(CustomUser.objects.order_by('pk').values_list('pk', flat=True))
+
+        now = timezone.now()
+        document_ids = []
+        for offset in range(0, options['documents'], BATCH_SIZE):
+            batch = []
+            for index in range(offset, min(offset + BATCH_SIZE, options['documents'])):
+                document = Document(
+                    id=uuid.UUID(int=rng.getrandbits(128)), title=f'Document {index}',
+                    file=f'blobs/bench/{index}.pdf', original_filename=f'{index}.pdf',
+                    owner_id=rng.choice(user_ids), tags=['bench', 'seed'], metadata={'index': index},
+                )
+                batch.append(document)
+                document_ids.append(document.id)
+            Document.objects.bulk_create(batch)
+        # created_at is auto_now_add; spread it out so ordering is meaningful
+        with connection.cursor() as cursor:
+            table = Document._meta.db_table
+            for offset in range(0, len(document_ids), BATCH_SIZE):
+                cursor.executemany(
+                    f'UPDATE {table} SET created_at = %s WHERE id = %s',
+                    [
+                        (now - timedelta(minutes=rng.randrange(525600)), Document._meta.pk.get_db_prep_value(pk, connection))
+                        for pk in document_ids[offset:offset + BATCH_SIZE]
+                    ],
+                )
+
+        # Random pairs; the few duplicates are skipped by the unique constraint
+        for offset in range(0, options['grants'], BATCH_SIZE):
+            batch = [
+                DocumentAccess(document_id=rng.choice(document_ids), user_id=rng.choice(user_ids))
+                for _ in range(min(BATCH_SIZE, options['grants'] - offset))
+            ]
+            DocumentAccess.objects.bulk_create(batch, ignore_conflicts=True)
+        return user_ids
+
+    def report(self, label, build, users, page_size):
+        pages, counts = [], []
+        for user_id in users:
+            queryset = build(user_id).order_by('-created_at')
+            started = time.perf_counter()
+            list(queryset[:page_size])
+            pages.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            queryset.count()
+            counts.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f'{label:>10} {statistics.median(pages):>8.1f}ms {percentile(pages, 95):>8.1f}ms '
+            f'{statistics.median(counts):>8.1f}ms {percentile(counts, 95):>8.1f}ms'
+        )
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
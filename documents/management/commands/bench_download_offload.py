@@ -0,0 +1,207 @@
+"""
+Benchmark document download throughput, streamed by Django vs offloaded to nginx.
+
+Django is served by a threaded WSGI server with a URL conf that only routes to
+the download response helper, so the numbers cover the download path itself.
+The streamed run fetches straight from Django; the offloaded run goes through
+an nginx started from a generated config with the same internal location as
+nginx.conf. Without an nginx binary, only Django's per-request time for the
+offloaded (headers only) response is reported.
+"""
+import os
+import time
+import shutil
+import socket
+import tempfile
+import subprocess
+import http.client
+import threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+from django.conf import settings
+from django.core.files.base import File
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.http import FileResponse
+from django.test.utils import override_settings
+from django.urls import path
+from documents.downloads import file_response
+
+MB = 1024 * 1024
+
+NGINX_CONF = """
+daemon off;
+worker_processes 1;
+pid {root}/nginx.pid;
+error_log {root}/error.log;
+events {{ worker_connections 256; }}
+http {{
+    access_log off;
+    sendfile on;
+    tcp_nopush on;
+    client_body_temp_path {root}/body;
+    proxy_temp_path {root}/proxy;
+    fastcgi_temp_path {root}/fastcgi;
+    uwsgi_temp_path {root}/uwsgi;
+    scgi_temp_path {root}/scgi;
+    server {{
+        listen 127.0.0.1:{port};
+        location /internal/storage/ {{
+            internal;
+            alias {storage}/;
+        }}
+        location / {{
+            proxy_pass http://127.0.0.1:{upstream};
+        }}
+    }}
+}}
+"""
+
+
+def download_view(request, name):
+    """Serve a benchmark file the way the download endpoints do"""
+    file_path = os.path.join(str(settings.LOCAL_STORAGE_ROOT), name)
+    file = open(file_path, 'rb')
+    response = file_response(File(file, name=name), name, 'application/pdf', file_path)
+    if not isinstance(response, FileResponse):
+        file.close()
+    return response
+
+
+urlpatterns = [
+    path('<str:name>', download_view),
+]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TimedHandler(WSGIHandler):
+    """Django WSGI handler that records how long each request keeps a worker busy"""
+
+    def __init__(self):
+        super().__init__()
+        self.busy = []
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        response = super().__call__(environ, start_response)
+        busy = self.busy
+
+        class Timed:
+            def __iter__(self):
+                yield from response
+
+            def close(self):
+                if hasattr(response, 'close'):
+                    response.close()
+                busy.append(time.perf_counter() - started)
+
+        return Timed()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fetch(port, name, requests):
+    """Download a file repeatedly and return (bytes, seconds)"""
+    total = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        conn.request('GET', f'/{name}')
+        response = conn.getresponse()
+        if response.status != 200:
+            raise CommandError(f'GET /{name} returned {response.status}')
+        while True:
+            chunk = response.read(256 * 1024)
+            if not chunk:
+                break
+            total += len(chunk)
+        conn.close()
+    return total, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = 'Compare download throughput streamed by Django vs offloaded to nginx for 1 and 50 MB files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1, 50], help='File sizes in MB')
+        parser.add_argument('--requests', type=int, default=20, help='Downloads per size and mode')
+        parser.add_argument('--nginx', default=shutil.which('nginx'), help='Path to the nginx binary')
+
+    def handle(self, *args, **options):
+        root = tempfile.mkdtemp(prefix='bench-download-')
+        storage = os.path.join(root, 'storage')
+        os.makedirs(storage)
+        try:
+            names = []
+            for size_mb in options['sizes']:
+                name = f'file-{size_mb}mb.pdf'
+                with open(os.path.join(storage, name), 'wb') as out:
+                    for _ in range(size_mb):
+                        out.write(os.urandom(MB))
+                names.append((size_mb, name))
+
+            with override_settings(
+                ROOT_URLCONF=__name__, ALLOWED_HOSTS=['*'], LOCAL_STORAGE_ROOT=storage,
+                DOWNLOAD_ACCEL_STORAGE_URL='/internal/storage/',
+            ):
+                self.run(root, storage, names, options)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    def run(self, root, storage, names, options):
+        handler = TimedHandler()
+        server = make_server('127.0.0.1', 0, handler, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        django_port = server.server_port
+
+        nginx, nginx_port = None, None
+        if options['nginx']:
+            nginx_port = free_port()
+            conf = os.path.join(root, 'nginx.conf')
+            with open(conf, 'w') as out:
+                out.write(NGINX_CONF.format(root=root, port=nginx_port, upstream=django_port, storage=storage))
+            nginx = subprocess.Popen([options['nginx'], '-p', root, '-c', conf])
+            time.sleep(0.5)
+        else:
+            self.stdout.write('nginx not found (pass --nginx); offloaded runs report Django time only\n')
+
+        self.stdout.write(f"{'size':>6} {'mode':>10} {'throughput':>12} {'django time/req':>16}")
+        try:
+            for size_mb, name in names:
+                with override_settings(DOWNLOAD_OFFLOAD=''):
+                    self.report(handler, size_mb, 'streamed', django_port, name, options['requests'])
+                with override_settings(DOWNLOAD_OFFLOAD='x-accel'):
+                    self.report(handler, size_mb, 'offloaded', nginx_port, name, options['requests'], django_port)
+        finally:
+            server.shutdown()
+            if nginx:
+                nginx.terminate()
+                nginx.wait()
+
+    def report(self, handler, size_mb, mode, port, name, requests, django_port=None):
+        handler.busy.clear()
+        if port:
+            total, elapsed = fetch(port, name, requests)
+            throughput = f'{total / MB / elapsed:>8.1f} MB/s'
+        else:
+            # No nginx: only Django's side of the offloaded response is measurable
+            conn = http.client.HTTPConnection('127.0.0.1', django_port)
+            for _ in range(requests):
+                conn.request('GET', f'/{name}')
+                conn.getresponse().read()
+            conn.close()
+            throughput = 'n/a'
+        busy_ms = sum(handler.busy) / max(len(handler.busy), 1) * 1000
+        self.stdout.write(f"{size_mb:>4}MB {mode:>10} {throughput:>12} {busy_ms:>13.2f} ms")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from documents.models import UploadSession
+from documents.uploads import discard
+
+
+class Command(BaseCommand):
+    help = 'Expire stale upload sessions and remove their staged parts'
+
+    def handle(self, *args, **options):
+        stale = UploadSession.objects.filter(
+            Q(status='active', expires_at__lt=timezone.now()) | Q(status__in=['aborted', 'expired'])
+        )
+        count = 0
+        for upload_session in stale.iterator():
+            discard(upload_session)
+            count += 1
+        stale.filter(status='active').update(status='expired')
+        self.stdout.write(self.style.SUCCESS(f'Purged staged parts of {count} upload sessions'))
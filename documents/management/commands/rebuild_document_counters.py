@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Recompute the download and view counters of documents from the access log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('documents', nargs='*', help='Document IDs (default: all documents)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Documents updated per statement')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.order_by('pk')
+        if options['documents']:
+            documents = documents.filter(pk__in=options['documents'])
+
+        # Short batches keep row locks brief while requests keep counting
+        pks = list(documents.values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        updated = 0
+        for offset in range(0, len(pks), batch_size):
+            updated += Document.objects.filter(pk__in=pks[offset:offset + batch_size]).rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters of {updated} documents'))
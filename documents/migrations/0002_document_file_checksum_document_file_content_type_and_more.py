@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:16
+
+import common.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='file_checksum',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='file_content_type',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=common.fields.DocumentFileField(upload_to=''),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:36
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentAccessLog = apps.get_model('documents', 'DocumentAccessLog')
+
+    def count_of(action):
+        logs = (
+            DocumentAccessLog.objects.filter(document=models.OuterRef('pk'), action=action)
+            .order_by()
+            .values('document')
+            .annotate(total=models.Count('pk'))
+            .values('total')
+        )
+        return Coalesce(models.Subquery(logs, output_field=models.IntegerField()), 0)
+
+    Document.objects.update(download_count=count_of('download'), view_count=count_of('view'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_uploadsession_uploadpart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='download_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_audit_event_time'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documentaccess',
+            index=models.Index(fields=['user', 'document'], name='documents_d_user_id_853020_idx'),
+        ),
+    ]
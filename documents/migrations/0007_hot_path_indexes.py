@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_documentaccess_user_document_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='documentshare',
+            options={'ordering': ['-created_at'], 'verbose_name': 'Document Share', 'verbose_name_plural': 'Document Shares'},
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['owner', '-created_at'], name='documents_d_owner_i_13f3b4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentaccesslog',
+            index=models.Index(fields=['document', 'action'], name='documents_d_documen_fdf1fb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentaccesslog',
+            index=models.Index(fields=['user', '-accessed_at'], name='documents_d_user_id_64228f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentrequest',
+            index=models.Index(fields=['requestee', 'status'], name='documents_d_request_635cab_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentrequest',
+            index=models.Index(fields=['requester', '-created_at'], name='documents_d_request_d2d146_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentshare',
+            index=models.Index(fields=['shared_with', '-created_at'], name='documents_d_shared__8f7a2a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentshare',
+            index=models.Index(fields=['shared_by', '-created_at'], name='documents_d_shared__452ab6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentshare',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['shared_with'], name='docshare_pending_idx'),
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
+from common.audit import AuditLogManager
 from common.fields import DocumentFileField
+from collections import defaultdict
 import uuid
 import os
 
@@ -32,6 +35,54 @@ class DocumentCategory(models.Model):
         return self.name
 
 
+def access_log_count(action):
+    """Subquery counting a document's access log entries for one action"""
+    logs = (
+        DocumentAccessLog.objects.filter(document=models.OuterRef("pk"), action=action)
+        .order_by()
+        .values("document")
+        .annotate(total=models.Count("pk"))
+        .values("total")
+    )
+    return Coalesce(models.Subquery(logs, output_field=models.IntegerField()), 0)
+
+
+# Denormalised counters on Document, by access log action
+COUNTER_FIELDS = {"download": "download_count", "view": "view_count"}
+
+
+class DocumentQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Documents the user owns or has been granted access to.
+
+        The two sets are combined as a UNION of document IDs, each side
+        answered from its own index, rather than OR-ing a join on
+        DocumentAccess, which duplicates rows and needs a DISTINCT over
+        whole (JSON-carrying) document rows.
+        """
+        owned = Document.objects.filter(owner=user).order_by().values("pk")
+        granted = (
+            DocumentAccess.objects.filter(user=user).order_by().values("document")
+        )
+        return self.filter(pk__in=owned.union(granted))
+
+    def rebuild_counters(self):
+        """
+        Recompute the denormalised download and view counters from the
+        access log in a single UPDATE
+
+        Returns:
+            int: Number of documents updated
+        """
+        return self.order_by().update(
+            **{
+                counter: access_log_count(action)
+                for action, counter in COUNTER_FIELDS.items()
+            }
+        )
+
+
 class Document(models.Model):
     """Document model with encryption and metadata"""
 
@@ -44,6 +95,8 @@ class Document(models.Model):
     file = DocumentFileField()
     file_size = models.BigIntegerField(blank=True, null=True)
     file_type = models.CharField(max_length=50, blank=True, null=True)
+    file_content_type = models.CharField(max_length=100, blank=True, null=True)
+    file_checksum = models.CharField(max_length=64, blank=True, null=True)
     original_filename = models.CharField(max_length=255)
 
     # Ownership and access
@@ -93,6 +146,10 @@ class Document(models.Model):
     is_encrypted = models.BooleanField(default=True)
     encryption_key_hash = models.CharField(max_length=255, blank=True, null=True)
 
+    # Usage counters, kept in step with DocumentAccessLog
+    download_count = models.PositiveIntegerField(default=0, editable=False)
+    view_count = models.PositiveIntegerField(default=0, editable=False)
+
     # Expiry and versioning
     expiry_date = models.DateTimeField(blank=True, null=True)
     version = models.PositiveIntegerField(default=1)
@@ -108,20 +165,43 @@ class Document(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DocumentQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Document"
         verbose_name_plural = "Documents"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["owner", "-created_at"]),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.owner.email}"
 
     def save(self, *args, **kwargs):
+        # Upload a newly attached file first so its metadata comes from the
+        # upload itself rather than a round-trip to storage
+        if self.file and not self.file._committed:
+            self.file.save(self.file.name, self.file.file, save=False)
+        if self.file and self.file.upload_info:
+            self.file_size = self.file.size
+            self.file_content_type = self.file.content_type
+            self.file_checksum = self.file.checksum
+
         # Set file information if not already set
         if self.file and not self.file_size:
             self.file_size = self.file.size
         if self.file and not self.file_type:
             self.file_type = os.path.splitext(self.file.name)[1]
+
+        # Counters are only ever changed with F() updates; writing back the
+        # values loaded with this instance would drop concurrent increments
+        if not self._state.adding and not args and "update_fields" not in kwargs:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS.values()
+            ]
         super().save(*args, **kwargs)
 
     @property
@@ -131,16 +211,6 @@ class Document(models.Model):
             return timezone.now() > self.expiry_date
         return False
 
-    @property
-    def download_count(self):
-        """Get total download count"""
-        return self.access_logs.filter(action="download").count()
-
-    @property
-    def view_count(self):
-        """Get total view count"""
-        return self.access_logs.filter(action="view").count()
-
     def get_file_url(self):
         """Get the public URL for the document file"""
         if self.file:
@@ -185,11 +255,56 @@ class DocumentAccess(models.Model):
         verbose_name = "Document Access"
         verbose_name_plural = "Document Access"
         unique_together = ["document", "user"]
+        indexes = [
+            # Documents granted to a user (the unique index leads with document)
+            models.Index(fields=["user", "document"]),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.document.title} ({self.permission})"
 
 
+class DocumentAccessLogManager(AuditLogManager):
+    def log(self, **fields):
+        """
+        Record an access. The document's matching counter is bumped in
+        memory now and in the database when the entry is written.
+        """
+        instance = super().log(**fields)
+        counter = COUNTER_FIELDS.get(instance.action)
+        if counter:
+            document = instance.document
+            setattr(document, counter, getattr(document, counter) + 1)
+        return instance
+
+    def write_batch(self, instances):
+        """
+        Insert access log entries and add them to the documents' counters
+        in the same transaction, with one F() update per document. The
+        owners' cached document stats are dropped as their rankings moved.
+        """
+        super().write_batch(instances)
+        increments = defaultdict(lambda: defaultdict(int))
+        for instance in instances:
+            counter = COUNTER_FIELDS.get(instance.action)
+            if counter:
+                increments[instance.document_id][counter] += 1
+        for document_id, counters in increments.items():
+            Document.objects.filter(pk=document_id).update(
+                **{
+                    counter: models.F(counter) + count
+                    for counter, count in counters.items()
+                }
+            )
+        if increments:
+            from .stats import invalidate_document_stats
+
+            owners = Document.objects.filter(pk__in=increments).values_list(
+                "owner_id", flat=True
+            )
+            invalidate_document_stats(*set(owners))
+
+
 class DocumentAccessLog(models.Model):
     """Log document access for audit trail"""
 
@@ -212,13 +327,19 @@ class DocumentAccessLog(models.Model):
     user_agent = models.TextField(blank=True, null=True)
     session_id = models.CharField(max_length=255, blank=True, null=True)
 
-    # Timestamps
-    accessed_at = models.DateTimeField(auto_now_add=True)
+    # Timestamps (set when the access happens, not when the entry is written)
+    accessed_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = DocumentAccessLogManager()
 
     class Meta:
         verbose_name = "Document Access Log"
         verbose_name_plural = "Document Access Logs"
         ordering = ["-accessed_at"]
+        indexes = [
+            models.Index(fields=["document", "action"]),
+            models.Index(fields=["user", "-accessed_at"]),
+        ]
 
     def __str__(self):
         return f"{self.user.email} {self.action} {self.document.title}"
@@ -264,7 +385,18 @@ class DocumentShare(models.Model):
     class Meta:
         verbose_name = "Document Share"
         verbose_name_plural = "Document Shares"
+        ordering = ["-created_at"]
         unique_together = ["document", "shared_with"]
+        indexes = [
+            models.Index(fields=["shared_with", "-created_at"]),
+            models.Index(fields=["shared_by", "-created_at"]),
+            # Shares still waiting for the recipient's answer
+            models.Index(
+                fields=["shared_with"],
+                condition=models.Q(status="pending"),
+                name="docshare_pending_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.document.title} shared by {self.shared_by.email} with {self.shared_with.email}"
@@ -312,8 +444,108 @@ class DocumentRequest(models.Model):
         verbose_name = "Document Request"
         verbose_name_plural = "Document Requests"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["requestee", "status"]),
+            models.Index(fields=["requester", "-created_at"]),
+        ]
 
     def __str__(self):
         return (
             f"{self.requester.email} requests {self.title} from {self.requestee.email}"
         )
+
+
+class UploadSession(models.Model):
+    """Resumable multipart upload that becomes a Document on completion"""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="upload_sessions",
+    )
+
+    # File being uploaded
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True, null=True)
+    total_size = models.BigIntegerField()
+    part_size = models.PositiveIntegerField()
+
+    # Document details applied on completion
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    category = models.ForeignKey(
+        DocumentCategory, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    trust_level = models.CharField(
+        max_length=20, choices=Document.TRUST_LEVEL_CHOICES, default="user_uploaded"
+    )
+    tags = models.JSONField(default=list, blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
+    expiry_date = models.DateTimeField(blank=True, null=True)
+
+    # Session status
+    STATUS_CHOICES = [
+        ("active", "Active"),
+        ("completed", "Completed"),
+        ("aborted", "Aborted"),
+        ("expired", "Expired"),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="active")
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="upload_sessions",
+    )
+
+    # Timestamps
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Upload Session"
+        verbose_name_plural = "Upload Sessions"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.filename} upload by {self.owner.email} ({self.status})"
+
+    @property
+    def total_parts(self):
+        """Number of parts needed to cover total_size"""
+        return max(1, -(-self.total_size // self.part_size))
+
+    @property
+    def is_expired(self):
+        """Check if upload session is expired"""
+        return timezone.now() > self.expires_at
+
+    def expected_part_size(self, part_number):
+        """Size a given part must have; only the last part may be shorter"""
+        if part_number < self.total_parts:
+            return self.part_size
+        return self.total_size - self.part_size * (self.total_parts - 1)
+
+
+class UploadPart(models.Model):
+    """A received part of an upload session, stored in the staging area"""
+
+    session = models.ForeignKey(
+        UploadSession, on_delete=models.CASCADE, related_name="parts"
+    )
+    part_number = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=64)
+    uploaded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Upload Part"
+        verbose_name_plural = "Upload Parts"
+        unique_together = ["session", "part_number"]
+        ordering = ["part_number"]
+
+    def __str__(self):
+        return f"Part {self.part_number} of {self.session.filename}"
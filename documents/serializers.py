@@ -2,9 +2,13 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import (
     DocumentCategory, Document, DocumentAccess, DocumentAccessLog,
-    DocumentShare, DocumentRequest
+    DocumentShare, DocumentRequest, UploadSession
 )
+from django.conf import settings
 from django.utils import timezone
+from datetime import timedelta
+import os
+from common.serializers import PublicURLModelSerializer, PublicURLListSerializer
 
 User = get_user_model()
 
@@ -21,7 +25,7 @@ class DocumentCategoryCreateSerializer(serializers.ModelSerializer):
         fields = ['name', 'description', 'icon']
 
 
-class DocumentSerializer(serializers.ModelSerializer):
+class DocumentSerializer(PublicURLModelSerializer):
     owner_email = serializers.EmailField(source='owner.email', read_only=True)
     owner_name = serializers.CharField(source='owner.full_name', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
@@ -32,9 +36,10 @@ class DocumentSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Document
+        list_serializer_class = PublicURLListSerializer
         fields = [
             'id', 'title', 'description', 'file', 'file_size', 'file_type',
-            'original_filename', 'owner', 'owner_email', 'owner_name',
+            'file_content_type', 'file_checksum', 'original_filename', 'owner', 'owner_email', 'owner_name',
             'category', 'category_name', 'trust_level', 'issuer', 'issuer_name',
             'issue_date', 'status', 'tags', 'metadata', 'is_encrypted',
             'expiry_date', 'version', 'download_count', 'view_count',
@@ -42,7 +47,7 @@ class DocumentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = [
             'id', 'owner', 'owner_email', 'owner_name', 'file_size',
-            'file_type', 'download_count', 'view_count', 'is_expired',
+            'file_type', 'file_content_type', 'file_checksum', 'download_count', 'view_count', 'is_expired',
             'created_at', 'updated_at'
         ]
 
@@ -225,4 +230,68 @@ class DocumentEncryptionSerializer(serializers.Serializer):
     def validate_encryption_key(self, value):
         # Here you would validate the encryption key
         if len(value) < 32:
-            raise serializers.ValidationError("Encryption key must be at least 32 characters") 
\ No newline at end of file
+            raise serializers.ValidationError("Encryption key must be at least 32 characters") 
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    total_parts = serializers.IntegerField(read_only=True)
+    uploaded_parts = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'content_type', 'total_size', 'part_size',
+            'total_parts', 'uploaded_parts', 'title', 'status', 'document',
+            'expires_at', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+    
+    def get_uploaded_parts(self, obj):
+        return [part.part_number for part in obj.parts.all()]
+
+
+class UploadSessionCreateSerializer(serializers.ModelSerializer):
+    part_size = serializers.IntegerField(required=False)
+    
+    class Meta:
+        model = UploadSession
+        fields = [
+            'filename', 'content_type', 'total_size', 'part_size', 'title',
+            'description', 'category', 'trust_level', 'tags', 'metadata',
+            'expiry_date'
+        ]
+    
+    def validate_filename(self, value):
+        file_field = Document._meta.get_field('file')
+        file_ext = os.path.splitext(value)[1].lower().lstrip('.')
+        if file_ext not in file_field.allowed_types:
+            raise serializers.ValidationError(
+                f'File type {file_ext} is not allowed. Allowed types: {", ".join(file_field.allowed_types)}'
+            )
+        return value
+    
+    def validate_total_size(self, value):
+        max_size = Document._meta.get_field('file').max_size
+        if value <= 0:
+            raise serializers.ValidationError("File size must be positive")
+        if value > max_size:
+            raise serializers.ValidationError(f'File size must be under {max_size / (1024*1024):.1f}MB')
+        return value
+    
+    def validate_part_size(self, value):
+        if not settings.UPLOAD_MIN_PART_SIZE <= value <= settings.UPLOAD_MAX_PART_SIZE:
+            raise serializers.ValidationError(
+                f'Part size must be between {settings.UPLOAD_MIN_PART_SIZE} and {settings.UPLOAD_MAX_PART_SIZE} bytes'
+            )
+        return value
+    
+    def create(self, validated_data):
+        validated_data['owner'] = self.context['request'].user
+        validated_data.setdefault('part_size', settings.UPLOAD_PART_SIZE)
+        validated_data['expires_at'] = timezone.now() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+        return super().create(validated_data)
+
+
+class UploadPartSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    checksum = serializers.CharField(required=False, max_length=64)
@@ -0,0 +1,108 @@
+"""
+Sharing many documents with many users at once
+"""
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from auth_api import counters as dashboard_counters
+from auth_api.models import CustomUser
+from sharing.models import ShareNotification
+from .models import Document, DocumentShare
+
+SHARED = 'shared'
+ALREADY_SHARED = 'already_shared'
+USER_NOT_FOUND = 'user_not_found'
+DOCUMENT_NOT_FOUND = 'document_not_found'
+
+
+def share_documents(owner, document_ids, user_ids, permission='view', expires_at=None, message=''):
+    """
+    Share each of the owner's documents with each of the users.
+    
+    In one transaction, the documents are resolved with one query, the
+    users with one, and the pairs already shared with one more; the new
+    shares are inserted with bulk_create in chunks of BULK_SHARE_BATCH_SIZE,
+    skipping conflicts. The pairs are then read back, and only the rows this
+    call inserted are reported as shared, notified (one notification per
+    recipient) and added to the dashboard counters; a pair shared
+    concurrently by another request is reported as already shared.
+    
+    Returns:
+        list: {'document', 'user', 'status'} for every requested pair, in
+        request order
+    """
+    document_ids = list(dict.fromkeys(document_ids))
+    user_ids = list(dict.fromkeys(user_ids))
+    batch_size = settings.BULK_SHARE_BATCH_SIZE
+    with transaction.atomic():
+        documents = {
+            document.pk: document
+            for document in Document.objects.filter(pk__in=document_ids, owner=owner).only('pk', 'title')
+        }
+        users = set(CustomUser.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        pairs = DocumentShare.objects.filter(document__in=list(documents), shared_with__in=users)
+        existing = set(pairs.values_list('document_id', 'shared_with_id'))
+        shares = [
+            DocumentShare(
+                document_id=document_id, shared_by=owner, shared_with_id=user_id,
+                permission=permission, expires_at=expires_at, message=message,
+            )
+            for document_id in document_ids if document_id in documents
+            for user_id in user_ids if user_id in users and (document_id, user_id) not in existing
+        ]
+        DocumentShare.objects.bulk_create(shares, batch_size=batch_size, ignore_conflicts=True)
+        # A conflicting row keeps its own created_at, which bulk_create set
+        # on each of our shares as it inserted them
+        attempted = {(share.document_id, share.shared_with_id, share.created_at) for share in shares}
+        inserted = {
+            (document_id, user_id)
+            for document_id, user_id, created_at in pairs.values_list('document_id', 'shared_with_id', 'created_at')
+            if (document_id, user_id, created_at) in attempted
+        }
+        
+        results = []
+        received = Counter()
+        first_shared = {}
+        for document_id in document_ids:
+            for user_id in user_ids:
+                if document_id not in documents:
+                    outcome = DOCUMENT_NOT_FOUND
+                elif user_id not in users:
+                    outcome = USER_NOT_FOUND
+                elif (document_id, user_id) not in inserted:
+                    outcome = ALREADY_SHARED
+                else:
+                    outcome = SHARED
+                    received[user_id] += 1
+                    first_shared.setdefault(user_id, documents[document_id])
+                results.append({'document': document_id, 'user': user_id, 'status': outcome})
+        
+        ShareNotification.objects.bulk_create([
+            share_notification(owner, user_id, count, first_shared[user_id])
+            for user_id, count in received.items()
+        ], batch_size=batch_size)
+        # bulk_create sends no signals
+        dashboard_counters.apply(owner.pk, {'shared_documents': len(inserted)})
+        recipients = defaultdict(list)
+        for user_id, count in received.items():
+            recipients[count].append(user_id)
+        for count, recipient_ids in recipients.items():
+            dashboard_counters.apply_many(recipient_ids, {
+                'received_documents': count, 'notifications': 1, 'unread_notifications': 1,
+            })
+    return results
+
+
+def share_notification(owner, user_id, count, document):
+    """One notification per recipient, naming the document if there is only one"""
+    if count == 1:
+        return ShareNotification(
+            user_id=user_id, notification_type='document_shared', document=document,
+            title='Document shared with you',
+            message=f'{owner.full_name} shared "{document.title}" with you',
+        )
+    return ShareNotification(
+        user_id=user_id, notification_type='document_shared',
+        title='Documents shared with you',
+        message=f'{owner.full_name} shared {count} documents with you',
+    )
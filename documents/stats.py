@@ -0,0 +1,106 @@
+"""
+Per-user document statistics for the dashboard
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from .models import Document
+
+UNCATEGORIZED = 'Uncategorized'
+
+# Ranking annotation -> stats key of the documents it selects
+RANKINGS = {
+    'recent_rank': 'recent_uploads',
+    'view_rank': 'most_viewed',
+    'download_rank': 'most_downloaded',
+}
+
+
+def stats_cache_key(user_id):
+    return f"document-stats:{user_id}"
+
+
+def compute_document_stats(user_id, top=None):
+    """
+    Aggregate a user's documents in two queries.
+    
+    Totals and the per-category and per-trust-level breakdowns come from one
+    GROUP BY over (category, trust level). The recent, most viewed and most
+    downloaded documents come from a second query that ranks the documents
+    with window functions and keeps those in the top of any ranking.
+    
+    Returns:
+        dict: totals and breakdowns, with the top documents as lists of ids
+    """
+    top = top or settings.DOCUMENT_STATS_TOP
+    documents = Document.objects.filter(owner_id=user_id)
+    
+    stats = {
+        'total_documents': 0,
+        'total_size': 0,
+        'documents_by_category': {},
+        'documents_by_trust_level': {},
+    }
+    groups = documents.values('category__name', 'trust_level').annotate(
+        count=Count('pk'), size=Sum('file_size')
+    ).order_by()
+    for group in groups:
+        stats['total_documents'] += group['count']
+        stats['total_size'] += group['size'] or 0
+        category = group['category__name'] or UNCATEGORIZED
+        by_category = stats['documents_by_category']
+        by_category[category] = by_category.get(category, 0) + group['count']
+        by_trust_level = stats['documents_by_trust_level']
+        by_trust_level[group['trust_level']] = by_trust_level.get(group['trust_level'], 0) + group['count']
+    
+    ranked = documents.annotate(
+        recent_rank=Window(RowNumber(), order_by=[F('created_at').desc(), F('pk').desc()]),
+        view_rank=Window(RowNumber(), order_by=[F('view_count').desc(), F('created_at').desc(), F('pk').desc()]),
+        download_rank=Window(RowNumber(), order_by=[F('download_count').desc(), F('created_at').desc(), F('pk').desc()]),
+    ).filter(
+        Q(recent_rank__lte=top) | Q(view_rank__lte=top) | Q(download_rank__lte=top)
+    ).values('pk', *RANKINGS)
+    ranked = list(ranked)
+    for rank, key in RANKINGS.items():
+        selected = sorted((row for row in ranked if row[rank] <= top), key=lambda row: row[rank])
+        stats[key] = [row['pk'] for row in selected]
+    return stats
+
+
+def get_document_stats(user_id):
+    """
+    A user's document stats, cached until one of their documents or its
+    access log changes, or for DOCUMENT_STATS_CACHE_TTL seconds
+    """
+    key = stats_cache_key(user_id)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_document_stats(user_id)
+        cache.set(key, stats, settings.DOCUMENT_STATS_CACHE_TTL)
+    return stats
+
+
+def load_top_documents(stats):
+    """
+    Replace the document ids of the top lists with the documents, fetched
+    in one query so titles and counters are current even on a cache hit
+    """
+    ids = {pk for key in RANKINGS.values() for pk in stats[key]}
+    documents = Document.objects.filter(pk__in=ids).select_related('owner', 'category', 'issuer').in_bulk()
+    return {
+        **stats,
+        **{
+            key: [documents[pk] for pk in stats[key] if pk in documents]
+            for key in RANKINGS.values()
+        },
+    }
+
+
+def invalidate_document_stats(*user_ids):
+    cache.delete_many([stats_cache_key(user_id) for user_id in user_ids])
+
+
+def invalidate_owner_stats(sender, instance, **kwargs):
+    """post_save / post_delete receiver for Document"""
+    invalidate_document_stats(instance.owner_id)
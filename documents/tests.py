@@ -1,3 +1,801 @@
-from django.test import TestCase
+import os
+import shutil
+from io import StringIO
+import hashlib
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework import status
+from rest_framework.test import APITestCase
+from auth_api.models import CustomUser, UserDashboardCounters
+from auth_api.counters import get_dashboard_counters
+from common.audit import audit_writer
+from common.blobs import collect_garbage
+from common.explain import QueryPlanAssertionsMixin
+from common.models import StoredBlob
+from common.storage import LocalFileSystemStorage, upload_file_to_supabase
+from sharing.models import ShareNotification
+from .models import (
+    Document, DocumentAccess, DocumentAccessLog, DocumentCategory, DocumentRequest, DocumentShare,
+    UploadPart, UploadSession
+)
+from .serializers import DocumentSerializer
 
-# Create your tests here.
+
+class CountingBucket:
+    """Stand-in for a Supabase bucket API that records every remote call"""
+
+    def __init__(self):
+        self.calls = []
+        self.objects = {}
+
+    def _record(self, name):
+        self.calls.append(name)
+        return {}
+
+    def upload_stream(self, path, stream, content_type, content_length=None, upsert=False):
+        self.objects[path] = b''.join(stream)
+        return self._record('upload')
+
+    def download(self, path):
+        return self._record('download')
+
+    def download_stream(self, path, start=None, end=None):
+        self._record('download')
+        data = self.objects[path]
+        yield data[start or 0:None if end is None else end + 1]
+
+    def list(self, path=None):
+        self._record('list')
+        return []
+
+    def remove(self, paths):
+        for path in paths:
+            self.objects.pop(path, None)
+        return self._record('remove')
+
+    def create_signed_url(self, path, expires_in, options=None):
+        self._record('sign')
+        return {'signedURL': f"https://storage.test/sign/{path}?token={len(self.calls)}"}
+
+    def get_public_url(self, path):
+        # Computed locally by the client, no round-trip
+        return f"https://storage.test/{path}"
+
+
+class DocumentUploadRoundTripTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_create_uploads_once_without_storage_lookups(self):
+        content = b'%PDF-1.4 single upload'
+        bucket = CountingBucket()
+        with mock.patch('common.storage.get_storage_bucket', return_value=bucket):
+            response = self.client.post(
+                '/api/v1/documents/',
+                {
+                    'title': 'Passport',
+                    'file': SimpleUploadedFile('passport.pdf', content, content_type='application/pdf'),
+                },
+                format='multipart',
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(bucket.calls, ['upload'])
+
+        document = Document.objects.get()
+        self.assertEqual(document.file_size, len(content))
+        self.assertEqual(document.file_content_type, 'application/pdf')
+        self.assertEqual(document.file_checksum, hashlib.sha256(content).hexdigest())
+
+    def test_resaving_document_does_not_upload_again(self):
+        bucket = CountingBucket()
+        with mock.patch('common.storage.get_storage_bucket', return_value=bucket):
+            document = Document(
+                title='Degree',
+                owner=self.user,
+                original_filename='degree.pdf',
+                file=SimpleUploadedFile('degree.pdf', b'%PDF-1.4', content_type='application/pdf'),
+            )
+            document.save()
+            document.title = 'Degree certificate'
+            document.save()
+
+        self.assertEqual(bucket.calls, ['upload'])
+
+
+class DocumentListQueryCountTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.other = CustomUser.objects.create_user(
+            username='issuer', email='issuer@example.com', password='secret-pass', full_name='Issuer'
+        )
+        self.category = DocumentCategory.objects.create(name='Identity')
+        self.client.force_authenticate(self.user)
+
+    def add_documents(self, count):
+        start = Document.objects.count()
+        documents = Document.objects.bulk_create([
+            Document(
+                title=f'Document {index}',
+                owner=self.user if index % 2 else self.other,
+                issuer=self.other,
+                category=self.category,
+                original_filename=f'document-{index}.pdf',
+                file=f'blobs/{index:02x}/document-{index}.pdf',
+            )
+            for index in range(start, start + count)
+        ])
+        DocumentAccess.objects.bulk_create([
+            DocumentAccess(document=document, user=self.user, granted_by=self.other)
+            for document in documents
+            if document.owner_id == self.other.pk
+        ])
+        DocumentAccessLog.objects.bulk_create([
+            DocumentAccessLog(document=document, user=self.user, action=action)
+            for document in documents
+            for action in ('view', 'view', 'download')
+        ])
+        call_command('rebuild_document_counters', stdout=StringIO())
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/documents/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        self.add_documents(1)
+        _, single = self.list_queries()
+        self.add_documents(19)
+        response, full = self.list_queries()
+
+        self.assertEqual(single, full)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['count'], 20)
+        for item in response.data['results']:
+            self.assertEqual(item['view_count'], 2)
+            self.assertEqual(item['download_count'], 1)
+            self.assertEqual(item['category_name'], 'Identity')
+            self.assertEqual(item['issuer_name'], 'Issuer')
+
+    def test_retrieve_counts_the_view_it_logs(self):
+        self.add_documents(1)
+        document = Document.objects.get()
+
+        response = self.client.get(f'/api/v1/documents/{document.pk}/')
+
+        self.assertEqual(response.data['view_count'], 3)
+        document.refresh_from_db()
+        self.assertEqual(document.view_count, 3)
+
+    def test_saving_a_stale_instance_keeps_counted_views(self):
+        self.add_documents(1)
+        stale = Document.objects.get()
+        DocumentAccessLog.objects.log(document=Document.objects.get(), user=self.user, action='view')
+
+        stale.title = 'Renamed'
+        stale.save()
+
+        stale.refresh_from_db()
+        self.assertEqual((stale.title, stale.view_count), ('Renamed', 3))
+
+    def test_audit_batch_is_written_with_a_single_insert(self):
+        self.add_documents(2)
+        documents = list(Document.objects.all())
+        entries = [
+            DocumentAccessLog(document=document, user=self.user, action=action)
+            for document in documents
+            for action in ('view', 'download', 'share')
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            audit_writer.write(entries)
+
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        for document in documents:
+            document.refresh_from_db()
+            self.assertEqual((document.view_count, document.download_count), (3, 2))
+
+
+class DocumentStatsTests(APITestCase):
+    url = '/api/v1/documents/stats/'
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        identity = DocumentCategory.objects.create(name='Identity')
+        self.documents = Document.objects.bulk_create([
+            Document(
+                title=f'Document {index}', owner=self.user, file_size=100 * index,
+                category=identity if index % 2 else None,
+                trust_level='officially_issued' if index < 3 else 'user_uploaded',
+                original_filename=f'document-{index}.pdf', file=f'blobs/{index:02x}/document-{index}.pdf',
+            )
+            for index in range(8)
+        ])
+        for index, document in enumerate(self.documents):
+            Document.objects.filter(pk=document.pk).update(view_count=index, download_count=8 - index)
+
+    def stats(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        aggregates = [
+            query for query in queries.captured_queries
+            if 'GROUP BY' in query['sql'] or 'ROW_NUMBER' in query['sql']
+        ]
+        return response.data, len(aggregates)
+
+    def titles(self, documents):
+        return [document['title'] for document in documents]
+
+    def test_stats_are_aggregated_in_two_queries(self):
+        data, aggregates = self.stats()
+
+        self.assertEqual(aggregates, 2)
+        self.assertEqual(data['total_documents'], 8)
+        self.assertEqual(data['total_size'], 2800)
+        self.assertEqual(data['documents_by_category'], {'Identity': 4, 'Uncategorized': 4})
+        self.assertEqual(data['documents_by_trust_level'], {'officially_issued': 3, 'user_uploaded': 5})
+        self.assertEqual(self.titles(data['most_viewed']), [f'Document {index}' for index in (7, 6, 5, 4, 3)])
+        self.assertEqual(self.titles(data['most_downloaded']), [f'Document {index}' for index in range(5)])
+        self.assertEqual(len(data['recent_uploads']), 5)
+
+    def test_stats_are_cached_until_an_access_is_logged(self):
+        self.stats()
+        _, aggregates = self.stats()
+        self.assertEqual(aggregates, 0)
+
+        for _ in range(10):
+            DocumentAccessLog.objects.log(document=self.documents[0], user=self.user, action='view')
+
+        data, aggregates = self.stats()
+        self.assertEqual(aggregates, 2)
+        self.assertEqual(data['most_viewed'][0]['title'], 'Document 0')
+        self.assertEqual(data['most_viewed'][0]['view_count'], 10)
+
+    def test_stats_are_recomputed_after_a_document_changes(self):
+        self.stats()
+        document = Document.objects.get(pk=self.documents[7].pk)
+        document.trust_level = 'officially_issued'
+        document.save()
+
+        data, aggregates = self.stats()
+        self.assertEqual(aggregates, 2)
+        self.assertEqual(data['documents_by_trust_level'], {'officially_issued': 4, 'user_uploaded': 4})
+
+
+class BulkShareTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.recipients = CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f'recipient{index}', email=f'recipient{index}@example.com',
+                vault_id=f'recipient{index}@vault', full_name=f'Recipient {index}', password='!',
+            )
+            for index in range(4)
+        ])
+        self.client.force_authenticate(self.user)
+        self.documents = Document.objects.bulk_create([
+            Document(
+                title=f'Document {index}', owner=self.user,
+                original_filename=f'document-{index}.pdf', file=f'blobs/{index:02x}/document-{index}.pdf',
+            )
+            for index in range(3)
+        ])
+
+    def bulk_share(self, document_ids, user_ids):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/sharing/bulk/', {
+                'document_ids': [str(pk) for pk in document_ids], 'target_users': user_ids,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, queries.captured_queries
+
+    def test_bulk_share_inserts_in_bulk_and_reports_every_pair(self):
+        DocumentShare.objects.create(
+            document=self.documents[0], shared_by=self.user, shared_with=self.recipients[0]
+        )
+        user_ids = [recipient.pk for recipient in self.recipients] + [999999]
+
+        data, queries = self.bulk_share([document.pk for document in self.documents], user_ids)
+
+        self.assertEqual(data['shared_count'], 11)
+        outcomes = {(str(result['document']), result['user']): result['status'] for result in data['results']}
+        self.assertEqual(len(outcomes), 15)
+        self.assertEqual(outcomes[(str(self.documents[0].pk), self.recipients[0].pk)], 'already_shared')
+        self.assertEqual(outcomes[(str(self.documents[1].pk), 999999)], 'user_not_found')
+        self.assertEqual(DocumentShare.objects.count(), 12)
+        self.assertEqual(ShareNotification.objects.count(), 4)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT')]
+        # Shares and notifications (the activity log is written on its own)
+        self.assertEqual(len([query for query in inserts if 'documents_documentshare' in query['sql']]), 1)
+        self.assertEqual(len([query for query in inserts if 'sharing_sharenotification' in query['sql']]), 1)
+
+    def test_query_count_does_not_grow_with_pairs(self):
+        _, few = self.bulk_share([self.documents[0].pk], [self.recipients[0].pk])
+        _, many = self.bulk_share(
+            [document.pk for document in self.documents[1:]], [recipient.pk for recipient in self.recipients]
+        )
+        self.assertEqual(len(few), len(many))
+
+    def test_bulk_action_share_reports_unknown_documents(self):
+        response = self.client.post('/api/v1/documents/bulk_action/', {
+            'document_ids': [str(self.documents[0].pk), '00000000-0000-0000-0000-000000000000'],
+            'action': 'share', 'target_user': self.recipients[1].pk,
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result['status'] for result in response.data['results']], ['shared', 'document_not_found'])
+        self.assertTrue(
+            DocumentShare.objects.filter(document=self.documents[0], shared_with=self.recipients[1]).exists()
+        )
+
+
+    def test_pairs_shared_concurrently_are_not_reported_or_counted(self):
+        get_dashboard_counters(self.recipients[0])
+        bulk_create = DocumentShare.objects.bulk_create
+
+        def insert_after_concurrent_share(shares, **kwargs):
+            # Another request shares the first pair between the read of the
+            # existing pairs and this insert, which skips it as a conflict
+            bulk_create([DocumentShare(document=self.documents[0], shared_by=self.user, shared_with=self.recipients[0])])
+            return bulk_create(shares, **kwargs)
+
+        with mock.patch.object(DocumentShare.objects, 'bulk_create', side_effect=insert_after_concurrent_share):
+            data, _ = self.bulk_share([document.pk for document in self.documents[:2]], [self.recipients[0].pk])
+
+        self.assertEqual([result['status'] for result in data['results']], ['already_shared', 'shared'])
+        self.assertEqual(data['shared_count'], 1)
+        notification = ShareNotification.objects.get(user=self.recipients[0])
+        self.assertIn(self.documents[1].title, notification.message)
+        counters = UserDashboardCounters.objects.get(pk=self.recipients[0].pk)
+        # The concurrent share is counted by the request that made it
+        self.assertEqual((counters.received_documents, counters.notifications), (1, 1))
+
+
+class DocumentIndexPlanTests(QueryPlanAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.other = CustomUser.objects.create_user(
+            username='other', email='other@example.com', password='secret-pass', full_name='Other'
+        )
+        self.client.force_authenticate(self.user)
+        document = Document.objects.bulk_create([
+            Document(title='Passport', owner=self.user, original_filename='passport.pdf', file='blobs/aa/passport.pdf')
+        ])[0]
+        DocumentAccess.objects.create(document=document, user=self.other, granted_by=self.user)
+        DocumentAccessLog.objects.log(document=document, user=self.other, action='view')
+        DocumentShare.objects.create(document=document, shared_by=self.user, shared_with=self.other)
+        DocumentRequest.objects.create(requester=self.other, requestee=self.user, title='Degree')
+
+    def test_document_list_uses_owner_and_grant_indexes(self):
+        self.assertEndpointUsesIndex('/api/v1/documents/', 'documents_document')
+        self.assertEndpointUsesIndex('/api/v1/documents/', 'documents_documentaccess')
+
+    def test_access_logs_use_index(self):
+        self.assertEndpointUsesIndex('/api/v1/documents/access-logs/', 'documents_documentaccesslog')
+
+    def test_shares_use_index(self):
+        self.assertEndpointUsesIndex('/api/v1/sharing/requests/', 'documents_documentshare')
+
+
+class DocumentBlobDeduplicationTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.bucket = CountingBucket()
+
+    def create(self, title, content):
+        with mock.patch('common.storage.get_storage_bucket', return_value=self.bucket):
+            return Document.objects.create(
+                title=title,
+                owner=self.user,
+                original_filename=f'{title}.pdf',
+                file=SimpleUploadedFile(f'{title}.pdf', content, content_type='application/pdf'),
+            )
+
+    def test_identical_content_is_uploaded_once_and_shared(self):
+        first = self.create('first', b'%PDF-1.4 same bytes')
+        second = self.create('second', b'%PDF-1.4 same bytes')
+
+        self.assertEqual(self.bucket.calls, ['upload'])
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+
+    def test_blob_is_collected_only_after_last_reference_is_deleted(self):
+        first = self.create('first', b'%PDF-1.4 same bytes')
+        second = self.create('second', b'%PDF-1.4 same bytes')
+
+        with mock.patch('common.blobs.schedule_garbage_collection'), \
+                mock.patch('common.storage.get_storage_bucket', return_value=self.bucket):
+            with self.captureOnCommitCallbacks(execute=True):
+                first.delete()
+            self.assertEqual(collect_garbage(grace_seconds=0), 0)
+            self.assertEqual(StoredBlob.objects.get().ref_count, 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                second.delete()
+            self.assertEqual(collect_garbage(grace_seconds=0), 1)
+
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertEqual(self.bucket.objects, {})
+
+    def test_replacing_file_releases_previous_blob(self):
+        document = Document.objects.get(pk=self.create('first', b'%PDF-1.4 old bytes').pk)
+        old_name = document.file.name
+
+        with mock.patch('common.blobs.schedule_garbage_collection'), \
+                mock.patch('common.storage.get_storage_bucket', return_value=self.bucket):
+            with self.captureOnCommitCallbacks(execute=True):
+                document.file = SimpleUploadedFile('first.pdf', b'%PDF-1.4 new bytes', content_type='application/pdf')
+                document.save()
+            self.assertEqual(StoredBlob.objects.get(name=old_name).ref_count, 0)
+            self.assertEqual(collect_garbage(grace_seconds=0), 1)
+
+        blob = StoredBlob.objects.get()
+        self.assertEqual(blob.name, document.file.name)
+        self.assertEqual(blob.ref_count, 1)
+        self.assertEqual(list(self.bucket.objects), [document.file.name])
+
+    def test_replacing_file_with_same_content_keeps_blob(self):
+        document = self.create('first', b'%PDF-1.4 same bytes')
+
+        with mock.patch('common.blobs.schedule_garbage_collection'), \
+                mock.patch('common.storage.get_storage_bucket', return_value=self.bucket):
+            with self.captureOnCommitCallbacks(execute=True):
+                document.file = SimpleUploadedFile('again.pdf', b'%PDF-1.4 same bytes', content_type='application/pdf')
+                document.save()
+            self.assertEqual(collect_garbage(grace_seconds=0), 0)
+
+        self.assertEqual(StoredBlob.objects.get().ref_count, 1)
+
+    def test_serializer_replacing_file_releases_previous_blob(self):
+        document = self.create('first', b'%PDF-1.4 old bytes')
+
+        with mock.patch('common.blobs.schedule_garbage_collection'), \
+                mock.patch('common.storage.get_storage_bucket', return_value=self.bucket):
+            serializer = DocumentSerializer(document, data={
+                'file': SimpleUploadedFile('first.pdf', b'%PDF-1.4 new bytes', content_type='application/pdf'),
+            }, partial=True)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            with self.captureOnCommitCallbacks(execute=True):
+                serializer.save()
+            self.assertEqual(collect_garbage(grace_seconds=0), 1)
+
+        document.refresh_from_db()
+        self.assertEqual(StoredBlob.objects.get().name, document.file.name)
+        self.assertEqual(len(self.bucket.objects), 1)
+
+
+@override_settings(CONTENT_CACHE_MAX_SIZE=0)
+class DocumentSignedDownloadTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        self.bucket = CountingBucket()
+        with mock.patch('common.storage.get_storage_bucket', return_value=self.bucket):
+            self.document = Document.objects.create(
+                title='Passport',
+                owner=self.user,
+                original_filename='passport.pdf',
+                file=SimpleUploadedFile('passport.pdf', b'%PDF-1.4', content_type='application/pdf'),
+            )
+        self.bucket.calls.clear()
+
+    def download(self, mode):
+        with mock.patch('common.storage.client_registry.get', return_value=self.bucket):
+            return self.client.post(f'/api/v1/documents/{self.document.pk}/download/?mode={mode}')
+
+    def test_signed_url_is_reused_and_every_download_is_logged(self):
+        first = self.download('url')
+        second = self.download('url')
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['url'], second.data['url'])
+        self.assertEqual(self.bucket.calls, ['sign'])
+        self.assertEqual(
+            DocumentAccessLog.objects.filter(document=self.document, action='download').count(), 2
+        )
+
+    def test_redirect_mode_redirects_to_signed_url(self):
+        response = self.download('redirect')
+
+        self.assertEqual(response.status_code, status.HTTP_303_SEE_OTHER)
+        self.assertTrue(response['Location'].startswith('https://storage.test/sign/'))
+
+    def test_storage_without_signed_urls_serves_file(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        storage = LocalFileSystemStorage('documents', location=root)
+        storage.bucket.upload_stream(self.document.file.name, [b'%PDF-1.4'], 'application/pdf')
+
+        with mock.patch.object(Document._meta.get_field('file'), 'storage', storage), \
+                mock.patch.object(storage, 'signed_url', create=True) as signed_url:
+            for mode in ('url', 'redirect'):
+                response = self.download(mode)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+                response.close()
+
+        signed_url.assert_not_called()
+
+
+@override_settings(CONTENT_CACHE_MAX_SIZE=0)
+class DocumentRangeDownloadTests(APITestCase):
+    content = b'%PDF-1.4 ' + bytes(range(256)) * 4
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        self.bucket = CountingBucket()
+        with mock.patch('common.storage.get_storage_bucket', return_value=self.bucket):
+            self.document = Document.objects.create(
+                title='Passport',
+                owner=self.user,
+                original_filename='passport.pdf',
+                file=SimpleUploadedFile('passport.pdf', self.content, content_type='application/pdf'),
+            )
+        self.bucket.calls.clear()
+        self.url = f'/api/v1/documents/{self.document.pk}/download/'
+
+    def get(self, **headers):
+        with mock.patch('common.storage.client_registry.get', return_value=self.bucket):
+            return self.client.get(self.url, headers=headers)
+
+    def test_full_download_sends_validators(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.content).hexdigest()}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('Last-Modified', response)
+
+    def test_range_returns_partial_content(self):
+        response = self.get(Range='bytes=10-19')
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        response = self.get(Range='bytes=10-19', If_Range='"stale"')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range=f'bytes={len(self.content)}-')
+
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_unchanged_file_is_not_modified_without_storage_access(self):
+        etag = self.get()['ETag']
+        self.bucket.calls.clear()
+
+        response = self.get(If_None_Match=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.bucket.calls, [])
+        self.assertEqual(
+            DocumentAccessLog.objects.filter(document=self.document, action='download').count(), 1
+        )
+
+
+class DocumentContentCacheTests(APITestCase):
+    content = b'%PDF-1.4 cached document'
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_root, True)
+        settings_override = override_settings(CONTENT_CACHE_ROOT=self.cache_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        self.bucket = CountingBucket()
+        with mock.patch('common.storage.get_storage_bucket', return_value=self.bucket):
+            self.document = Document.objects.create(
+                title='Passport',
+                owner=self.user,
+                original_filename='passport.pdf',
+                file=SimpleUploadedFile('passport.pdf', self.content, content_type='application/pdf'),
+            )
+        self.bucket.calls.clear()
+
+    def get(self, **headers):
+        with mock.patch('common.storage.client_registry.get', return_value=self.bucket):
+            response = self.client.get(f'/api/v1/documents/{self.document.pk}/download/', headers=headers)
+        body = b''.join(response.streaming_content)
+        response.close()
+        return response, body
+
+    def test_repeat_downloads_are_served_from_disk(self):
+        for _ in range(3):
+            response, body = self.get()
+            self.assertEqual(body, self.content)
+        _, ranged = self.get(Range='bytes=0-3')
+
+        self.assertEqual(ranged, self.content[:4])
+        self.assertEqual(self.bucket.calls, ['download'])
+
+
+@override_settings(UPLOAD_MIN_PART_SIZE=4)
+class DocumentUploadSessionTests(APITestCase):
+    content = b'%PDF-1.4 uploaded in parts'
+
+    def setUp(self):
+        self.staging_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.staging_root, True)
+        settings_override = override_settings(UPLOAD_STAGING_ROOT=self.staging_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        self.bucket = CountingBucket()
+        bucket_patch = mock.patch('common.storage.get_storage_bucket', return_value=self.bucket)
+        bucket_patch.start()
+        self.addCleanup(bucket_patch.stop)
+
+    def start(self, part_size=10):
+        response = self.client.post('/api/v1/documents/uploads/', {
+            'filename': 'contract.pdf',
+            'content_type': 'application/pdf',
+            'total_size': len(self.content),
+            'part_size': part_size,
+            'title': 'Contract',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return response.data
+
+    def put_part(self, session_id, part_number, content, checksum=None):
+        data = {'file': SimpleUploadedFile(f'part-{part_number}', content)}
+        if checksum:
+            data['checksum'] = checksum
+        return self.client.put(
+            f'/api/v1/documents/uploads/{session_id}/parts/{part_number}/', data, format='multipart'
+        )
+
+    def parts(self, part_size=10):
+        return [self.content[i:i + part_size] for i in range(0, len(self.content), part_size)]
+
+    def complete(self, session_id):
+        return self.client.post(f'/api/v1/documents/uploads/{session_id}/complete/')
+
+    def test_init_reports_part_layout(self):
+        session = self.start()
+
+        self.assertEqual(session['total_parts'], 3)
+        self.assertEqual(session['uploaded_parts'], [])
+        self.assertEqual(session['status'], 'active')
+
+    def test_parts_in_any_order_assemble_into_document(self):
+        session = self.start()
+        for part_number, part in reversed(list(enumerate(self.parts(), start=1))):
+            response = self.put_part(session['id'], part_number, part, hashlib.sha256(part).hexdigest())
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+        response = self.complete(session['id'])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        document = Document.objects.get(pk=response.data['id'])
+        self.assertEqual(self.bucket.objects[document.file.name], self.content)
+        self.assertEqual(document.file_checksum, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).document, document)
+        # Staged parts are discarded once the document exists
+        self.assertEqual(os.listdir(self.staging_root), [])
+
+    def test_wrong_part_size_is_rejected(self):
+        session = self.start()
+
+        response = self.put_part(session['id'], 1, b'short')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(UploadPart.objects.exists())
+
+    def test_complete_lists_missing_parts(self):
+        session = self.start()
+        self.put_part(session['id'], 2, self.parts()[1])
+
+        response = self.complete(session['id'])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['missing_parts'], [1, 3])
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(self.bucket.calls, [])
+
+    def test_bad_checksum_keeps_previous_part_and_retry_succeeds(self):
+        session = self.start()
+        part = self.parts()[0]
+        checksum = hashlib.sha256(part).hexdigest()
+        self.put_part(session['id'], 1, part, checksum)
+
+        corrupted = self.put_part(session['id'], 1, b'X' * len(part), checksum)
+
+        self.assertEqual(corrupted.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(corrupted.data['checksum'], hashlib.sha256(b'X' * len(part)).hexdigest())
+        # The good part staged earlier was not replaced and no temp file is left
+        staged = os.path.join(self.staging_root, session['id'])
+        self.assertEqual(os.listdir(staged), ['000001.part'])
+        with open(os.path.join(staged, '000001.part'), 'rb') as stored:
+            self.assertEqual(stored.read(), part)
+
+        retried = self.put_part(session['id'], 1, part, checksum.upper())
+        self.assertEqual(retried.status_code, status.HTTP_200_OK, retried.data)
+        self.assertEqual(UploadPart.objects.get().checksum, checksum)
+
+    def test_abort_discards_parts(self):
+        session = self.start()
+        self.put_part(session['id'], 1, self.parts()[0])
+
+        response = self.client.delete(f'/api/v1/documents/uploads/{session["id"]}/')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, 'aborted')
+        self.assertFalse(os.path.exists(os.path.join(self.staging_root, session['id'])))
+        self.assertEqual(self.put_part(session['id'], 2, self.parts()[1]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.complete(session['id']).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_session_rejects_parts_and_completion(self):
+        session = self.start()
+        for part_number, part in enumerate(self.parts(), start=1):
+            self.put_part(session['id'], part_number, part)
+        UploadSession.objects.filter(pk=session['id']).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.complete(session['id'])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, 'expired')
+        self.assertFalse(os.path.exists(os.path.join(self.staging_root, session['id'])))
+        self.assertFalse(Document.objects.exists())
+
+    def test_session_finished_during_upload_releases_blob(self):
+        session = self.start()
+        for part_number, part in enumerate(self.parts(), start=1):
+            self.put_part(session['id'], part_number, part)
+
+        def abort_meanwhile(*args, **kwargs):
+            UploadSession.objects.filter(pk=session['id']).update(status='aborted')
+            return upload_file_to_supabase(*args, **kwargs)
+
+        with mock.patch('common.blobs.upload_file_to_supabase', side_effect=abort_meanwhile), \
+                mock.patch('documents.views.schedule_garbage_collection') as collect:
+            response = self.complete(session['id'])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(StoredBlob.objects.get().ref_count, 0)
+        collect.assert_called_once()
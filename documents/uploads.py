@@ -0,0 +1,129 @@
+"""
+Staging area for resumable multipart document uploads
+"""
+import os
+import uuid
+import shutil
+import hashlib
+from django.conf import settings
+from django.core.files.base import File
+
+
+def session_dir(session):
+    """Directory holding the staged parts of an upload session"""
+    return os.path.join(str(settings.UPLOAD_STAGING_ROOT), str(session.id))
+
+
+def part_path(session, part_number):
+    """Path of a staged part"""
+    return os.path.join(session_dir(session), f"{part_number:06d}.part")
+
+
+class ChecksumMismatch(ValueError):
+    """A part's content does not match the checksum sent with it"""
+    
+    def __init__(self, checksum):
+        super().__init__(f"Checksum mismatch: received content hashes to {checksum}")
+        self.checksum = checksum
+
+
+def store_part(session, part_number, content, expected_checksum=None):
+    """
+    Write a part to the staging area.
+    
+    The part is written to a temporary file and renamed into place, so
+    parallel or retried uploads of the same part never leave a torn file.
+    With expected_checksum, the temporary file is only renamed into place
+    if its SHA-256 matches, so a corrupted retry never replaces a good part.
+    
+    Returns:
+        tuple: (size, sha256 checksum) of the stored part
+    
+    Raises:
+        ChecksumMismatch: The content does not hash to expected_checksum
+    """
+    os.makedirs(session_dir(session), exist_ok=True)
+    target = part_path(session, part_number)
+    tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as tmp:
+            for chunk in content.chunks():
+                digest.update(chunk)
+                size += len(chunk)
+                tmp.write(chunk)
+        checksum = digest.hexdigest()
+        if expected_checksum and expected_checksum.lower() != checksum:
+            raise ChecksumMismatch(checksum)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, checksum
+
+
+def discard(session):
+    """Remove every staged part of an upload session"""
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+
+
+class StagedPartsFile(File):
+    """
+    Read-only file made of an upload session's staged parts in order.
+    
+    Chunks are read from each part file in turn, so the assembled document
+    is streamed to storage without being copied or held in memory.
+    """
+    
+    def __init__(self, session):
+        self.paths = [part_path(session, n) for n in range(1, session.total_parts + 1)]
+        self.content_type = session.content_type
+        super().__init__(None, name=session.filename)
+        self.size = session.total_size
+        self._index = 0
+        self._current = None
+    
+    def chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+        for path in self.paths:
+            with open(path, 'rb') as part:
+                while True:
+                    data = part.read(chunk_size)
+                    if not data:
+                        break
+                    yield data
+    
+    def seek(self, position):
+        if position != 0:
+            raise ValueError('StagedPartsFile only supports rewinding')
+        self.close()
+        self._index = 0
+    
+    def read(self, size=-1):
+        buffer = b''
+        while self._index < len(self.paths) and (size < 0 or len(buffer) < size):
+            if self._current is None:
+                self._current = open(self.paths[self._index], 'rb')
+            data = self._current.read(-1 if size < 0 else size - len(buffer))
+            if not data:
+                self._current.close()
+                self._current = None
+                self._index += 1
+                continue
+            buffer += data
+        return buffer
+    
+    def open(self, mode=None):
+        self.seek(0)
+        return self
+    
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+    
+    @property
+    def closed(self):
+        return self._current is None
@@ -1,15 +1,20 @@
 from django.shortcuts import render
-from rest_framework import status, generics, permissions, viewsets
+from rest_framework import status, generics, permissions, viewsets, mixins
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count, Sum
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponseRedirect
+from django.db.models import Q
 from django.utils import timezone
+from datetime import datetime, timezone as dt_timezone
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from .models import (
     DocumentCategory, Document, DocumentAccess, DocumentAccessLog,
-    DocumentShare, DocumentRequest
+    DocumentShare, DocumentRequest, UploadSession, UploadPart
 )
 from .serializers import (
     DocumentCategorySerializer, DocumentCategoryCreateSerializer,
@@ -19,9 +24,19 @@ from .serializers import (
     DocumentShareCreateSerializer, DocumentRequestSerializer,
     DocumentRequestCreateSerializer, DocumentRequestResponseSerializer,
     DocumentStatsSerializer, DocumentSearchSerializer,
-    DocumentBulkActionSerializer, DocumentVersionSerializer
+    DocumentBulkActionSerializer, DocumentVersionSerializer,
+    UploadSessionSerializer, UploadSessionCreateSerializer, UploadPartSerializer
+)
+from .uploads import ChecksumMismatch, store_part, discard, StagedPartsFile
+from .downloads import (
+    get_download_permission, can_sign_urls, get_signed_download_url, document_file_response,
+    not_modified_response, is_initial_fetch
 )
 from auth_api.models import UserActivity
+from common.pagination import KeysetPagination
+from common.blobs import release_blob, schedule_garbage_collection
+from .stats import RANKINGS, get_document_stats, load_top_documents
+from .shares import SHARED, share_documents
 
 
 class DocumentCategoryViewSet(viewsets.ModelViewSet):
@@ -56,6 +71,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
     """Document management"""
     serializer_class = DocumentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['category', 'trust_level', 'status', 'owner', 'created_at']
     search_fields = ['title', 'description', 'tags']
@@ -65,9 +81,11 @@ class DocumentViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         # Users can see their own documents and documents shared with them
-        return Document.objects.filter(
-            Q(owner=user) | Q(access_permissions__user=user)
-        ).distinct()
+        queryset = Document.objects.visible_to(user)
+        if self.action in ('list', 'retrieve'):
+            # Everything the serializer reads comes from this one query
+            queryset = queryset.select_related('owner', 'category', 'issuer')
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -80,7 +98,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
         
         # Log activity
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='document_uploaded',
             description=f'Uploaded document: {serializer.instance.title}',
@@ -92,7 +110,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
         serializer.save()
         
         # Log activity
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='document_updated',
             description=f'Updated document: {serializer.instance.title}',
@@ -102,7 +120,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
     
     def perform_destroy(self, instance):
         # Log activity before deletion
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='document_deleted',
             description=f'Deleted document: {instance.title}',
@@ -138,14 +156,15 @@ class DocumentViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         # Log document view
         instance = self.get_object()
-        DocumentAccessLog.objects.create(
+        DocumentAccessLog.objects.log(
             document=instance,
             user=request.user,
             action='view',
             ip_address=self.get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
-        return super().retrieve(request, *args, **kwargs)
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
     
     @extend_schema(
         summary="Update document",
@@ -161,27 +180,53 @@ class DocumentViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
     
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['get', 'post'])
     @extend_schema(
         summary="Download document",
-        description="Download document file"
+        description="Download document file. With mode=url the response is a short-lived "
+                    "signed URL to fetch the file from directly; with mode=redirect the "
+                    "client is redirected to it. Files in storage that cannot sign URLs "
+                    "are always streamed. Streamed downloads support Range/If-Range (206) "
+                    "and conditional requests against the ETag and Last-Modified headers (304).",
+        parameters=[
+            OpenApiParameter(name='mode', description='stream, url or redirect', required=False, type=str),
+        ]
     )
     def download(self, request, pk=None):
         document = self.get_object()
         
-        # Log download
-        DocumentAccessLog.objects.create(
-            document=document,
-            user=request.user,
-            action='download',
-            ip_address=self.get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
+        # Unchanged files are answered from the stored validators
+        response = not_modified_response(request, document)
+        if response is not None:
+            return response
         
-        # Return file response
-        from django.http import FileResponse
-        response = FileResponse(document.file, as_attachment=True, filename=document.original_filename)
-        return response
+        # Log download (continuation ranges of the same download are not logged)
+        if is_initial_fetch(request):
+            DocumentAccessLog.objects.log(
+                document=document,
+                user=request.user,
+                action='download',
+                ip_address=self.get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+        
+        mode = request.query_params.get('mode', settings.DOCUMENT_DOWNLOAD_MODE)
+        # Storage that cannot sign URLs is always served directly
+        if mode in ('url', 'redirect') and can_sign_urls(document):
+            url, expires_at = get_signed_download_url(
+                document, get_download_permission(document, request.user)
+            )
+            if mode == 'redirect':
+                response = HttpResponseRedirect(url)
+                response.status_code = 303
+                return response
+            return Response({
+                'url': url,
+                'expires_at': datetime.fromtimestamp(expires_at, tz=dt_timezone.utc),
+            })
+        
+        # Return file response, handing the transfer to nginx when possible
+        return document_file_response(document, request)
     
     @action(detail=False, methods=['post'])
     @extend_schema(
@@ -208,16 +253,14 @@ class DocumentViewSet(viewsets.ModelViewSet):
             elif action == 'share':
                 target_user_id = serializer.validated_data.get('target_user')
                 permission = serializer.validated_data.get('permission', 'view')
-                if target_user_id:
-                    target_user = CustomUser.objects.get(id=target_user_id)
-                    for doc in documents:
-                        DocumentShare.objects.create(
-                            document=doc,
-                            shared_by=request.user,
-                            shared_with=target_user,
-                            permission=permission
-                        )
-                    message = f'Shared {documents.count()} documents'
+                if not target_user_id:
+                    return Response(
+                        {'target_user': ['This field is required for the share action.']},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                results = share_documents(request.user, document_ids, [target_user_id], permission=permission)
+                shared_count = sum(result['status'] == SHARED for result in results)
+                return Response({'message': f'Shared {shared_count} documents', 'results': results})
             
             return Response({'message': message})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -225,38 +268,13 @@ class DocumentViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     @extend_schema(
         summary="Document statistics",
-        description="Get document statistics and analytics"
+        description="Get document statistics and analytics. Totals, breakdowns and rankings "
+                    "are cached per user until one of the user's documents or its access log changes."
     )
     def stats(self, request):
-        user = request.user
-        
-        # Calculate statistics
-        total_documents = Document.objects.filter(owner=user).count()
-        total_size = Document.objects.filter(owner=user).aggregate(
-            total=Sum('file_size')
-        )['total'] or 0
-        
-        documents_by_category = Document.objects.filter(owner=user).values(
-            'category__name'
-        ).annotate(count=Count('id'))
-        
-        documents_by_trust_level = Document.objects.filter(owner=user).values(
-            'trust_level'
-        ).annotate(count=Count('id'))
-        
-        recent_uploads = Document.objects.filter(owner=user).order_by('-created_at')[:5]
-        most_viewed = Document.objects.filter(owner=user).order_by('-access_logs__count')[:5]
-        most_downloaded = Document.objects.filter(owner=user).order_by('-access_logs__count')[:5]
-        
-        stats = {
-            'total_documents': total_documents,
-            'total_size': total_size,
-            'documents_by_category': list(documents_by_category),
-            'documents_by_trust_level': list(documents_by_trust_level),
-            'recent_uploads': DocumentSerializer(recent_uploads, many=True).data,
-            'most_viewed': DocumentSerializer(most_viewed, many=True).data,
-            'most_downloaded': DocumentSerializer(most_downloaded, many=True).data,
-        }
+        stats = load_top_documents(get_document_stats(request.user.id))
+        for key in RANKINGS.values():
+            stats[key] = DocumentSerializer(stats[key], many=True, context={'request': request}).data
         
         serializer = DocumentStatsSerializer(stats)
         return Response(serializer.data)
@@ -290,7 +308,7 @@ class DocumentAccessViewSet(viewsets.ModelViewSet):
         serializer.save(granted_by=self.request.user)
         
         # Log activity
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='access_granted',
             description=f'Granted access to document: {serializer.instance.document.title}',
@@ -311,15 +329,19 @@ class DocumentAccessLogViewSet(viewsets.ReadOnlyModelViewSet):
     """Document access log view"""
     serializer_class = DocumentAccessLogSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    cursor_field = 'accessed_at'
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['document', 'user', 'action', 'accessed_at']
     ordering = ['-accessed_at']
     
     def get_queryset(self):
         user = self.request.user
-        return DocumentAccessLog.objects.filter(
-            Q(document__owner=user) | Q(user=user)
-        )
+        # UNION of IDs so each side is an index lookup; OR-ing across the
+        # join to Document forces a scan of the whole log
+        own = DocumentAccessLog.objects.filter(user=user).order_by().values('pk')
+        on_owned = DocumentAccessLog.objects.filter(document__owner=user).order_by().values('pk')
+        return DocumentAccessLog.objects.filter(pk__in=own.union(on_owned))
 
 
 class DocumentShareViewSet(viewsets.ModelViewSet):
@@ -344,7 +366,7 @@ class DocumentShareViewSet(viewsets.ModelViewSet):
         serializer.save(shared_by=self.request.user)
         
         # Log activity
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='document_shared',
             description=f'Shared document: {serializer.instance.document.title}',
@@ -403,7 +425,7 @@ class DocumentRequestViewSet(viewsets.ModelViewSet):
         serializer.save(requester=self.request.user)
         
         # Log activity
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='document_requested',
             description=f'Requested document: {serializer.instance.title}',
@@ -415,7 +437,7 @@ class DocumentRequestViewSet(viewsets.ModelViewSet):
         serializer.save()
         
         # Log activity
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='request_responded',
             description=f'Responded to document request: {serializer.instance.title}',
@@ -487,7 +509,7 @@ class DocumentIssueView(APIView):
             )
             
             # Log activity
-            UserActivity.objects.create(
+            UserActivity.objects.log(
                 user=request.user,
                 activity_type='document_issued',
                 description=f'Issued document: {document.title}',
@@ -505,3 +527,184 @@ class DocumentIssueView(APIView):
         else:
             ip = request.META.get('REMOTE_ADDR')
         return ip
+
+
+class DocumentUploadSessionViewSet(mixins.CreateModelMixin,
+                                   mixins.RetrieveModelMixin,
+                                   mixins.ListModelMixin,
+                                   mixins.DestroyModelMixin,
+                                   viewsets.GenericViewSet):
+    """Resumable multipart document uploads"""
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user).prefetch_related('parts')
+    
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return UploadSessionCreateSerializer
+        return UploadSessionSerializer
+    
+    @extend_schema(
+        summary="Start upload session",
+        description="Start a resumable upload; the response gives the part size and number of parts to send",
+        responses={201: UploadSessionSerializer}
+    )
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload_session = serializer.save()
+        return Response(UploadSessionSerializer(upload_session).data, status=status.HTTP_201_CREATED)
+    
+    @extend_schema(
+        summary="Get upload session",
+        description="Get upload progress, including which parts have been received, to resume an upload"
+    )
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    @extend_schema(
+        summary="Abort upload session",
+        description="Abort the upload and discard every staged part"
+    )
+    def destroy(self, request, *args, **kwargs):
+        upload_session = self.get_object()
+        if upload_session.status == 'completed':
+            return Response({'error': 'Upload already completed'}, status=status.HTTP_400_BAD_REQUEST)
+        upload_session.status = 'aborted'
+        upload_session.save(update_fields=['status', 'updated_at'])
+        discard(upload_session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=True, methods=['put'], url_path=r'parts/(?P<part_number>\d+)', parser_classes=[MultiPartParser])
+    @extend_schema(
+        summary="Upload part",
+        description="Upload part N (1-based) of the file. Parts may be sent in any order and in parallel; re-sending a part replaces it.",
+        request=UploadPartSerializer
+    )
+    def upload_part(self, request, pk=None, part_number=None):
+        upload_session = self.get_object()
+        error = self.check_active(upload_session)
+        if error:
+            return error
+        
+        part_number = int(part_number)
+        if not 1 <= part_number <= upload_session.total_parts:
+            return Response(
+                {'error': f'Part number must be between 1 and {upload_session.total_parts}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = UploadPartSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        content = serializer.validated_data['file']
+        expected_size = upload_session.expected_part_size(part_number)
+        if content.size != expected_size:
+            return Response(
+                {'error': f'Part {part_number} must be {expected_size} bytes'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            size, checksum = store_part(
+                upload_session, part_number, content, serializer.validated_data.get('checksum')
+            )
+        except ChecksumMismatch as e:
+            return Response(
+                {'error': 'Checksum mismatch', 'checksum': e.checksum},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        UploadPart.objects.update_or_create(
+            session=upload_session,
+            part_number=part_number,
+            defaults={'size': size, 'checksum': checksum}
+        )
+        return Response({'part_number': part_number, 'size': size, 'checksum': checksum})
+    
+    @action(detail=True, methods=['post'])
+    @extend_schema(
+        summary="Complete upload session",
+        description="Assemble the uploaded parts into a new document",
+        request=None,
+        responses={201: DocumentSerializer}
+    )
+    def complete(self, request, pk=None):
+        upload_session = self.get_object()
+        error = self.check_active(upload_session)
+        if error:
+            return error
+        
+        received = set(upload_session.parts.values_list('part_number', flat=True))
+        missing = [n for n in range(1, upload_session.total_parts + 1) if n not in received]
+        if missing:
+            return Response(
+                {'error': 'Upload is incomplete', 'missing_parts': missing},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        document = Document(
+            title=upload_session.title,
+            description=upload_session.description,
+            file=StagedPartsFile(upload_session),
+            original_filename=upload_session.filename,
+            owner=request.user,
+            category=upload_session.category,
+            trust_level=upload_session.trust_level,
+            tags=upload_session.tags,
+            metadata=upload_session.metadata,
+            expiry_date=upload_session.expiry_date,
+        )
+        # Send the assembled file to storage before locking the session, so
+        # the row lock is only held for the bookkeeping below
+        document.file.save(document.file.name, document.file.file, save=False)
+        
+        with transaction.atomic():
+            upload_session = UploadSession.objects.select_for_update().get(pk=upload_session.pk)
+            error = self.check_active(upload_session)
+            if not error:
+                document.save()
+                upload_session.status = 'completed'
+                upload_session.document = document
+                upload_session.save(update_fields=['status', 'document', 'updated_at'])
+        
+        if error:
+            # Completed, aborted or expired while the file was being stored
+            if release_blob(document.file.field.bucket_name, document.file.name):
+                schedule_garbage_collection()
+            return error
+        
+        discard(upload_session)
+        
+        # Log activity
+        UserActivity.objects.log(
+            user=request.user,
+            activity_type='document_uploaded',
+            description=f'Uploaded document: {document.title}',
+            ip_address=self.get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        )
+        
+        return Response(DocumentSerializer(document).data, status=status.HTTP_201_CREATED)
+    
+    def check_active(self, upload_session):
+        """Return an error response if the session can no longer accept changes"""
+        if upload_session.status == 'active' and upload_session.is_expired:
+            upload_session.status = 'expired'
+            upload_session.save(update_fields=['status', 'updated_at'])
+            discard(upload_session)
+        if upload_session.status != 'active':
+            return Response(
+                {'error': f'Upload session is {upload_session.status}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return None
+    
+    def get_client_ip(self, request):
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            ip = x_forwarded_for.split(',')[0]
+        else:
+            ip = request.META.get('REMOTE_ADDR')
+        return ip
@@ -92,6 +92,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "neodocs.wsgi.application"
 
+TEST_RUNNER = "neodocs.test_runner.TestRunner"
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -401,8 +403,47 @@ SUPABASE_SERVICE_ROLE_KEY = config(
 SUPABASE_STORAGE_BUCKET = config("SUPABASE_STORAGE_BUCKET", default="documents")
 SUPABASE_STORAGE_PUBLIC_URL = config(
     "SUPABASE_STORAGE_PUBLIC_URL",
-    default="https://your-project.supabase.co/storage/v1/object/public",
-)
+    default=f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/public",
+)  # public URLs are <this>/<bucket>/<name>, built without a storage call
+STORAGE_URL_CACHE_SIZE = config(
+    "STORAGE_URL_CACHE_SIZE", default=4096, cast=int
+)  # memoised public URLs per process
+
+# Supabase connection pool (per worker process)
+SUPABASE_POOL_SIZE = config("SUPABASE_POOL_SIZE", default=10, cast=int)
+SUPABASE_POOL_IDLE_TIMEOUT = config(
+    "SUPABASE_POOL_IDLE_TIMEOUT", default=30, cast=float
+)  # seconds
+SUPABASE_STORAGE_TIMEOUT = config(
+    "SUPABASE_STORAGE_TIMEOUT", default=20, cast=float
+)  # seconds
+
+# In-memory cache in front of storage, for object metadata and signed URLs:
+# Redis or Memcached shared by the workers in production, local memory only
+# for a single worker
+CACHES["storage"] = {
+    "BACKEND": config(
+        "STORAGE_CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+    ),
+    "LOCATION": config("STORAGE_CACHE_LOCATION", default="storage"),
+}
+
+# Storage metadata cache (size, content type, etag, mtime per object)
+STORAGE_METADATA_CACHE_ALIAS = config("STORAGE_METADATA_CACHE_ALIAS", default="storage")
+STORAGE_METADATA_CACHE_TTL = config(
+    "STORAGE_METADATA_CACHE_TTL", default=300, cast=int
+)  # seconds
+STORAGE_METADATA_CACHE_LOCAL_TTL = config(
+    "STORAGE_METADATA_CACHE_LOCAL_TTL", default=5, cast=int
+)  # seconds a worker trusts its own copy; bounds how long deletes take to propagate
+STORAGE_METADATA_CACHE_MAX_ENTRIES = config(
+    "STORAGE_METADATA_CACHE_MAX_ENTRIES", default=10000, cast=int
+)  # per-process LRU bound
+
+# Uploads are streamed in chunks of this size, bounding memory per upload
+SUPABASE_UPLOAD_CHUNK_SIZE = config(
+    "SUPABASE_UPLOAD_CHUNK_SIZE", default=1024 * 1024, cast=int
+)  # 1MB
 
 # File Upload Settings
 MAX_FILE_SIZE = config("MAX_FILE_SIZE", default=10 * 1024 * 1024, cast=int)  # 10MB
@@ -413,5 +454,117 @@ ALLOWED_IMAGE_TYPES = config(
     "ALLOWED_IMAGE_TYPES", default="jpg,jpeg,png,gif,webp"
 ).split(",")
 
+# Resumable multipart uploads
+UPLOAD_STAGING_ROOT = config(
+    "UPLOAD_STAGING_ROOT", default=BASE_DIR / "upload-staging"
+)
+UPLOAD_PART_SIZE = config("UPLOAD_PART_SIZE", default=5 * 1024 * 1024, cast=int)  # 5MB
+UPLOAD_MIN_PART_SIZE = config("UPLOAD_MIN_PART_SIZE", default=256 * 1024, cast=int)
+UPLOAD_MAX_PART_SIZE = config(
+    "UPLOAD_MAX_PART_SIZE", default=16 * 1024 * 1024, cast=int
+)
+UPLOAD_SESSION_TTL_HOURS = config("UPLOAD_SESSION_TTL_HOURS", default=24, cast=int)
+
+# Document downloads: "stream" through Django, or hand out a signed URL
+# ("url" returns it, "redirect" redirects to it). Clients can pick per request
+# with ?mode=. Signed URLs are reused until REFRESH_MARGIN seconds before expiry.
+DOCUMENT_DOWNLOAD_MODE = config("DOCUMENT_DOWNLOAD_MODE", default="stream")
+DOCUMENT_SIGNED_URL_TTL = config("DOCUMENT_SIGNED_URL_TTL", default=300, cast=int)
+DOCUMENT_SIGNED_URL_REFRESH_MARGIN = config(
+    "DOCUMENT_SIGNED_URL_REFRESH_MARGIN", default=60, cast=int
+)  # seconds
+DOCUMENT_SIGNED_URL_CACHE_ALIAS = config("DOCUMENT_SIGNED_URL_CACHE_ALIAS", default="storage")
+
+# Hand transfers of locally stored files to the front-end web server:
+# "x-accel" (nginx X-Accel-Redirect to DOWNLOAD_ACCEL_STORAGE_URL, an internal
+# location aliased to LOCAL_STORAGE_ROOT), "x-sendfile", or "" to stream from Django
+DOWNLOAD_OFFLOAD = config("DOWNLOAD_OFFLOAD", default="")
+DOWNLOAD_ACCEL_STORAGE_URL = config(
+    "DOWNLOAD_ACCEL_STORAGE_URL", default="/internal/storage/"
+)
+DOWNLOAD_ACCEL_CACHE_URL = config("DOWNLOAD_ACCEL_CACHE_URL", default="/internal/cache/")
+
+# Read-through disk cache for downloaded file bytes (0 disables it). Files
+# larger than a quarter of the cache are never cached.
+CONTENT_CACHE_ROOT = config("CONTENT_CACHE_ROOT", default=BASE_DIR / "content-cache")
+CONTENT_CACHE_MAX_SIZE = config(
+    "CONTENT_CACHE_MAX_SIZE", default=1024 * 1024 * 1024, cast=int
+)  # 1GB
+CONTENT_CACHE_STATS_INTERVAL = config(
+    "CONTENT_CACHE_STATS_INTERVAL", default=30, cast=int
+)  # seconds between publishing per-worker hit/eviction counters
+CONTENT_CACHE_FILL_WAIT = config(
+    "CONTENT_CACHE_FILL_WAIT", default=30, cast=int
+)  # seconds a request reading another request's fill waits for new bytes before going to storage
+
+# Content-addressed document blobs: how long a blob must have had no
+# references before the garbage collector removes it from storage
+BLOB_GC_GRACE_SECONDS = config("BLOB_GC_GRACE_SECONDS", default=3600, cast=int)
+
+# Audit log writer (UserActivity, DocumentAccessLog, SharingActivity).
+# "async" queues records and writes them in batches from a background thread,
+# "sync" writes each record immediately; TEST_RUNNER runs the test suite sync.
+AUDIT_LOG_MODE = config("AUDIT_LOG_MODE", default="async")
+AUDIT_BATCH_SIZE = config("AUDIT_BATCH_SIZE", default=500, cast=int)
+AUDIT_FLUSH_INTERVAL = config(
+    "AUDIT_FLUSH_INTERVAL", default=1.0, cast=float
+)  # seconds
+AUDIT_QUEUE_SIZE = config("AUDIT_QUEUE_SIZE", default=10000, cast=int)
+# What to do with a record when the queue is full: "sync" (write it inline),
+# "block" (wait for room) or "drop"
+AUDIT_OVERFLOW = config("AUDIT_OVERFLOW", default="sync")
+
+# Dashboard document stats: cached per user and dropped whenever one of the
+# user's documents or its access log changes; the TTL is a backstop
+DOCUMENT_STATS_CACHE_TTL = config(
+    "DOCUMENT_STATS_CACHE_TTL", default=3600, cast=int
+)  # seconds
+DOCUMENT_STATS_TOP = config("DOCUMENT_STATS_TOP", default=5, cast=int)
+
+# Rows per INSERT when sharing many documents with many users at once
+BULK_SHARE_BATCH_SIZE = config("BULK_SHARE_BATCH_SIZE", default=1000, cast=int)
+
+# QR share images are rendered on first request and cached: the last
+# QR_IMAGE_CACHE_ENTRIES images in each worker's memory, and up to
+# QR_IMAGE_CACHE_MAX_SIZE bytes on local disk for all workers (0 disables it)
+QR_IMAGE_CACHE_ENTRIES = config("QR_IMAGE_CACHE_ENTRIES", default=1024, cast=int)
+QR_IMAGE_CACHE_ROOT = config("QR_IMAGE_CACHE_ROOT", default=BASE_DIR / "qr-image-cache")
+QR_IMAGE_CACHE_MAX_SIZE = config(
+    "QR_IMAGE_CACHE_MAX_SIZE", default=256 * 1024 * 1024, cast=int
+)  # bytes
+QR_IMAGE_MAX_BOX_SIZE = config("QR_IMAGE_MAX_BOX_SIZE", default=40, cast=int)
+QR_IMAGE_MAX_AGE = config("QR_IMAGE_MAX_AGE", default=86400, cast=int)  # seconds
+# Lifetime of the signed image URLs handed out as qr_code_url
+QR_IMAGE_URL_MAX_AGE = config("QR_IMAGE_URL_MAX_AGE", default=7 * 86400, cast=int)  # seconds
+
+# Public QR access: shares and session tokens are cached in the
+# QR_ACCESS_CACHE_ALIAS cache for QR_ACCESS_CACHE_TTL seconds, and in each
+# worker for QR_ACCESS_CACHE_LOCAL_TTL seconds (up to QR_ACCESS_CACHE_MAX_ENTRIES).
+# The alias must be an in-memory cache: Redis or Memcached shared by the
+# workers in production, local memory only for a single worker.
+CACHES["qr-access"] = {
+    "BACKEND": config(
+        "QR_ACCESS_CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+    ),
+    "LOCATION": config("QR_ACCESS_CACHE_LOCATION", default="qr-access"),
+}
+QR_ACCESS_CACHE_ALIAS = config("QR_ACCESS_CACHE_ALIAS", default="qr-access")
+QR_ACCESS_CACHE_TTL = config("QR_ACCESS_CACHE_TTL", default=300, cast=int)  # seconds
+QR_ACCESS_CACHE_LOCAL_TTL = config("QR_ACCESS_CACHE_LOCAL_TTL", default=5, cast=int)  # seconds
+QR_ACCESS_CACHE_MAX_ENTRIES = config("QR_ACCESS_CACHE_MAX_ENTRIES", default=10000, cast=int)
+
 # Default file storage
 DEFAULT_FILE_STORAGE = "common.storage.SupabaseStorage"
+
+# Storage backend per bucket: "supabase" or "local". FILE_STORAGE_BUCKET_BACKENDS
+# overrides the default for individual buckets, e.g. "documents=local,qr-codes=local"
+FILE_STORAGE_BACKEND = config("FILE_STORAGE_BACKEND", default="supabase")
+FILE_STORAGE_BUCKET_BACKENDS = dict(
+    item.split("=", 1)
+    for item in config("FILE_STORAGE_BUCKET_BACKENDS", default="").split(",")
+    if item
+)
+
+# Local filesystem storage backend
+LOCAL_STORAGE_ROOT = config("LOCAL_STORAGE_ROOT", default=BASE_DIR / "storage")
+LOCAL_STORAGE_URL = config("LOCAL_STORAGE_URL", default="/storage/")
@@ -0,0 +1,22 @@
+"""
+Test runner for the project's test suite
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that writes audit log records synchronously, so tests can
+    assert on them as soon as a request returns. Tests of the background
+    audit writer opt back in with override_settings(AUDIT_LOG_MODE="async").
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.audit_settings = override_settings(AUDIT_LOG_MODE="sync")
+        self.audit_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.audit_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -51,6 +51,7 @@ from documents.views import (
     DocumentShareViewSet,
     DocumentRequestViewSet,
     DocumentIssueView,
+    DocumentUploadSessionViewSet,
 )
 from sharing.views import (
     QRCodeShareViewSet,
@@ -59,6 +60,8 @@ from sharing.views import (
     DocumentRequestResponseViewSet,
     ShareNotificationViewSet,
     QRCodeAccessView,
+    QRCodeDownloadView,
+    QRCodeImageView,
     ShareStatsView,
     BulkShareView,
 )
@@ -68,11 +71,14 @@ router = DefaultRouter()
 router.register(
     r"documents/categories", DocumentCategoryViewSet, basename="document-category"
 )
-router.register(r"documents", DocumentViewSet, basename="document")
+router.register(
+    r"documents/uploads", DocumentUploadSessionViewSet, basename="document-upload"
+)
 router.register(r"documents/access", DocumentAccessViewSet, basename="document-access")
 router.register(
     r"documents/access-logs", DocumentAccessLogViewSet, basename="document-access-log"
 )
+router.register(r"documents", DocumentViewSet, basename="document")
 router.register(r"sharing/requests", DocumentShareViewSet, basename="document-share")
 router.register(
     r"sharing/requests", DocumentRequestViewSet, basename="document-request"
@@ -173,6 +179,16 @@ urlpatterns = [
                 ),
                 # Sharing endpoints
                 path("sharing/access/", QRCodeAccessView.as_view(), name="qr-access"),
+                path(
+                    "sharing/download/<str:session_token>/",
+                    QRCodeDownloadView.as_view(),
+                    name="qr-download",
+                ),
+                path(
+                    "sharing/qr-images/<str:token>/",
+                    QRCodeImageView.as_view(),
+                    name="qr-image",
+                ),
                 path("sharing/stats/", ShareStatsView.as_view(), name="share-stats"),
                 path("sharing/bulk/", BulkShareView.as_view(), name="bulk-share"),
                 # Router URLs (ViewSets)
@@ -194,3 +210,6 @@ urlpatterns = [
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+    urlpatterns += static(
+        settings.LOCAL_STORAGE_URL, document_root=settings.LOCAL_STORAGE_ROOT
+    )
@@ -0,0 +1,182 @@
+"""
+Cache of QR shares and share sessions for the public access endpoints
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.utils import timezone
+from common.caches import in_memory_cache
+from .models import QRCodeShare, ShareSession
+
+# Cached marker for share ids and session tokens known not to exist
+MISSING = {'exists': False}
+
+
+class QRAccessCache:
+    """
+    What a scan needs to know about a share and its sessions, without the
+    database.
+    
+    Shares are cached by id as their attributes that do not change while
+    they are scanned (document title and description, permission, creator
+    name, expiry, status, and whether the view limit was reached); the view
+    counter itself is only ever moved by QRCodeShare.objects.claim_view().
+    Sessions are cached by token from the scan that opened them. Entries
+    live in the QR_ACCESS_CACHE_ALIAS cache, which must keep them in memory
+    (see common.caches), for QR_ACCESS_CACHE_TTL seconds, with a
+    bounded in-process LRU in front that holds them for at most
+    QR_ACCESS_CACHE_LOCAL_TTL seconds, the longest another worker can miss
+    an invalidation. Saving or deleting a share or session drops its entry.
+    """
+    
+    def __init__(self, alias=None, timeout=None, local_timeout=None, max_entries=None):
+        self.alias = alias
+        self.timeout = timeout
+        self.local_timeout = local_timeout
+        self.max_entries = max_entries
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @property
+    def cache(self):
+        return in_memory_cache(self.alias or settings.QR_ACCESS_CACHE_ALIAS, 'QR_ACCESS_CACHE_ALIAS')
+    
+    def get_timeout(self):
+        return self.timeout if self.timeout is not None else settings.QR_ACCESS_CACHE_TTL
+    
+    def get_local_timeout(self):
+        return self.local_timeout if self.local_timeout is not None else settings.QR_ACCESS_CACHE_LOCAL_TTL
+    
+    def get_max_entries(self):
+        return self.max_entries if self.max_entries is not None else settings.QR_ACCESS_CACHE_MAX_ENTRIES
+    
+    def share_key(self, share_id):
+        return f"qr-access:share:{share_id}"
+    
+    def session_key(self, session_token):
+        digest = hashlib.sha256(session_token.encode()).hexdigest()
+        return f"qr-access:session:{digest}"
+    
+    def get_share(self, share_id):
+        """A share's cached attributes, loading them on a miss, or None if it does not exist"""
+        key = self.share_key(share_id)
+        entry = self._get(key)
+        if entry is None:
+            qr_share = (
+                QRCodeShare.objects.select_related('document', 'created_by')
+                .only(
+                    'id', 'permission', 'expires_at', 'status', 'max_views', 'current_views',
+                    'document__id', 'document__title', 'document__description',
+                    'created_by__id', 'created_by__full_name',
+                )
+                .filter(pk=share_id).first()
+            )
+            entry = share_entry(qr_share) if qr_share else MISSING
+            self._set(key, entry)
+        return entry if entry != MISSING else None
+    
+    def invalidate_share(self, share_id):
+        self._delete(self.share_key(share_id))
+    
+    def get_session(self, session_token):
+        """A session's cached attributes, loading them on a miss, or None if it does not exist"""
+        key = self.session_key(session_token)
+        entry = self._get(key)
+        if entry is None:
+            session = ShareSession.objects.filter(session_token=session_token).only(
+                'id', 'qr_share_id', 'expires_at', 'status'
+            ).first()
+            entry = session_entry(session) if session else MISSING
+            self._set(key, entry)
+        return entry if entry != MISSING else None
+    
+    def set_session(self, session):
+        self._set(self.session_key(session.session_token), session_entry(session))
+    
+    def invalidate_session(self, session_token):
+        self._delete(self.session_key(session_token))
+    
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+    
+    def _get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            local = self._local.get(key)
+            if local and local[0] > now:
+                self._local.move_to_end(key)
+                return local[1]
+        entry = self.cache.get(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+    
+    def _set(self, key, entry):
+        self._remember(key, entry)
+        self.cache.set(key, entry, self.get_timeout())
+    
+    def _delete(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+        self.cache.delete(key)
+    
+    def _remember(self, key, entry):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.get_local_timeout(), entry)
+            self._local.move_to_end(key)
+            while len(self._local) > self.get_max_entries():
+                self._local.popitem(last=False)
+
+
+def share_entry(qr_share):
+    return {
+        'id': str(qr_share.pk),
+        'document_id': str(qr_share.document_id),
+        'created_by_id': qr_share.created_by_id,
+        'document_title': qr_share.document.title,
+        'document_description': qr_share.document.description or '',
+        'permission': qr_share.permission,
+        'expires_at': qr_share.expires_at,
+        'created_by_name': qr_share.created_by.full_name,
+        'status': qr_share.status,
+        'exhausted': qr_share.is_view_limit_reached,
+    }
+
+
+def session_entry(session):
+    return {
+        'id': str(session.pk),
+        'qr_share_id': str(session.qr_share_id),
+        'expires_at': session.expires_at,
+        'status': session.status,
+    }
+
+
+def is_scannable(share, now=None):
+    """Whether a cached share may still grant views"""
+    return share['status'] == 'active' and share['expires_at'] > (now or timezone.now()) and not share['exhausted']
+
+
+def is_session_open(session, share_id, now=None):
+    """Whether a cached session is active, unexpired and belongs to the share"""
+    return (
+        session['qr_share_id'] == str(share_id)
+        and session['status'] == 'active'
+        and session['expires_at'] >= (now or timezone.now())
+    )
+
+
+access_cache = QRAccessCache()
+
+
+def invalidate_share(sender, instance, **kwargs):
+    """post_save / post_delete receiver for QRCodeShare: revoked, expired, edited or deleted"""
+    access_cache.invalidate_share(instance.pk)
+
+
+def invalidate_session(sender, instance, **kwargs):
+    """post_save / post_delete receiver for ShareSession"""
+    access_cache.invalidate_session(instance.session_token)
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class SharingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "sharing"
+
+    def ready(self):
+        from . import checks  # registers the system checks
+        from .access_cache import invalidate_session, invalidate_share
+        from .models import QRCodeShare, ShareSession
+
+        post_save.connect(invalidate_share, sender=QRCodeShare, dispatch_uid="qr_access_share_on_save")
+        post_delete.connect(invalidate_share, sender=QRCodeShare, dispatch_uid="qr_access_share_on_delete")
+        post_save.connect(invalidate_session, sender=ShareSession, dispatch_uid="qr_access_session_on_save")
+        post_delete.connect(invalidate_session, sender=ShareSession, dispatch_uid="qr_access_session_on_delete")
@@ -0,0 +1,34 @@
+"""
+System checks of the sharing app's settings
+"""
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, Warning, register
+from django.core.exceptions import ImproperlyConfigured
+from common.caches import in_memory_cache
+
+
+@register(Tags.caches)
+def check_qr_access_cache(app_configs, **kwargs):
+    """QR_ACCESS_CACHE_ALIAS must name an in-memory cache"""
+    try:
+        in_memory_cache(settings.QR_ACCESS_CACHE_ALIAS, 'QR_ACCESS_CACHE_ALIAS')
+    except ImproperlyConfigured as exc:
+        return [Error(str(exc), id='sharing.E001')]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def check_qr_access_cache_shared(app_configs, **kwargs):
+    """Local memory is not shared, so each worker would cache and invalidate on its own"""
+    try:
+        cache = in_memory_cache(settings.QR_ACCESS_CACHE_ALIAS, 'QR_ACCESS_CACHE_ALIAS')
+    except ImproperlyConfigured:
+        return []
+    if isinstance(cache, LocMemCache):
+        return [Warning(
+            f"QR_ACCESS_CACHE_ALIAS '{settings.QR_ACCESS_CACHE_ALIAS}' is local memory, which the workers do not share",
+            hint='Point QR_ACCESS_CACHE_BACKEND and QR_ACCESS_CACHE_LOCATION at Redis or Memcached.',
+            id='sharing.W001',
+        )]
+    return []
@@ -0,0 +1,126 @@
+"""
+Benchmark QR share creation and on-demand QR images.
+
+A throwaway test database is seeded with one owner's documents. For each
+batch size, shares are created once with images rendered and uploaded
+eagerly (the previous creation path, against a local sink server speaking
+the Supabase storage upload endpoint with --latency seconds of simulated
+round-trip per upload) and once lazily with sharing.qr_batch.create_qr_shares().
+Then the images of the largest batch are fetched through
+sharing.qr_images.QRImageCache cold, from disk and from memory.
+"""
+import os
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import ThreadingHTTPServer
+from django.db import connection
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+from auth_api.models import CustomUser
+from common.management.commands.bench_upload_memory import SinkHandler
+from common.storage import upload_file_to_supabase
+from documents.models import Document
+from sharing.models import QRCodeShare
+from sharing.qr_batch import create_qr_shares
+from sharing.qr_images import QRImageCache, QRImageDiskCache
+from sharing.rendering import qr_matrix, render_png
+
+
+class SlowSinkHandler(SinkHandler):
+    latency = 0
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        super().do_POST()
+
+
+def upload_image(share):
+    result = upload_file_to_supabase(ContentFile(render_png(share.id), name=f"qr_share_{share.id}.png"), 'qr-codes')
+    share.qr_code_image = result['filename']
+
+
+def create_eagerly(owner, documents, **fields):
+    """Creation with every image rendered and uploaded before returning"""
+    shares = create_qr_shares(owner, documents, **fields)
+    with ThreadPoolExecutor(max_workers=8) as uploads:
+        list(uploads.map(upload_image, shares))
+    QRCodeShare.objects.bulk_update(shares, ['qr_code_image'])
+    return shares
+
+
+class Command(BaseCommand):
+    help = 'Compare eager and lazy QR share creation, and cold and cached QR image fetches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000])
+        parser.add_argument('--latency', type=float, default=0.02, help='Simulated upload round-trip in seconds')
+
+    def handle(self, *args, **options):
+        SlowSinkHandler.latency = options['latency']
+        server = ThreadingHTTPServer(('127.0.0.1', 0), SlowSinkHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'bench_qr_batch.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                SUPABASE_URL=f'http://127.0.0.1:{server.server_port}',
+                FILE_STORAGE_BACKEND='supabase',
+                FILE_STORAGE_BUCKET_BACKENDS={},
+            ), tempfile.TemporaryDirectory() as cache_root:
+                shares = self.run_creation(options['sizes'])
+                self.run_images(shares, cache_root)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            server.shutdown()
+
+    def run_creation(self, sizes):
+        owner = CustomUser.objects.create_user(
+            username='bench', email='bench@example.com', password='!', full_name='Bench'
+        )
+        documents = Document.objects.bulk_create([
+            Document(title=f'Document {index}', owner=owner, file=f'blobs/bench/{index}.pdf',
+                     original_filename=f'{index}.pdf')
+            for index in range(max(sizes))
+        ])
+        fields = {'title': 'Bench', 'expires_at': timezone.now() + timedelta(days=1)}
+
+        self.stdout.write(f"{'codes':>6} {'eager':>10} {'lazy':>10} {'speed-up':>9}")
+        for size in sizes:
+            timings = []
+            for create in (create_eagerly, create_qr_shares):
+                QRCodeShare.objects.all().delete()
+                # Each run encodes its codes from scratch
+                qr_matrix.cache_clear()
+                started = time.perf_counter()
+                shares = create(owner, documents[:size], **fields)
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f'{size:>6} {timings[0] * 1000:>8.0f}ms {timings[1] * 1000:>8.1f}ms {timings[0] / timings[1]:>8.0f}x'
+            )
+        return shares
+
+    def run_images(self, shares, cache_root):
+        images = QRImageCache(disk=QRImageDiskCache(root=cache_root), max_entries=len(shares) * 2)
+        self.stdout.write(f"\n{len(shares)} images, ms per image")
+        self.stdout.write(f"{'format':>6} {'cold':>8} {'disk':>8} {'memory':>8}")
+        for image_format in ('png', 'svg'):
+            timings = []
+            for step in ('cold', 'disk', 'memory'):
+                if step == 'cold':
+                    images.disk.clear()
+                    qr_matrix.cache_clear()
+                if step != 'memory':
+                    images.clear()
+                started = time.perf_counter()
+                for share in shares:
+                    images.get(share.pk, 10, image_format)
+                timings.append((time.perf_counter() - started) / len(shares))
+            self.stdout.write(f'{image_format:>6} ' + ' '.join(f'{timing * 1000:>8.3f}' for timing in timings))
@@ -0,0 +1,113 @@
+"""
+Stress test concurrent scans of one QR share.
+
+A throwaway test database is seeded with a share allowing --max-views views,
+then --scans scans hit it from --threads threads at once, once through the
+previous read-increment-save access path and once through the access
+endpoint, which claims views with a single conditional UPDATE. Each run
+reports the views granted and recorded; the command fails if the endpoint
+granted more than max_views or its counts disagree.
+"""
+import os
+import secrets
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import connection, connections
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from auth_api.models import CustomUser
+from common.audit import audit_writer
+from documents.models import Document
+from sharing.models import QRCodeShare, ShareSession
+
+
+def scan_read_modify_write(share_id):
+    """The previous QRCodeAccessView.post: check, create a session, then increment in Python and save()"""
+    qr_share = QRCodeShare.objects.get(id=share_id)
+    if not qr_share.is_active:
+        return False
+    ShareSession.objects.create(
+        qr_share=qr_share, session_token=secrets.token_urlsafe(32), expires_at=timezone.now() + timedelta(hours=1)
+    )
+    qr_share.current_views += 1
+    qr_share.save()
+    return True
+
+
+def scan_endpoint(share_id):
+    response = APIClient().post('/api/v1/sharing/access/', {'qr_share_id': str(share_id)}, format='json')
+    return response.status_code == 200
+
+
+class Command(BaseCommand):
+    help = 'Scan one QR share from many threads at once and check that max_views holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scans', type=int, default=500)
+        parser.add_argument('--max-views', type=int, default=100)
+        parser.add_argument('--threads', type=int, default=50)
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite':
+            if not test_settings.get('NAME'):
+                # A file, so every thread's connection sees the same database
+                test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'stress_qr_access.sqlite3')
+            # Writers queue on the database lock instead of failing
+            connection.settings_dict.setdefault('OPTIONS', {}).setdefault('timeout', 60)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                failed = self.run(options['scans'], options['max_views'], options['threads'])
+        finally:
+            # The scans' activity is queued for the audit writer
+            audit_writer.close()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        if failed:
+            raise CommandError('max_views did not hold for the access endpoint')
+
+    def run(self, scans, max_views, threads):
+        owner = CustomUser.objects.create_user(
+            username='stress', email='stress@example.com', password='!', full_name='Stress'
+        )
+        document = Document.objects.bulk_create([
+            Document(title='Document', owner=owner, file='blobs/stress/document.pdf', original_filename='document.pdf')
+        ])[0]
+
+        self.stdout.write(f'{scans} scans of a share with max_views={max_views}, {threads} threads')
+        self.stdout.write(f"{'path':>18} {'granted':>8} {'sessions':>9} {'views':>6} {'errors':>7}")
+        held = False
+        for label, scan in (('read-modify-write', scan_read_modify_write), ('conditional UPDATE', scan_endpoint)):
+            share = QRCodeShare.objects.create(
+                document=document, created_by=owner, title=label, max_views=max_views,
+                expires_at=timezone.now() + timedelta(days=1),
+            )
+            granted, errors = self.scan_in_parallel(scan, share.pk, scans, threads)
+            share.refresh_from_db()
+            sessions = ShareSession.objects.filter(qr_share=share).count()
+            self.stdout.write(f'{label:>18} {granted:>8} {sessions:>9} {share.current_views:>6} {errors:>7}')
+            held = granted == sessions == share.current_views <= max_views
+        return not held
+
+    def scan_in_parallel(self, scan, share_id, scans, threads):
+        start = threading.Barrier(threads)
+
+        def worker(_):
+            try:
+                try:
+                    start.wait(timeout=5)
+                except threading.BrokenBarrierError:
+                    pass
+                return scan(share_id), None
+            except Exception as exc:
+                return False, exc
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(worker, range(scans)))
+        return sum(granted for granted, _ in results), sum(error is not None for _, error in results)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:16
+
+import common.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='qrcodeshare',
+            name='qr_code_image',
+            field=common.fields.QRCodeImageField(blank=True, null=True, upload_to='qr-codes/'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0002_alter_qrcodeshare_qr_code_image'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sharingactivity',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_hot_path_indexes'),
+        ('sharing', '0003_audit_event_time'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='qrcodeshare',
+            index=models.Index(fields=['created_by', 'status', 'expires_at'], name='sharing_qrc_created_67d8d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qrcodeshare',
+            index=models.Index(fields=['created_by', '-created_at'], name='sharing_qrc_created_60edd7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qrcodeshare',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['created_by', 'expires_at'], name='qrshare_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharenotification',
+            index=models.Index(fields=['user', '-created_at'], name='sharing_sha_user_id_a872c1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharenotification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-created_at'], name='sharenotif_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharesession',
+            index=models.Index(fields=['qr_share', 'status'], name='sharing_sha_qr_shar_92e1e5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharesession',
+            index=models.Index(fields=['qr_share', '-accessed_at'], name='sharing_sha_qr_shar_401a92_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharingactivity',
+            index=models.Index(fields=['user', '-created_at'], name='sharing_sha_user_id_e87a3b_idx'),
+        ),
+    ]
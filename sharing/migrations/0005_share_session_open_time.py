@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sharesession',
+            name='accessed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
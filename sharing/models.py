@@ -1,12 +1,34 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
+from common.audit import AuditLogManager
 from common.fields import QRCodeImageField
 import uuid
-import qrcode
-from io import BytesIO
-from django.core.files.base import ContentFile
-from PIL import Image
+import secrets
+from datetime import timedelta
+
+
+class QRCodeShareQuerySet(models.QuerySet):
+    def scannable(self, now=None):
+        """Shares that are active, unexpired and below their view limit"""
+        return self.filter(
+            status='active',
+            expires_at__gt=now or timezone.now(),
+            current_views__lt=models.F('max_views'),
+        )
+    
+    def claim_view(self, pk):
+        """
+        Take one of a share's views with a single conditional UPDATE, so
+        concurrent scans can neither lose an increment nor exceed max_views.
+        
+        Returns:
+            bool: whether the view was granted
+        """
+        now = timezone.now()
+        return self.scannable(now).filter(pk=pk).update(
+            current_views=models.F('current_views') + 1, updated_at=now
+        ) == 1
 
 
 class QRCodeShare(models.Model):
@@ -31,7 +53,7 @@ class QRCodeShare(models.Model):
     max_views = models.PositiveIntegerField(default=1)
     current_views = models.PositiveIntegerField(default=0)
     
-    # QR code image - Using Supabase storage
+    # Stored QR code image of older shares; newer shares render it on demand
     qr_code_image = QRCodeImageField(upload_to='qr-codes/', blank=True, null=True)
     
     # Status
@@ -46,45 +68,33 @@ class QRCodeShare(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = QRCodeShareQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'QR Code Share'
         verbose_name_plural = 'QR Code Shares'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', 'status', 'expires_at']),
+            models.Index(fields=['created_by', '-created_at']),
+            # Shares that can still be scanned
+            models.Index(
+                fields=['created_by', 'expires_at'],
+                condition=models.Q(status='active'),
+                name='qrshare_active_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"QR Share: {self.document.title} by {self.created_by.email}"
     
-    def save(self, *args, **kwargs):
-        if not self.qr_code_image:
-            self.generate_qr_code()
-        super().save(*args, **kwargs)
-    
-    def generate_qr_code(self):
-        """Generate QR code for this share"""
-        # Create the share URL
-        share_url = f"https://yourdomain.com/sharing/access/{self.id}/"
-        
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(share_url)
-        qr.make(fit=True)
-        
-        # Create image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to Django file
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        filename = f"qr_share_{self.id}.png"
-        
-        self.qr_code_image.save(filename, ContentFile(buffer.getvalue()), save=False)
-    
     def get_qr_code_url(self):
-        """Get the public URL for the QR code image"""
+        """Get the URL of the QR code image: the stored copy, or a signed image URL"""
         if self.qr_code_image:
             from common.storage import get_file_url
             return get_file_url(self.qr_code_image.name, 'qr-codes')
-        return None
+        from .qr_images import image_url
+        return image_url(self.pk)
     
     @property
     def is_expired(self):
@@ -104,6 +114,32 @@ class QRCodeShare(models.Model):
                 not self.is_view_limit_reached)
 
 
+class ShareSessionManager(models.Manager):
+    def open(self, qr_share_id, owner_id, ip_address=None, user_agent='', duration=timedelta(hours=1)):
+        """
+        Start a session on a scanned share: insert it and add it to the
+        share owner's dashboard counters, which bulk_create does not signal.
+        Called in the transaction that claimed the view, so a view is never
+        granted without its session.
+        
+        Returns:
+            ShareSession: the saved session
+        """
+        from auth_api import counters as dashboard_counters
+        session = self.model(
+            qr_share_id=qr_share_id,
+            session_token=secrets.token_urlsafe(32),
+            ip_address=ip_address,
+            user_agent=user_agent,
+            expires_at=timezone.now() + duration,
+        )
+        self.bulk_create([session])
+        dashboard_counters.apply(
+            owner_id, {'sessions': 1, 'active_sessions': 1}, expires_at=session.expires_at
+        )
+        return session
+
+
 class ShareSession(models.Model):
     """Temporary session for accessing shared documents"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -114,8 +150,8 @@ class ShareSession(models.Model):
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
     
-    # Access tracking
-    accessed_at = models.DateTimeField(auto_now_add=True)
+    # Access tracking (set when the session opens, not when it is written)
+    accessed_at = models.DateTimeField(default=timezone.now, editable=False)
     expires_at = models.DateTimeField()
     
     # Status
@@ -126,10 +162,16 @@ class ShareSession(models.Model):
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     
+    objects = ShareSessionManager()
+    
     class Meta:
         verbose_name = 'Share Session'
         verbose_name_plural = 'Share Sessions'
         ordering = ['-accessed_at']
+        indexes = [
+            models.Index(fields=['qr_share', 'status']),
+            models.Index(fields=['qr_share', '-accessed_at']),
+        ]
     
     def __str__(self):
         return f"Session: {self.session_token[:8]}... for {self.qr_share.document.title}"
@@ -170,13 +212,18 @@ class SharingActivity(models.Model):
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
     
-    # Timestamps
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Timestamps (set when the activity happens, not when it is written)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    
+    objects = AuditLogManager()
     
     class Meta:
         verbose_name = 'Sharing Activity'
         verbose_name_plural = 'Sharing Activities'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.get_activity_type_display()} - {self.created_at}"
@@ -247,6 +294,14 @@ class ShareNotification(models.Model):
         verbose_name = 'Share Notification'
         verbose_name_plural = 'Share Notifications'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(
+                fields=['user', '-created_at'],
+                condition=models.Q(is_read=False),
+                name='sharenotif_unread_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.title}"
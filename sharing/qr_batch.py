@@ -0,0 +1,30 @@
+"""
+Batch creation of QR code shares
+"""
+from django.conf import settings
+from django.utils import timezone
+from auth_api import counters as dashboard_counters
+from .models import QRCodeShare
+
+
+def create_qr_shares(created_by, documents, **fields):
+    """
+    Create a QR share for each document with one bulk_create. No image is
+    rendered or stored: the QR image endpoint renders it on first request.
+    
+    Returns:
+        list: the created shares, in document order
+    """
+    shares = [QRCodeShare(document=document, created_by=created_by, **fields) for document in documents]
+    QRCodeShare.objects.bulk_create(shares, batch_size=settings.BULK_SHARE_BATCH_SIZE)
+    if shares:
+        # bulk_create sends no signals; the shares differ only in document
+        share = shares[0]
+        if share.status == 'active' and share.expires_at >= timezone.now():
+            dashboard_counters.apply(
+                created_by.pk, {'qr_shares': len(shares), 'active_qr_shares': len(shares)},
+                expires_at=share.expires_at,
+            )
+        else:
+            dashboard_counters.apply(created_by.pk, {'qr_shares': len(shares)})
+    return shares
@@ -0,0 +1,120 @@
+"""
+On-demand QR images of shares, cached in memory and on disk
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from common.content_cache import DiskContentCache
+from .rendering import RENDER_VERSION, render
+
+DISK_BUCKET = 'qr-images'
+IMAGE_TOKEN_SALT = 'sharing.qr-image'
+
+
+class QRImageDiskCache(DiskContentCache):
+    """The content cache's disk layout and eviction, in a root of its own"""
+    
+    stats_key_prefix = 'qr-image-cache-stats:'
+    
+    @property
+    def root(self):
+        return str(self._root or settings.QR_IMAGE_CACHE_ROOT)
+    
+    @property
+    def max_size(self):
+        return self._max_size if self._max_size is not None else settings.QR_IMAGE_CACHE_MAX_SIZE
+
+
+class QRImageCache:
+    """
+    QR image bytes keyed by (share id, box size, format).
+    
+    A bounded in-process LRU of QR_IMAGE_CACHE_ENTRIES images sits in front
+    of a disk cache shared by the workers of a host, so an image is rendered
+    once per host and then served without any rendering at all. Images are
+    a pure function of their key, so entries never go stale; RENDER_VERSION
+    is part of the disk key for when the rendering itself changes.
+    """
+    
+    def __init__(self, disk=None, max_entries=None):
+        self.disk = disk or QRImageDiskCache()
+        self.max_entries = max_entries
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_max_entries(self):
+        if self.max_entries is not None:
+            return self.max_entries
+        return settings.QR_IMAGE_CACHE_ENTRIES
+    
+    def get(self, share_id, box_size=10, image_format='png'):
+        """Bytes of a share's QR image, rendered on the first request"""
+        key = (str(share_id), box_size, image_format)
+        with self._lock:
+            image = self._local.get(key)
+            if image is not None:
+                self._local.move_to_end(key)
+                return image
+        image = self._load(key)
+        with self._lock:
+            self._local[key] = image
+            self._local.move_to_end(key)
+            while len(self._local) > self.get_max_entries():
+                self._local.popitem(last=False)
+        return image
+    
+    def _load(self, key):
+        share_id, box_size, image_format = key
+        rendered = []
+        
+        def opener():
+            rendered.append(render(share_id, box_size, image_format))
+            return rendered
+        
+        name = f"{share_id}/{box_size}.{image_format}"
+        path = self.disk.fetch(DISK_BUCKET, name, RENDER_VERSION, 0, opener)
+        if rendered:
+            return rendered[0]
+        if path:
+            try:
+                with open(path, 'rb') as file:
+                    return file.read()
+            except FileNotFoundError:
+                # Evicted by another worker since the lookup
+                pass
+        return render(share_id, box_size, image_format)
+    
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+def image_etag(share_id, box_size, image_format):
+    """Strong ETag of a QR image, known without rendering it"""
+    digest = hashlib.sha256(f"{share_id}:{box_size}:{image_format}:{RENDER_VERSION}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def image_url(share_id):
+    """
+    URL of a share's QR image that needs no credentials, for <img> tags and
+    printers. It is signed and expires after QR_IMAGE_URL_MAX_AGE seconds.
+    """
+    token = signing.TimestampSigner(salt=IMAGE_TOKEN_SALT).sign(str(share_id))
+    return reverse('qr-image', args=[token])
+
+
+def image_share_id(token):
+    """Share id of an image URL token, or None if it is forged or expired"""
+    try:
+        return signing.TimestampSigner(salt=IMAGE_TOKEN_SALT).unsign(
+            token, max_age=settings.QR_IMAGE_URL_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+
+
+qr_images = QRImageCache()
@@ -0,0 +1,88 @@
+"""
+QR code rendering for share links
+
+Pure functions of the share id and rendering parameters: nothing here
+touches Django models or the database.
+"""
+from io import BytesIO
+from functools import lru_cache
+import qrcode
+from PIL import Image
+
+SHARE_URL = "https://yourdomain.com/sharing/access/{id}/"
+BORDER = 5
+
+# Part of every cache key: bump it whenever render() output changes
+RENDER_VERSION = "1"
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def share_url(share_id):
+    return SHARE_URL.format(id=share_id)
+
+
+@lru_cache(maxsize=256)
+def qr_matrix(share_id):
+    """
+    Rows of booleans (True = dark) of the QR code for a share, border
+    included. Encoding dominates the cost of a render, so the matrices of
+    recent shares are kept for their other sizes and formats.
+    """
+    qr = qrcode.QRCode(version=1, border=BORDER)
+    qr.add_data(share_url(share_id))
+    qr.make(fit=True)
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+
+def render_png(share_id, box_size=10):
+    """PNG bytes of the QR code for a share, box_size pixels per module"""
+    matrix = qr_matrix(share_id)
+    modules = len(matrix)
+    img = Image.new('1', (modules, modules))
+    img.putdata([0 if dark else 1 for row in matrix for dark in row])
+    img = img.resize((modules * box_size, modules * box_size), Image.NEAREST)
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_svg(share_id, box_size=10):
+    """
+    SVG bytes of the QR code for a share: one path with a rectangle per run
+    of dark modules, drawn box_size pixels per module by default
+    """
+    matrix = qr_matrix(share_id)
+    modules = len(matrix)
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < modules:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < modules and row[x]:
+                x += 1
+            runs.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+    size = modules * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {modules} {modules}" shape-rendering="crispEdges">'
+        f'<rect width="{modules}" height="{modules}" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(runs)}"/></svg>'
+    ).encode()
+
+
+RENDERERS = {
+    'png': render_png,
+    'svg': render_svg,
+}
+
+
+def render(share_id, box_size=10, image_format='png'):
+    """Bytes of the QR code for a share in one of FORMATS"""
+    return RENDERERS[image_format](share_id, box_size)
@@ -4,12 +4,15 @@ from .models import (
     QRCodeShare, ShareSession, SharingActivity, DocumentRequestResponse,
     ShareNotification
 )
+from .access_cache import access_cache, is_scannable
+from .qr_images import image_url
 from documents.models import Document, DocumentRequest
+from common.serializers import PublicURLModelSerializer, PublicURLListSerializer
 
 User = get_user_model()
 
 
-class QRCodeShareSerializer(serializers.ModelSerializer):
+class QRCodeShareSerializer(PublicURLModelSerializer):
     document_title = serializers.CharField(source='document.title', read_only=True)
     created_by_email = serializers.EmailField(source='created_by.email', read_only=True)
     created_by_name = serializers.CharField(source='created_by.full_name', read_only=True)
@@ -20,6 +23,7 @@ class QRCodeShareSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = QRCodeShare
+        list_serializer_class = PublicURLListSerializer
         fields = [
             'id', 'document', 'document_title', 'created_by', 'created_by_email',
             'created_by_name', 'title', 'description', 'permission', 'expires_at',
@@ -34,10 +38,10 @@ class QRCodeShareSerializer(serializers.ModelSerializer):
     
     def get_qr_code_url(self, obj):
         if obj.qr_code_image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.qr_code_image.url)
-        return None
+            return self.fields['qr_code_image'].get_url(obj.qr_code_image)
+        url = image_url(obj.pk)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
 
 
 class QRCodeShareCreateSerializer(serializers.ModelSerializer):
@@ -185,12 +189,11 @@ class QRCodeAccessSerializer(serializers.Serializer):
     session_token = serializers.CharField(required=False)
     
     def validate_qr_share_id(self, value):
-        try:
-            qr_share = QRCodeShare.objects.get(id=value)
-            if not qr_share.is_active:
-                raise serializers.ValidationError("QR code is no longer active")
-        except QRCodeShare.DoesNotExist:
+        qr_share = access_cache.get_share(value)
+        if qr_share is None:
             raise serializers.ValidationError("Invalid QR code")
+        if not is_scannable(qr_share):
+            raise serializers.ValidationError("QR code is no longer active")
         return value
 
 
@@ -203,6 +206,7 @@ class DocumentAccessViaQRSerializer(serializers.Serializer):
     created_by_name = serializers.CharField()
     access_url = serializers.CharField()
     download_url = serializers.CharField(required=False)
+    view_granted = serializers.BooleanField()
 
 
 class ShareStatsSerializer(serializers.Serializer):
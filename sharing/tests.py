@@ -1,3 +1,580 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+from auth_api.models import CustomUser, UserDashboardCounters
+from auth_api.counters import get_dashboard_counters
+from common.audit import audit_writer
+from common.explain import QueryPlanAssertionsMixin
+from common.storage import LocalFileSystemStorage
+from documents.downloads import offloaded_response
+from documents.models import Document, DocumentAccessLog
+from documents.tests import CountingBucket
+from .models import QRCodeShare, ShareSession, ShareNotification, SharingActivity
+from .access_cache import access_cache
+from .checks import check_qr_access_cache, check_qr_access_cache_shared
+from .qr_images import image_share_id, qr_images
+from .rendering import render
 
-# Create your tests here.
+
+class SharingIndexPlanTests(QueryPlanAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        document = Document.objects.bulk_create([
+            Document(title='Passport', owner=self.user, original_filename='passport.pdf', file='blobs/aa/passport.pdf')
+        ])[0]
+        expires_at = timezone.now() + timedelta(days=1)
+        qr_share = QRCodeShare.objects.bulk_create([
+            QRCodeShare(document=document, created_by=self.user, title='Share', expires_at=expires_at)
+        ])[0]
+        ShareSession.objects.create(qr_share=qr_share, session_token='token', expires_at=expires_at)
+        ShareNotification.objects.create(
+            user=self.user, notification_type='document_shared', title='Shared', message='Shared'
+        )
+        SharingActivity.objects.log(
+            user=self.user, activity_type='qr_created', document=document, description='Created'
+        )
+
+    def test_unread_notifications_use_partial_index(self):
+        self.assertEndpointUsesIndex(
+            '/api/v1/sharing/notifications/', 'sharing_sharenotification', 'sharenotif_unread_idx',
+            data={'is_read': 'false'},
+        )
+
+    def test_notifications_use_user_created_index(self):
+        self.assertEndpointUsesIndex('/api/v1/sharing/notifications/', 'sharing_sharenotification')
+
+    def test_qr_shares_use_index(self):
+        self.assertEndpointUsesIndex('/api/v1/sharing/qr-shares/', 'sharing_qrcodeshare')
+
+    def test_sessions_use_index(self):
+        self.assertEndpointUsesIndex('/api/v1/sharing/sessions/', 'sharing_sharesession')
+
+    def test_activities_use_index(self):
+        self.assertEndpointUsesIndex('/api/v1/sharing/activities/', 'sharing_sharingactivity')
+
+    def test_stats_recount_uses_indexes(self):
+        for table in ('sharing_qrcodeshare', 'sharing_sharesession', 'documents_documentrequest',
+                      'sharing_sharenotification'):
+            with self.subTest(table=table):
+                # Stats are counted from these tables only when the user has no counters yet
+                UserDashboardCounters.objects.filter(pk=self.user.pk).delete()
+                self.assertEndpointUsesIndex('/api/v1/sharing/stats/', table)
+
+
+class QRBulkCreateTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        self.documents = Document.objects.bulk_create([
+            Document(
+                title=f'Document {index}', owner=self.user,
+                original_filename=f'document-{index}.pdf', file=f'blobs/{index:02x}/document-{index}.pdf',
+            )
+            for index in range(3)
+        ])
+
+    def bulk_create(self):
+        bucket = CountingBucket()
+        with mock.patch('common.storage.get_storage_bucket', return_value=bucket), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/sharing/qr-shares/bulk_create/', {
+                'document_ids': [str(document.pk) for document in self.documents],
+                'title': 'Bulk', 'expires_at': (timezone.now() + timedelta(days=1)).isoformat(),
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return bucket, queries.captured_queries
+
+    def test_bulk_create_inserts_once_without_rendering_or_uploading(self):
+        with mock.patch('sharing.qr_images.render') as render:
+            bucket, queries = self.bulk_create()
+
+        render.assert_not_called()
+        self.assertEqual(bucket.calls, [])
+        shares = QRCodeShare.objects.filter(created_by=self.user)
+        self.assertEqual(shares.count(), 3)
+        self.assertFalse(any(share.qr_code_image for share in shares))
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "sharing_qrcodeshare"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_bulk_create_links_image_endpoint(self):
+        self.bulk_create()
+
+        response = self.client.get('/api/v1/sharing/qr-shares/')
+        self.assertEqual(len(response.data['results']), 3)
+        prefix = 'http://testserver/api/v1/sharing/qr-images/'
+        for share in response.data['results']:
+            self.assertTrue(share['qr_code_url'].startswith(prefix))
+            token = share['qr_code_url'][len(prefix):].rstrip('/')
+            self.assertEqual(image_share_id(token), share['id'])
+
+
+class QRImageTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.client.force_authenticate(self.user)
+        document = Document.objects.bulk_create([
+            Document(title='Passport', owner=self.user, original_filename='passport.pdf', file='blobs/aa/passport.pdf')
+        ])[0]
+        self.share = QRCodeShare.objects.create(
+            document=document, created_by=self.user, title='Share', expires_at=timezone.now() + timedelta(days=1)
+        )
+        self.url = f'/api/v1/sharing/qr-shares/{self.share.pk}/image/'
+        cache_root = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_root.cleanup)
+        settings_override = override_settings(QR_IMAGE_CACHE_ROOT=cache_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        qr_images.clear()
+        self.addCleanup(qr_images.clear)
+
+    def get(self, **params):
+        with mock.patch('sharing.qr_images.render', wraps=render) as rendered:
+            response = self.client.get(self.url, params)
+        return response, rendered.call_count
+
+    def test_save_stores_no_image(self):
+        self.assertFalse(self.share.qr_code_image)
+        self.assertTrue(self.share.get_qr_code_url().startswith('/api/v1/sharing/qr-images/'))
+
+    def test_signed_url_is_served_without_credentials(self):
+        authenticated, _ = self.get(size=4)
+        self.client.force_authenticate(None)
+
+        response = self.client.get(self.share.get_qr_code_url(), {'size': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, authenticated.content)
+        self.assertEqual(response['ETag'], authenticated['ETag'])
+
+    def test_signed_url_is_rejected_when_tampered_or_expired(self):
+        other = QRCodeShare.objects.create(
+            document=self.share.document, created_by=self.user, title='Other',
+            expires_at=timezone.now() + timedelta(days=1)
+        )
+        url = self.share.get_qr_code_url()
+        self.client.force_authenticate(None)
+
+        forged = url.replace(str(self.share.pk), str(other.pk))
+        self.assertEqual(self.client.get(forged).status_code, 404)
+        with override_settings(QR_IMAGE_URL_MAX_AGE=-1):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_png_rendered_once_then_served_from_memory(self):
+        first, rendered = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(rendered, 1)
+        self.assertEqual(first['Content-Type'], 'image/png')
+        self.assertTrue(first.content.startswith(b'\x89PNG'))
+        self.assertIn('immutable', first['Cache-Control'])
+        self.assertIn('private', first['Cache-Control'])
+
+        second, rendered = self.get()
+        self.assertEqual(rendered, 0)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_disk_cache_serves_after_memory_is_cleared(self):
+        first, _ = self.get(image_format='svg')
+        qr_images.clear()
+
+        second, rendered = self.get(image_format='svg')
+        self.assertEqual(rendered, 0)
+        self.assertEqual(second.content, first.content)
+
+    def test_svg(self):
+        response, _ = self.get(image_format='svg', size=4)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertTrue(response.content.startswith(b'<svg'))
+
+    def test_cached_per_size(self):
+        small, _ = self.get(size=4)
+        large, rendered = self.get(size=8)
+        self.assertEqual(rendered, 1)
+        self.assertNotEqual(small['ETag'], large['ETag'])
+        self.assertGreater(len(large.content), len(small.content))
+
+    def test_conditional_request_is_not_rendered(self):
+        first, _ = self.get()
+        qr_images.clear()
+
+        with mock.patch('sharing.qr_images.render') as rendered:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        rendered.assert_not_called()
+
+    def test_invalid_parameters(self):
+        for params in ({'image_format': 'gif'}, {'size': 0}, {'size': 'large'}, {'size': 1000}):
+            with self.subTest(params=params):
+                response, rendered = self.get(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(rendered, 0)
+
+    def test_other_users_share_not_found(self):
+        other = CustomUser.objects.create_user(
+            username='other', email='other@example.com', password='secret-pass', full_name='Other'
+        )
+        self.client.force_authenticate(other)
+
+        response, rendered = self.get()
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(rendered, 0)
+
+
+class QRCodeAccessTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        document = Document.objects.bulk_create([
+            Document(title='Passport', owner=self.user, original_filename='passport.pdf', file='blobs/aa/passport.pdf')
+        ])[0]
+        self.share = QRCodeShare.objects.create(
+            document=document, created_by=self.user, title='Share', max_views=2,
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+    def scan(self, **data):
+        return self.client.post('/api/v1/sharing/access/', {'qr_share_id': str(self.share.pk), **data}, format='json')
+
+    def test_scan_creates_session_and_counts_view(self):
+        response = self.scan()
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertTrue(response.data['view_granted'])
+        session = ShareSession.objects.get(qr_share=self.share)
+        self.assertEqual(response.data['access_url'], f'/api/v1/sharing/access/{session.session_token}/')
+        self.share.refresh_from_db()
+        self.assertEqual(self.share.current_views, 1)
+
+    def test_view_limit_is_enforced(self):
+        self.assertEqual(self.scan().status_code, 200)
+        self.assertEqual(self.scan().status_code, 200)
+
+        response = self.scan()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ShareSession.objects.filter(qr_share=self.share).count(), 2)
+        self.share.refresh_from_db()
+        self.assertEqual(self.share.current_views, 2)
+
+    def test_claim_view_only_updates_scannable_shares(self):
+        self.assertTrue(QRCodeShare.objects.claim_view(self.share.pk))
+        QRCodeShare.objects.filter(pk=self.share.pk).update(status='revoked')
+        self.assertFalse(QRCodeShare.objects.claim_view(self.share.pk))
+        QRCodeShare.objects.filter(pk=self.share.pk).update(status='active', expires_at=timezone.now())
+        self.assertFalse(QRCodeShare.objects.claim_view(self.share.pk))
+        self.share.refresh_from_db()
+        self.assertEqual(self.share.current_views, 1)
+
+    def test_share_is_not_rewritten(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.scan()
+
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "sharing_qrcodeshare"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"current_views" < ("sharing_qrcodeshare"."max_views")', updates[0])
+        self.assertNotIn('"title"', updates[0])
+
+
+# Needs a database that threads can write to at once; on SQLite run the
+# stress_qr_access command instead
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class QRCodeAccessConcurrencyTests(TransactionTestCase):
+    scans = 500
+    max_views = 100
+
+    def setUp(self):
+        user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        document = Document.objects.bulk_create([
+            Document(title='Passport', owner=user, original_filename='passport.pdf', file='blobs/aa/passport.pdf')
+        ])[0]
+        self.share = QRCodeShare.objects.create(
+            document=document, created_by=user, title='Share', max_views=self.max_views,
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+    def scan(self, _):
+        try:
+            response = APIClient().post('/api/v1/sharing/access/', {'qr_share_id': str(self.share.pk)}, format='json')
+            return response.status_code
+        finally:
+            connections.close_all()
+
+    def test_parallel_scans_never_exceed_max_views(self):
+        with ThreadPoolExecutor(max_workers=50) as scanners:
+            statuses = list(scanners.map(self.scan, range(self.scans)))
+
+        self.assertEqual(statuses.count(200), self.max_views)
+        self.assertEqual(statuses.count(400), self.scans - self.max_views)
+        self.share.refresh_from_db()
+        self.assertEqual(self.share.current_views, self.max_views)
+        self.assertEqual(ShareSession.objects.filter(qr_share=self.share).count(), self.max_views)
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache_table'},
+        'qr-access': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    },
+    QR_ACCESS_CACHE_ALIAS='qr-access',
+)
+class QRAccessCacheTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        document = Document.objects.bulk_create([
+            Document(title='Passport', owner=self.user, original_filename='passport.pdf', file='blobs/aa/passport.pdf')
+        ])[0]
+        self.share = QRCodeShare.objects.create(
+            document=document, created_by=self.user, title='Share', max_views=3,
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        access_cache.clear_local()
+        self.addCleanup(access_cache.clear_local)
+        self.addCleanup(access_cache.cache.clear)
+
+    def scan(self, **data):
+        return self.client.post('/api/v1/sharing/access/', {'qr_share_id': str(self.share.pk), **data}, format='json')
+
+    def session_token(self, response):
+        return response.data['access_url'].rstrip('/').rsplit('/', 1)[1]
+
+    def test_warm_scan_reads_nothing_and_writes_claim_and_session(self):
+        first = self.scan()
+        self.assertEqual(first.status_code, 200)
+
+        # The audit writer would write the activity in the background
+        with mock.patch.object(audit_writer, 'submit') as submit, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.scan()
+            returning = self.scan(session_token=self.session_token(first))
+
+        self.assertEqual((response.status_code, returning.status_code), (200, 200))
+        statements = [
+            query['sql'].split('"')[:2] for query in queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+        ]
+        self.assertEqual(statements, [
+            # New session: the view claim, the session and its owner's counters
+            ['UPDATE ', 'sharing_qrcodeshare'],
+            ['INSERT INTO ', 'sharing_sharesession'],
+            ['UPDATE ', 'auth_api_userdashboardcounters'],
+            # Returning session
+            ['UPDATE ', 'sharing_qrcodeshare'],
+        ])
+        queued = [type(call.args[0]).__name__ for call in submit.call_args_list]
+        self.assertEqual(queued, ['SharingActivity', 'SharingActivity'])
+
+    def test_session_is_written_with_the_view_claim(self):
+        with mock.patch.object(audit_writer, 'submit'):
+            token = self.session_token(self.scan())
+
+        session = ShareSession.objects.get(session_token=token)
+        self.assertEqual(session.qr_share_id, self.share.pk)
+        self.share.refresh_from_db()
+        self.assertEqual(self.share.current_views, 1)
+
+    def test_session_is_not_written_when_the_claim_fails(self):
+        QRCodeShare.objects.filter(pk=self.share.pk).update(current_views=3)
+
+        response = self.scan()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ShareSession.objects.exists())
+
+    def test_session_insert_failure_rolls_back_the_view(self):
+        with mock.patch.object(ShareSession.objects, 'bulk_create', side_effect=IntegrityError), \
+                self.assertRaises(IntegrityError):
+            self.scan()
+
+        self.share.refresh_from_db()
+        self.assertEqual(self.share.current_views, 0)
+
+    def test_written_sessions_are_counted(self):
+        get_dashboard_counters(self.user)
+        self.scan()
+
+        counters = get_dashboard_counters(self.user)
+        self.assertEqual((counters.sessions, counters.active_sessions), (1, 1))
+
+    def test_revoke_invalidates(self):
+        self.assertEqual(self.scan().status_code, 200)
+        self.client.force_authenticate(self.user)
+        self.client.post(f'/api/v1/sharing/qr-shares/{self.share.pk}/revoke/')
+        self.client.force_authenticate(None)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.scan()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+
+    def test_delete_invalidates(self):
+        token = self.session_token(self.scan())
+        self.share.delete()
+
+        response = self.scan()
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(access_cache.get_session(token))
+
+    def test_expired_session_is_rejected(self):
+        token = self.session_token(self.scan())
+        ShareSession.objects.filter(session_token=token).update(expires_at=timezone.now() - timedelta(minutes=1))
+        access_cache.invalidate_session(token)
+
+        response = self.scan(session_token=token)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ShareSession.objects.get(session_token=token).status, 'expired')
+
+    def test_exhausted_share_is_rejected_from_cache(self):
+        for _ in range(3):
+            self.assertEqual(self.scan().status_code, 200)
+        # The first refused scan drops the stale entry, the next caches the share as exhausted
+        self.assertEqual(self.scan().status_code, 400)
+        self.assertEqual(self.scan().status_code, 400)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.scan()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(queries), 0)
+
+
+class QRAccessCacheAliasTests(SimpleTestCase):
+    def test_database_cache_is_refused(self):
+        with override_settings(QR_ACCESS_CACHE_ALIAS='default'):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'DatabaseCache'):
+                access_cache.cache
+            self.assertEqual([error.id for error in check_qr_access_cache(None)], ['sharing.E001'])
+
+    def test_missing_alias_is_refused(self):
+        with override_settings(QR_ACCESS_CACHE_ALIAS='missing'):
+            self.assertEqual([error.id for error in check_qr_access_cache(None)], ['sharing.E001'])
+
+    def test_local_memory_is_accepted_with_a_deploy_warning(self):
+        self.assertEqual(check_qr_access_cache(None), [])
+        self.assertEqual([warning.id for warning in check_qr_access_cache_shared(None)], ['sharing.W001'])
+
+    @override_settings(
+        CACHES={'qr-access': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}},
+    )
+    def test_redis_is_accepted(self):
+        self.assertEqual(check_qr_access_cache(None) + check_qr_access_cache_shared(None), [])
+
+
+@override_settings(CONTENT_CACHE_MAX_SIZE=0)
+class QRCodeDownloadTests(APITestCase):
+    content = b'%PDF-1.4 shared by QR code'
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        settings_override = override_settings(LOCAL_STORAGE_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        storage = LocalFileSystemStorage('documents', location=self.root)
+        storage_patch = mock.patch.object(Document._meta.get_field('file'), 'storage', storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+        self.user = CustomUser.objects.create_user(
+            username='owner', email='owner@example.com', password='secret-pass', full_name='Owner'
+        )
+        self.document = Document.objects.bulk_create([
+            Document(
+                title='Passport', owner=self.user, original_filename='passport.pdf', file='blobs/aa/passport.pdf',
+                file_size=len(self.content), file_content_type='application/pdf', file_checksum='a' * 64,
+            )
+        ])[0]
+        storage.bucket.upload_stream(self.document.file.name, [self.content], 'application/pdf')
+        self.path = storage.path(self.document.file.name)
+        self.share = QRCodeShare.objects.create(
+            document=self.document, created_by=self.user, title='Share', permission='download',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        access_cache.clear_local()
+        self.addCleanup(access_cache.clear_local)
+
+    def open_session(self):
+        response = self.client.post('/api/v1/sharing/access/', {'qr_share_id': str(self.share.pk)}, format='json')
+        return response.data['access_url'].rstrip('/').rsplit('/', 1)[1]
+
+    def download(self, token=None, **headers):
+        return self.client.get(f'/api/v1/sharing/download/{token or self.open_session()}/', headers=headers)
+
+    @override_settings(DOWNLOAD_OFFLOAD='x-accel', DOWNLOAD_ACCEL_STORAGE_URL='/internal/storage/')
+    def test_x_accel_redirect_hands_transfer_to_nginx(self):
+        response = self.download()
+
+        self.assertEqual(response.status_code, 200)
+        relative = os.path.relpath(self.path, self.root).replace(os.sep, '/')
+        self.assertEqual(response['X-Accel-Redirect'], f'/internal/storage/{relative}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('passport.pdf', response['Content-Disposition'])
+        self.assertEqual(response['ETag'], f'"{"a" * 64}"')
+        self.assertEqual(DocumentAccessLog.objects.filter(document=self.document, action='download').count(), 1)
+
+    @override_settings(DOWNLOAD_OFFLOAD='x-sendfile')
+    def test_x_sendfile_hands_transfer_to_web_server(self):
+        response = self.download()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Sendfile'], os.path.realpath(self.path))
+        self.assertEqual(response.content, b'')
+
+    @override_settings(DOWNLOAD_OFFLOAD='')
+    def test_file_is_streamed_without_offload(self):
+        response = self.download()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertNotIn('X-Sendfile', response)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        response.close()
+
+    @override_settings(DOWNLOAD_OFFLOAD='')
+    def test_range_continuation_is_streamed_and_not_logged_again(self):
+        token = self.open_session()
+        self.download(token).close()
+        response = self.download(token, Range='bytes=4-7')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[4:8])
+        self.assertEqual(response['Content-Range'], f'bytes 4-7/{len(self.content)}')
+        self.assertEqual(DocumentAccessLog.objects.filter(document=self.document, action='download').count(), 1)
+
+    def test_view_only_share_forbids_download(self):
+        QRCodeShare.objects.filter(pk=self.share.pk).update(permission='view')
+        access_cache.invalidate_share(self.share.pk)
+
+        response = self.download()
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(DocumentAccessLog.objects.filter(action='download').exists())
+
+    def test_invalid_session_is_rejected(self):
+        response = self.client.get('/api/v1/sharing/download/not-a-session/')
+
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(DOWNLOAD_OFFLOAD='x-accel')
+    def test_files_outside_accel_locations_are_not_offloaded(self):
+        with tempfile.NamedTemporaryFile() as outside:
+            self.assertIsNone(offloaded_response(outside.name, 'outside.pdf', 'application/pdf'))
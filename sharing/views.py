@@ -4,14 +4,22 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q, Count
+from django.http import HttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from datetime import timedelta
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from .models import (
     QRCodeShare, ShareSession, SharingActivity, DocumentRequestResponse,
     ShareNotification
 )
+from .access_cache import access_cache, is_scannable, is_session_open, session_entry
+from .qr_batch import create_qr_shares
+from .qr_images import image_etag, image_share_id, qr_images
+from .rendering import FORMATS
 from .serializers import (
     QRCodeShareSerializer, QRCodeShareCreateSerializer,
     ShareSessionSerializer, ShareSessionCreateSerializer,
@@ -22,8 +30,41 @@ from .serializers import (
     BulkShareSerializer, QRCodeBulkCreateSerializer,
     ShareActivityFilterSerializer
 )
-from documents.models import Document, DocumentRequest
+from documents.models import Document, DocumentAccessLog
+from documents.downloads import document_file_response, not_modified_response, is_initial_fetch
+from documents.shares import SHARED, share_documents
 from auth_api.models import UserActivity
+from auth_api import counters as dashboard_counters
+from auth_api.counters import get_dashboard_counters
+from common.pagination import KeysetPagination
+
+
+def qr_image_response(request, share_id):
+    """QR image of a share, sized and formatted by the query parameters"""
+    image_format = request.query_params.get('image_format', 'png')
+    if image_format not in FORMATS:
+        return Response(
+            {'error': f"image_format must be one of: {', '.join(FORMATS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        box_size = int(request.query_params.get('size', 10))
+    except ValueError:
+        box_size = 0
+    if not 1 <= box_size <= settings.QR_IMAGE_MAX_BOX_SIZE:
+        return Response(
+            {'error': f'size must be between 1 and {settings.QR_IMAGE_MAX_BOX_SIZE}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    etag = image_etag(share_id, box_size, image_format)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        image = qr_images.get(share_id, box_size, image_format)
+        response = HttpResponse(image, content_type=FORMATS[image_format])
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=settings.QR_IMAGE_MAX_AGE, immutable=True)
+    return response
 
 
 class QRCodeShareViewSet(viewsets.ModelViewSet):
@@ -46,7 +87,7 @@ class QRCodeShareViewSet(viewsets.ModelViewSet):
         qr_share = serializer.save(created_by=self.request.user)
         
         # Log activity
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='qr_created',
             description=f'Created QR code for document: {qr_share.document.title}',
@@ -56,7 +97,7 @@ class QRCodeShareViewSet(viewsets.ModelViewSet):
     
     def perform_destroy(self, instance):
         # Log activity before deletion
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='qr_revoked',
             description=f'Revoked QR code for document: {instance.document.title}',
@@ -90,7 +131,7 @@ class QRCodeShareViewSet(viewsets.ModelViewSet):
         qr_share.save()
         
         # Log activity
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=request.user,
             activity_type='qr_revoked',
             description=f'Revoked QR code for document: {qr_share.document.title}',
@@ -100,6 +141,21 @@ class QRCodeShareViewSet(viewsets.ModelViewSet):
         
         return Response({'message': 'QR code revoked'})
     
+    @action(detail=True, methods=['get'])
+    @extend_schema(
+        summary="QR code image",
+        description="QR code image of the share, rendered on first request and then served "
+                    "from cache. The image never changes, so it carries a strong ETag and may "
+                    "be cached by the client.",
+        parameters=[
+            OpenApiParameter(name='size', description='Pixels per module (default 10)', required=False, type=int),
+            OpenApiParameter(name='image_format', description='png or svg', required=False, type=str),
+        ]
+    )
+    def image(self, request, pk=None):
+        qr_share = self.get_object()
+        return qr_image_response(request, qr_share.pk)
+    
     @action(detail=False, methods=['post'])
     @extend_schema(
         summary="Bulk create QR codes",
@@ -114,21 +170,17 @@ class QRCodeShareViewSet(viewsets.ModelViewSet):
                 owner=request.user
             )
             
-            created_qr_shares = []
-            for document in documents:
-                qr_share = QRCodeShare.objects.create(
-                    document=document,
-                    created_by=request.user,
-                    title=serializer.validated_data['title'],
-                    description=serializer.validated_data.get('description', ''),
-                    permission=serializer.validated_data['permission'],
-                    expires_at=serializer.validated_data['expires_at'],
-                    max_views=serializer.validated_data['max_views']
-                )
-                created_qr_shares.append(qr_share)
+            created_qr_shares = create_qr_shares(
+                request.user, documents,
+                title=serializer.validated_data['title'],
+                description=serializer.validated_data.get('description', ''),
+                permission=serializer.validated_data['permission'],
+                expires_at=serializer.validated_data['expires_at'],
+                max_views=serializer.validated_data['max_views']
+            )
             
             # Log activity
-            UserActivity.objects.create(
+            UserActivity.objects.log(
                 user=request.user,
                 activity_type='qr_bulk_created',
                 description=f'Created {len(created_qr_shares)} QR codes',
@@ -138,7 +190,9 @@ class QRCodeShareViewSet(viewsets.ModelViewSet):
             
             return Response({
                 'message': f'Created {len(created_qr_shares)} QR codes',
-                'qr_shares': QRCodeShareSerializer(created_qr_shares, many=True).data
+                'qr_shares': QRCodeShareSerializer(
+                    created_qr_shares, many=True, context={'request': request}
+                ).data
             })
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -174,15 +228,18 @@ class SharingActivityViewSet(viewsets.ReadOnlyModelViewSet):
     """Sharing activity management"""
     serializer_class = SharingActivitySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['activity_type', 'created_at', 'user', 'document']
     ordering = ['-created_at']
     
     def get_queryset(self):
         user = self.request.user
-        return SharingActivity.objects.filter(
-            Q(user=user) | Q(document__owner=user)
-        )
+        # UNION of IDs so each side is an index lookup; OR-ing across the
+        # join to Document forces a scan of the whole table
+        own = SharingActivity.objects.filter(user=user).order_by().values('pk')
+        on_owned = SharingActivity.objects.filter(document__owner=user).order_by().values('pk')
+        return SharingActivity.objects.filter(pk__in=own.union(on_owned))
     
     @extend_schema(
         summary="List sharing activities",
@@ -217,7 +274,7 @@ class DocumentRequestResponseViewSet(viewsets.ModelViewSet):
         response = serializer.save(responder=self.request.user)
         
         # Log activity
-        UserActivity.objects.create(
+        UserActivity.objects.log(
             user=self.request.user,
             activity_type='request_responded',
             description=f'Responded to document request: {response.request.title}',
@@ -238,6 +295,7 @@ class ShareNotificationViewSet(viewsets.ModelViewSet):
     """Share notification management"""
     serializer_class = ShareNotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['notification_type', 'is_read', 'created_at']
     ordering = ['-created_at']
@@ -256,10 +314,12 @@ class ShareNotificationViewSet(viewsets.ModelViewSet):
         description="Mark all notifications as read"
     )
     def mark_all_read(self, request):
-        ShareNotification.objects.filter(
+        marked = ShareNotification.objects.filter(
             user=request.user, 
             is_read=False
         ).update(is_read=True, read_at=timezone.now())
+        # update() sends no signals
+        dashboard_counters.apply(request.user.pk, {'unread_notifications': -marked})
         return Response({'message': 'All notifications marked as read'})
     
     @action(detail=True, methods=['post'])
@@ -285,86 +345,89 @@ class QRCodeAccessView(APIView):
     )
     def post(self, request):
         serializer = QRCodeAccessSerializer(data=request.data)
-        if serializer.is_valid():
-            qr_share_id = serializer.validated_data['qr_share_id']
-            session_token = serializer.validated_data.get('session_token')
-            
-            try:
-                qr_share = QRCodeShare.objects.get(id=qr_share_id)
-                
-                if not qr_share.is_active:
-                    return Response(
-                        {'error': 'QR code is no longer active'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Create or get session
-                if session_token:
-                    try:
-                        session = ShareSession.objects.get(
-                            session_token=session_token,
-                            qr_share=qr_share,
-                            status='active'
-                        )
-                        if session.is_expired:
-                            session.status = 'expired'
-                            session.save()
-                            return Response(
-                                {'error': 'Session expired'}, 
-                                status=status.HTTP_400_BAD_REQUEST
-                            )
-                    except ShareSession.DoesNotExist:
-                        return Response(
-                            {'error': 'Invalid session token'}, 
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                else:
-                    # Create new session
-                    session_serializer = ShareSessionCreateSerializer(data={'qr_share': qr_share.id})
-                    if session_serializer.is_valid():
-                        session = session_serializer.save()
-                    else:
-                        return Response(
-                            session_serializer.errors, 
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                
-                # Increment view count
-                qr_share.current_views += 1
-                qr_share.save()
-                
-                # Log activity
-                SharingActivity.objects.create(
-                    user=qr_share.created_by,
-                    activity_type='qr_accessed',
-                    document=qr_share.document,
-                    qr_share=qr_share,
-                    share_session=session,
-                    description=f'QR code accessed for document: {qr_share.document.title}',
-                    ip_address=self.get_client_ip(request),
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        qr_share_id = serializer.validated_data['qr_share_id']
+        session_token = serializer.validated_data.get('session_token')
+        
+        # The share and session come from the access cache; the database is
+        # written by the view claim and a new session, activity is queued
+        qr_share = access_cache.get_share(qr_share_id)
+        if qr_share is None:
+            return Response(
+                {'error': 'Invalid QR code'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not is_scannable(qr_share):
+            return Response(
+                {'error': 'QR code is no longer active', 'view_granted': False}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if session_token:
+            session = access_cache.get_session(session_token)
+            if session is None or session['qr_share_id'] != qr_share['id'] or session['status'] != 'active':
+                return Response(
+                    {'error': 'Invalid session token'}, 
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                
-                # Return document access info
-                access_data = {
-                    'document_title': qr_share.document.title,
-                    'document_description': qr_share.document.description or '',
-                    'permission': qr_share.permission,
-                    'expires_at': qr_share.expires_at,
-                    'created_by_name': qr_share.created_by.full_name,
-                    'access_url': f'/api/v1/sharing/access/{session.session_token}/',
-                    'download_url': f'/api/v1/sharing/download/{session.session_token}/' if qr_share.permission == 'download' else None
-                }
-                
-                return Response(access_data)
-                
-            except QRCodeShare.DoesNotExist:
+            if not is_session_open(session, qr_share['id']):
+                ShareSession.objects.filter(pk=session['id']).update(status='expired')
+                access_cache.invalidate_session(session_token)
                 return Response(
-                    {'error': 'Invalid QR code'}, 
+                    {'error': 'Session expired'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        ip_address = self.get_client_ip(request)
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        opened = None
+        # The view is only granted while the share is still scannable, and
+        # together with the session it opens
+        with transaction.atomic():
+            granted = QRCodeShare.objects.claim_view(qr_share['id'])
+            if granted and not session_token:
+                opened = ShareSession.objects.open(
+                    qr_share['id'], qr_share['created_by_id'], ip_address=ip_address, user_agent=user_agent
+                )
+        if not granted:
+            # Most likely out of views: reload it, so later scans are refused from the cache
+            access_cache.invalidate_share(qr_share['id'])
+            return Response(
+                {'error': 'QR code is no longer active', 'view_granted': False}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if opened:
+            access_cache.set_session(opened)
+            session_token = opened.session_token
+            session = session_entry(opened)
+        
+        # Log activity
+        SharingActivity.objects.log(
+            user_id=qr_share['created_by_id'],
+            activity_type='qr_accessed',
+            document_id=qr_share['document_id'],
+            qr_share_id=qr_share['id'],
+            share_session_id=session['id'],
+            description=f"QR code accessed for document: {qr_share['document_title']}",
+            ip_address=ip_address,
+            user_agent=user_agent
+        )
+        
+        # Return document access info
+        access_data = {
+            'document_title': qr_share['document_title'],
+            'document_description': qr_share['document_description'],
+            'permission': qr_share['permission'],
+            'expires_at': qr_share['expires_at'],
+            'created_by_name': qr_share['created_by_name'],
+            'access_url': f'/api/v1/sharing/access/{session_token}/',
+            'download_url': f'/api/v1/sharing/download/{session_token}/' if qr_share['permission'] == 'download' else None,
+            'view_granted': True,
+        }
+        
+        return Response(access_data)
     
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -375,6 +438,113 @@ class QRCodeAccessView(APIView):
         return ip
 
 
+class QRCodeDownloadView(APIView):
+    """Download shared documents via a QR share session"""
+    permission_classes = []  # Public endpoint
+    
+    @extend_schema(
+        summary="Download shared document",
+        description="Download the document of a QR share with download permission "
+                    "using the session token returned by the access endpoint (public endpoint)",
+        responses={200: None, 400: "Invalid or expired session", 403: "Download not permitted"}
+    )
+    def get(self, request, session_token):
+        # Sessions are cached from the scan that opened them
+        session = access_cache.get_session(session_token)
+        if session is None or session['status'] != 'active':
+            return Response(
+                {'error': 'Invalid session token'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        qr_share = access_cache.get_share(session['qr_share_id'])
+        if (qr_share is None or not is_session_open(session, qr_share['id'])
+                or qr_share['status'] != 'active' or qr_share['expires_at'] < timezone.now()):
+            return Response(
+                {'error': 'Session expired'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if qr_share['permission'] != 'download':
+            return Response(
+                {'error': 'This share does not allow downloads'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        document = Document.objects.filter(pk=qr_share['document_id']).first()
+        if document is None:
+            return Response(
+                {'error': 'Session expired'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Unchanged files are answered from the stored validators
+        response = not_modified_response(request, document)
+        if response is not None:
+            return response
+        
+        # Continuation ranges of the same download are not logged again
+        if not is_initial_fetch(request):
+            return document_file_response(document, request)
+        
+        ip_address = self.get_client_ip(request)
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        
+        # Log download
+        DocumentAccessLog.objects.log(
+            document=document,
+            user_id=qr_share['created_by_id'],
+            action='download',
+            ip_address=ip_address,
+            user_agent=user_agent,
+            session_id=session['id']
+        )
+        SharingActivity.objects.log(
+            user_id=qr_share['created_by_id'],
+            activity_type='qr_accessed',
+            document=document,
+            qr_share_id=qr_share['id'],
+            share_session_id=session['id'],
+            description=f'Document downloaded via QR code: {document.title}',
+            metadata={'action': 'download'},
+            ip_address=ip_address,
+            user_agent=user_agent
+        )
+        
+        # Return file response, handing the transfer to nginx when possible
+        return document_file_response(document, request)
+    
+    def get_client_ip(self, request):
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            ip = x_forwarded_for.split(',')[0]
+        else:
+            ip = request.META.get('REMOTE_ADDR')
+        return ip
+
+
+class QRCodeImageView(APIView):
+    """QR code image behind a signed URL, for clients that cannot authenticate"""
+    permission_classes = []  # Public endpoint
+    authentication_classes = []
+    
+    @extend_schema(
+        summary="QR code image (signed URL)",
+        description="QR code image of a share at the signed, expiring URL returned as "
+                    "qr_code_url, so <img> tags and printers can fetch it without "
+                    "credentials. Takes the same size and image_format parameters as the "
+                    "authenticated image endpoint.",
+        parameters=[
+            OpenApiParameter(name='size', description='Pixels per module (default 10)', required=False, type=int),
+            OpenApiParameter(name='image_format', description='png or svg', required=False, type=str),
+        ]
+    )
+    def get(self, request, token):
+        share_id = image_share_id(token)
+        if share_id is None:
+            return Response({'error': 'Invalid or expired image URL'}, status=status.HTTP_404_NOT_FOUND)
+        return qr_image_response(request, share_id)
+
+
 class ShareStatsView(APIView):
     """Sharing statistics"""
     permission_classes = [permissions.IsAuthenticated]
@@ -384,38 +554,18 @@ class ShareStatsView(APIView):
         description="Get sharing statistics and analytics"
     )
     def get(self, request):
-        user = request.user
-        
-        # Calculate statistics
-        total_qr_shares = QRCodeShare.objects.filter(created_by=user).count()
-        active_qr_shares = QRCodeShare.objects.filter(
-            created_by=user, 
-            status='active'
-        ).exclude(expires_at__lt=timezone.now()).count()
-        
-        total_sessions = ShareSession.objects.filter(qr_share__created_by=user).count()
-        active_sessions = ShareSession.objects.filter(
-            qr_share__created_by=user, 
-            status='active'
-        ).exclude(expires_at__lt=timezone.now()).count()
-        
-        total_requests_sent = DocumentRequest.objects.filter(requester=user).count()
-        total_requests_received = DocumentRequest.objects.filter(requestee=user).count()
-        pending_requests = DocumentRequest.objects.filter(requestee=user, status='pending').count()
-        
-        total_notifications = ShareNotification.objects.filter(user=user).count()
-        unread_notifications = ShareNotification.objects.filter(user=user, is_read=False).count()
+        counters = get_dashboard_counters(request.user)
         
         stats = {
-            'total_qr_shares': total_qr_shares,
-            'active_qr_shares': active_qr_shares,
-            'total_sessions': total_sessions,
-            'active_sessions': active_sessions,
-            'total_requests_sent': total_requests_sent,
-            'total_requests_received': total_requests_received,
-            'pending_requests': pending_requests,
-            'total_notifications': total_notifications,
-            'unread_notifications': unread_notifications,
+            'total_qr_shares': counters.qr_shares,
+            'active_qr_shares': counters.active_qr_shares,
+            'total_sessions': counters.sessions,
+            'active_sessions': counters.active_sessions,
+            'total_requests_sent': counters.requests_sent,
+            'total_requests_received': counters.requests_received,
+            'pending_requests': counters.pending_requests,
+            'total_notifications': counters.notifications,
+            'unread_notifications': counters.unread_notifications,
         }
         
         serializer = ShareStatsSerializer(stats)
@@ -428,7 +578,8 @@ class BulkShareView(APIView):
     
     @extend_schema(
         summary="Bulk share documents",
-        description="Share multiple documents with users"
+        description="Share multiple documents with users. The response reports the outcome of every "
+                    "(document, user) pair: shared, already_shared, user_not_found or document_not_found."
     )
     def post(self, request):
         serializer = BulkShareSerializer(data=request.data)
@@ -439,30 +590,14 @@ class BulkShareView(APIView):
             expires_at = serializer.validated_data.get('expires_at')
             message = serializer.validated_data.get('message', '')
             
-            documents = Document.objects.filter(
-                id__in=document_ids, 
-                owner=request.user
+            results = share_documents(
+                request.user, document_ids, target_users,
+                permission=permission, expires_at=expires_at, message=message
             )
-            
-            shared_count = 0
-            for document in documents:
-                for user_id in target_users:
-                    try:
-                        target_user = CustomUser.objects.get(id=user_id)
-                        DocumentShare.objects.create(
-                            document=document,
-                            shared_by=request.user,
-                            shared_with=target_user,
-                            permission=permission,
-                            expires_at=expires_at,
-                            message=message
-                        )
-                        shared_count += 1
-                    except CustomUser.DoesNotExist:
-                        continue
+            shared_count = sum(result['status'] == SHARED for result in results)
             
             # Log activity
-            UserActivity.objects.create(
+            UserActivity.objects.log(
                 user=request.user,
                 activity_type='bulk_share',
                 description=f'Bulk shared {shared_count} documents',
@@ -472,7 +607,8 @@ class BulkShareView(APIView):
             
             return Response({
                 'message': f'Successfully shared {shared_count} documents',
-                'shared_count': shared_count
+                'shared_count': shared_count,
+                'results': results
             })
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)